@@ -0,0 +1,140 @@
+"""
+Beban campuran untuk API yang sedang berjalan: banyak request /stats dan
+/history berat sekaligus, sambil mengukur latensi /relays dan /latest
+(request ringan yang tidak boleh ikut tertahan).
+
+Selama beban berjalan, script juga mencatat jumlah query aktif maksimum di
+PostgreSQL (pg_stat_activity), untuk melihat berapa query yang benar-benar
+berjalan paralel (pool psycopg2 lama: 10 koneksi, threadpool Starlette: 40).
+
+    python bench_concurrency.py [url] [jumlah_request_berat] [detik] [cpu|lock]
+    python bench_concurrency.py http://localhost:8000 60 20
+
+Mode cpu (default): request berat diulang selama `detik`. Agar benar-benar
+membaca tabel mentah, jalankan API dengan ROLLUP_QUERIES=0 RESPONSE_CACHE=0.
+Mode lock: script mengunci tabel sensor (ACCESS EXCLUSIVE) selama `detik`
+lalu mengirim request berat sekali masing-masing, jadi query lambat karena
+menunggu (seperti I/O lambat), bukan karena CPU; berapa yang bisa menunggu
+serentak di database menunjukkan batas konkurensi API.
+"""
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from config import DB
+
+HEAVY = [
+    "/stats/dht22?start=2020-01-01T00:00:00",
+    "/history/dht22?start=2020-01-01T00:00:00&bucket=1%20day",
+]
+LIGHT = ["/relays", "/latest/dht22"]
+
+
+def fetch(url):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=120) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = "error"
+    return status, time.perf_counter() - started
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def main():
+    base = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000"
+    heavy_count = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+    mode = sys.argv[4] if len(sys.argv) > 4 else "cpu"
+    stop = threading.Event()
+
+    # Query aktif maksimum di database (selain koneksi monitor ini)
+    peak = {"active": 0}
+
+    def monitor():
+        conn = psycopg2.connect(host=DB["host"], port=DB["port"], dbname=DB["dbname"],
+                                user=DB["user"], password=DB["password"])
+        conn.autocommit = True
+        cur = conn.cursor()
+        while not stop.is_set():
+            cur.execute("""
+                SELECT count(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND state = 'active' AND pid <> pg_backend_pid()
+                  AND backend_type = 'client backend'
+            """)
+            peak["active"] = max(peak["active"], cur.fetchone()[0])
+            time.sleep(0.05)
+        conn.close()
+
+    light = []
+
+    def light_loop():
+        i = 0
+        while not stop.is_set():
+            light.append(fetch(base + LIGHT[i % len(LIGHT)]))
+            i += 1
+            time.sleep(0.05)
+
+    watcher = threading.Thread(target=monitor, daemon=True)
+    watcher.start()
+    probes = [threading.Thread(target=light_loop, daemon=True) for _ in range(4)]
+    for t in probes:
+        t.start()
+
+    locker = None
+    if mode == "lock":
+        locker = psycopg2.connect(host=DB["host"], port=DB["port"], dbname=DB["dbname"],
+                                  user=DB["user"], password=DB["password"])
+        locker.cursor().execute("LOCK TABLE data_dht22, data_dht22_1m, data_dht22_1h, data_dht22_1d "
+                                "IN ACCESS EXCLUSIVE MODE")
+        threading.Timer(duration, locker.rollback).start()
+
+    started = time.perf_counter()
+    heavy = []
+    with ThreadPoolExecutor(max_workers=heavy_count) as pool:
+        # heavy_count request berat serentak, diulang sampai `duration` detik (mode lock: sekali)
+        def heavy_loop(i):
+            while True:
+                heavy.append(fetch(base + HEAVY[i % len(HEAVY)]))
+                if mode == "lock" or time.perf_counter() - started >= duration:
+                    break
+
+        list(pool.map(heavy_loop, range(heavy_count)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for t in probes:
+        t.join()
+
+    def summary(results):
+        ok = [s for status, s in results if status == 200]
+        failed = {}
+        for status, _ in results:
+            if status != 200:
+                failed[status] = failed.get(status, 0) + 1
+        p50, p95 = percentile(ok, 0.5), percentile(ok, 0.95)
+        return (f"{len(ok)} ok ({len(ok) / elapsed:.1f}/s), gagal {failed or 0}, "
+                f"p50 {p50 * 1000 if p50 else 0:.0f} ms, p95 {p95 * 1000 if p95 else 0:.0f} ms, "
+                f"maks {max(ok) * 1000 if ok else 0:.0f} ms")
+
+    if locker is not None:
+        locker.close()
+    print(f"{base}: {heavy_count} request berat serentak ({mode}) selama {elapsed:.1f} s")
+    print(f"  berat  : {summary(heavy)}")
+    print(f"  ringan : {summary(light)}")
+    print(f"  query aktif maksimum di PostgreSQL: {peak['active']}")
+
+
+if __name__ == "__main__":
+    main()
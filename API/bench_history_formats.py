@@ -0,0 +1,105 @@
+"""
+Bandingkan format response /history mode raw: json (list dict, lewat
+jsonable_encoder + JSONResponse seperti FastAPI) vs columnar vs binary.
+
+Untuk satu halaman data mentah (limit baris) script mengukur waktu
+fetch + encode dan ukuran payload setiap format, lalu memastikan isi
+columnar dan binary sama dengan json (timestamp dibulatkan ke milidetik,
+nilai binary float32).
+
+    python bench_history_formats.py [sensor] [limit]     # default: dht22 10000
+"""
+import json
+import struct
+import sys
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from database import get_conn, get_cursor, close_pool
+from columnar import epoch_select, columns_from_tuples, columnar_body, binary_body
+from routes.sensors import history_query
+from utils import validate_sensor
+
+REPEAT = 5
+
+
+def best(fn):
+    times = []
+    for _ in range(REPEAT):
+        t = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t)
+    return min(times), result
+
+
+def decode_binary(payload):
+    (size,) = struct.unpack_from("<I", payload)
+    header = json.loads(payload[4:4 + size])
+    base = 4 + size
+    data = {}
+    for col in header["columns"]:
+        dtype = {"f8": "<f8", "f4": "<f4", "u2": "<u2"}[col["dtype"]]
+        values = np.frombuffer(payload, dtype=dtype, count=header["length"], offset=base + col["offset"])
+        data[col["name"]] = [col["values"][v] for v in values] if "values" in col else values
+    return header, data
+
+
+def main():
+    sensor = sys.argv[1] if len(sys.argv) > 1 else "dht22"
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    table, columns = validate_sensor(sensor)
+    since = datetime.utcnow() - timedelta(days=3650)
+    meta = {"sensor": sensor, "start": since, "source": "raw", "limit": limit}
+
+    def fetch_json():
+        with get_cursor() as cur:
+            cur.execute(history_query(table, columns), (since, limit))
+            rows = cur.fetchall()
+        return JSONResponse(jsonable_encoder({**meta, "count": len(rows), "data": rows})).body
+
+    def fetch_tuples():
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(history_query(table, columns, select=epoch_select(columns)), (since, limit))
+                rows = cur.fetchall()
+            conn.rollback()
+        return columns_from_tuples(columns, rows)
+
+    results = {}
+    results["json"] = best(fetch_json)
+    results["columnar"] = best(lambda: columnar_body({**meta, "count": limit}, fetch_tuples()))
+    results["binary"] = best(lambda: binary_body({**meta, "count": limit}, fetch_tuples()))
+
+    print(f"{sensor}: {limit} baris mentah, terbaik dari {REPEAT}")
+    base_time, base_payload = results["json"]
+    for fmt, (seconds, payload) in results.items():
+        print(f"  {fmt:<9} {seconds * 1000:8.1f} ms  {len(payload) / 1024:9.1f} KiB"
+              f"  ({base_time / seconds:4.1f}x lebih cepat, {len(base_payload) / len(payload):4.1f}x lebih kecil)")
+
+    # Isi harus sama
+    rows = json.loads(base_payload)["data"]
+    epoch = datetime(1970, 1, 1)
+    expected_ts = [(datetime.fromisoformat(r["timestamp"]) - epoch) // timedelta(milliseconds=1) for r in rows]
+    columnar = json.loads(results["columnar"][1])["data"]
+    header, binary = decode_binary(results["binary"][1])
+    ok = columnar["timestamp"] == expected_ts and list(binary["timestamp"]) == expected_ts
+    for col in columns:
+        if col == "timestamp":
+            continue
+        expected = [r[col] for r in rows]
+        ok &= columnar[col] == expected
+        if col in ("id", "device_id"):
+            ok &= list(binary[col]) == expected
+        else:
+            got = binary[col]
+            want = np.array([np.nan if v is None else v for v in expected], dtype=np.float32)
+            ok &= bool(np.array_equal(got, want, equal_nan=True))
+    print("isi sama:", "OK" if ok else "BEDA")
+    close_pool()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
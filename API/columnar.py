@@ -0,0 +1,143 @@
+"""
+Format kolom untuk response /history (?format=columnar | binary).
+
+Format json biasa mengirim satu objek per titik, jadi setiap nama kolom
+diulang di setiap titik dan seluruh list dict dilewatkan ke
+jsonable_encoder FastAPI. Untuk grafik, data dikirim per kolom:
+
+- columnar: JSON {"timestamp": [...], "temperature": [...]}, timestamp
+  dalam epoch milidetik (langsung bisa dipakai `new Date(ms)`)
+- binary: array kolom yang di-pack (little-endian), dibaca di browser
+  dengan typed array tanpa parsing:
+
+      [uint32 panjang header][header JSON, dipadding spasi ke kelipatan 8][kolom...]
+
+  header berisi metadata response dan daftar kolom {name, dtype, offset}
+  dengan offset relatif terhadap awal bagian kolom (4 + panjang header),
+  setiap kolom dimulai di kelipatan 8 byte. dtype:
+    f8  float64 (timestamp epoch ms, id, sample_count)
+    f4  float32 (nilai sensor, null = NaN)
+    u2  uint16 kode untuk kolom teks; teksnya ada di "values" kolom itu
+
+Mode raw membaca baris sebagai tuple dengan timestamp sudah berupa epoch
+mikrodetik dari PostgreSQL (tanpa objek datetime/dict per baris).
+"""
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+FORMATS = ("json", "columnar", "binary")
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+TIME_KEYS = ("timestamp", "time_bucket")
+# Kolom bilangan bulat yang dikirim float64 (tepat sampai 2^53)
+INTEGER_KEYS = ("id", "sample_count")
+TEXT_KEYS = ("device_id",)
+
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+
+
+def epoch_select(columns):
+    """
+    Daftar SELECT kolom (urutan `columns`), timestamp sebagai epoch mikrodetik.
+    Alias bukan `timestamp`, supaya ORDER BY timestamp tetap memakai index.
+    """
+    return ", ".join(
+        "(extract(epoch from timestamp) * 1000000)::int8 AS timestamp_us" if col == "timestamp" else col
+        for col in columns
+    )
+
+
+def micros_to_datetime(micros):
+    """Epoch mikrodetik -> datetime UTC naive (untuk cursor next_after)"""
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+def _epoch_ms(value):
+    """datetime (naive = UTC) -> epoch milidetik"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MS
+
+
+def columns_from_tuples(keys, rows):
+    """Kolom dari baris tuple epoch_select (timestamp mikrodetik -> milidetik)"""
+    data = dict(zip(keys, map(list, zip(*rows)))) if rows else {key: [] for key in keys}
+    if "timestamp" in data:
+        data["timestamp"] = [us // 1000 for us in data["timestamp"]]
+    return data
+
+
+def columns_from_dicts(keys, rows):
+    """Kolom dari baris dict (hasil sampling/downsampling, maksimal beberapa ribu baris)"""
+    data = {}
+    for key in keys:
+        values = [row[key] for row in rows]
+        if key in TIME_KEYS:
+            values = [_epoch_ms(v) for v in values]
+        elif values and any(isinstance(v, Decimal) for v in values):
+            # AVG kolom integer menghasilkan numeric
+            values = [None if v is None else float(v) for v in values]
+        data[key] = values
+    return data
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipe {type(value).__name__} tidak bisa di-encode")
+
+
+def columnar_body(meta, data):
+    """Response format columnar: metadata + "data" berisi kolom"""
+    return json.dumps(
+        {**meta, "format": "columnar", "time_unit": "ms", "data": data},
+        separators=(",", ":"), default=_default
+    ).encode()
+
+
+def _dtype(key):
+    if key in TIME_KEYS or key in INTEGER_KEYS:
+        return "f8"
+    if key in TEXT_KEYS:
+        return "u2"
+    return "f4"
+
+
+def binary_body(meta, data):
+    """Response format binary (lihat docstring modul); butuh numpy"""
+    import numpy as np
+
+    columns = []
+    buffers = []
+    offset = 0
+    length = 0
+    for key, values in data.items():
+        length = len(values)
+        dtype = _dtype(key)
+        column = {"name": key, "dtype": dtype, "offset": offset}
+        if dtype == "u2":
+            codes = {}
+            array = np.array([codes.setdefault(v, len(codes)) for v in values], dtype="<u2")
+            column["values"] = list(codes)
+        else:
+            array = np.array(values, dtype="<" + dtype)
+        raw = array.tobytes()
+        raw += b"\0" * (-len(raw) % 8)
+        buffers.append(raw)
+        offset += len(raw)
+        columns.append(column)
+
+    header = json.dumps(
+        {**meta, "format": "binary", "time_unit": "ms", "length": length, "columns": columns},
+        separators=(",", ":"), default=_default
+    ).encode()
+    # 4 byte panjang + header harus berakhir di kelipatan 8
+    header += b" " * (-(4 + len(header)) % 8)
+    return b"".join([struct.pack("<I", len(header)), header, *buffers])
@@ -1,6 +1,11 @@
 import os
+import sys
 from dotenv import load_dotenv
 
+# Root repo di sys.path supaya modul bersama (shared/) bisa diimport,
+# sama seperti sensors.json yang dibaca dari root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
 # Load .env file
 load_dotenv()
 
@@ -12,6 +17,97 @@ DB = {
     "password": os.getenv("DB_PASSWORD", "postgres")
 }
 
+# Pool koneksi API. Route async (history, stats, latest, snapshot, relay) memakai
+# pool async psycopg 3; route sync lain dan thread background memakai pool psycopg2.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_ASYNC_POOL_MIN = int(os.getenv("DB_ASYNC_POOL_MIN", 2))
+DB_ASYNC_POOL_MAX = int(os.getenv("DB_ASYNC_POOL_MAX", 20))
+# Detik menunggu koneksi bebas dari pool async sebelum request dijawab 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Query berat (history/stats) serentak maksimum; sisa pool async selalu tersedia
+# untuk route ringan (relay, latest, snapshot)
+DB_HEAVY_QUERY_SLOTS = int(os.getenv("DB_HEAVY_QUERY_SLOTS", 16))
+# Batas waktu per statement (ms, 0 = tanpa batas): default pool async, dan untuk history/stats
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 5000))
+DB_HISTORY_STATEMENT_TIMEOUT = int(os.getenv("DB_HISTORY_STATEMENT_TIMEOUT", 15000))
+
+# Instrumentasi database (/admin/metrics/db): latensi per statement (fingerprint SQL)
+# dan log query lambat. Query >= DB_SLOW_QUERY_MS dicatat dengan peluang
+# DB_SLOW_QUERY_SAMPLE, plus EXPLAIN (paling sering sekali per fingerprint per DB_EXPLAIN_INTERVAL detik)
+DB_METRICS = os.getenv("DB_METRICS", "1") == "1"
+DB_METRICS_MAX_STATEMENTS = int(os.getenv("DB_METRICS_MAX_STATEMENTS", 200))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 500))
+DB_SLOW_QUERY_SAMPLE = float(os.getenv("DB_SLOW_QUERY_SAMPLE", 1.0))
+DB_SLOW_QUERY_LOG_SIZE = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", 50))
+DB_EXPLAIN_INTERVAL = float(os.getenv("DB_EXPLAIN_INTERVAL", 300))
+# /admin/metrics*: wajib header X-Metrics-Token bernilai ini; kosong = hanya dari localhost
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 API_TITLE = os.getenv("API_TITLE", "IoT Sensor API")
 API_VERSION = os.getenv("API_VERSION", "1.0")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+
+# Registry sensor bersama (dipakai juga oleh listener MQTT)
+SENSOR_REGISTRY = os.getenv(
+    "SENSOR_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sensors.json")
+)
+
+# Telegram notification dispatcher
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 1000))
+# Telegram: ~1 pesan/detik per chat, burst kecil diperbolehkan
+NOTIFY_RATE_PER_SEC = float(os.getenv("NOTIFY_RATE_PER_SEC", 1))
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", 3))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 4))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", 1))
+
+# Partisi waktu tabel data sensor: day | month
+PARTITION_INTERVAL = os.getenv("PARTITION_INTERVAL", "month")
+# Jumlah partisi yang dibuat di depan periode sekarang
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", 3))
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", 3600))
+# Partisi yang lewat retention_days (sensors.json): detach (diarsip) | drop (dihapus)
+RETENTION_MODE = os.getenv("RETENTION_MODE", "detach")
+
+# Rollup 1m/1h/1d: /history (sampling) dan /stats dibaca dari rollup, bukan tabel mentah.
+# Rollup diisi listener MQTT saat insert; matikan juga jika ROLLUP_ON_INGEST=0 di listener.
+ROLLUP_QUERIES = os.getenv("ROLLUP_QUERIES", "1") == "1"
+# Rollup per menit cukup untuk rentang pendek; rollup jam/hari ikut retention_days sensor
+ROLLUP_MINUTE_RETENTION_DAYS = int(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", 30))
+
+# Cache /latest di memori, diperbarui lewat LISTEN/NOTIFY dari listener MQTT.
+# Channel harus sama dengan LATEST_NOTIFY_CHANNEL listener; kosong = cache nonaktif
+LATEST_NOTIFY_CHANNEL = os.getenv("LATEST_NOTIFY_CHANNEL", "sensor_latest")
+LATEST_CACHE_RECONNECT = int(os.getenv("LATEST_CACHE_RECONNECT", 5))
+
+# /snapshot: bagian dari DB (relay, settings, stats 24h) di-cache sekian detik.
+# Perubahan lewat API langsung meng-invalidate; perubahan relay dari listener MQTT terlihat setelah TTL
+SNAPSHOT_CACHE_TTL = float(os.getenv("SNAPSHOT_CACHE_TTL", 5))
+
+# /history: start/end bebas. Mode raw dibaca per halaman (keyset after=<timestamp,id>)
+HISTORY_PAGE_LIMIT = int(os.getenv("HISTORY_PAGE_LIMIT", 1000))
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", 10000))
+# Batas jumlah bucket sampling per request (rentang / bucket)
+HISTORY_MAX_BUCKETS = int(os.getenv("HISTORY_MAX_BUCKETS", 5000))
+# /history?points=N (downsampling LTTB/min-max untuk grafik, butuh numpy)
+DOWNSAMPLE_MAX_POINTS = int(os.getenv("DOWNSAMPLE_MAX_POINTS", 5000))
+
+# Cache response /history dan /stats rentang preset (lihat response_cache.py)
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 512))
+# Umur maksimal bagian tertutup (data telat dari spool device terlihat setelah ini)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+# Umur bucket terbuka jika cache /latest (LISTEN/NOTIFY) belum siap
+RESPONSE_CACHE_OPEN_TTL = float(os.getenv("RESPONSE_CACHE_OPEN_TTL", 5))
+
+# /export: baris per batch server-side cursor (memori export tidak bergantung besar tabel)
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 5000))
+
+# Job export background (POST /exports, lihat export_jobs.py)
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", 2))
+# Job menunggu + berjalan maksimal; lebih dari ini POST /exports ditolak (429)
+EXPORT_JOB_MAX_PENDING = int(os.getenv("EXPORT_JOB_MAX_PENDING", 20))
+# Umur file hasil export di disk (dipakai ulang untuk permintaan yang sama)
+EXPORT_CACHE_TTL = int(os.getenv("EXPORT_CACHE_TTL", 3600))
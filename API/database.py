@@ -1,8 +1,51 @@
+import asyncio
+import time
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extensions import cursor as PlainCursor
 from psycopg2.extras import RealDictCursor
-from contextlib import contextmanager
-from config import DB
+from psycopg import AsyncCursor
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from contextlib import contextmanager, asynccontextmanager
+from config import (
+    DB, DB_ASYNC_POOL_MIN, DB_ASYNC_POOL_MAX, DB_POOL_TIMEOUT, DB_STATEMENT_TIMEOUT, DB_HEAVY_QUERY_SLOTS,
+)
+from db_metrics import db_metrics
+
+
+class _TimedCursorMixin:
+    """Catat latensi setiap execute ke db_metrics (named cursor tidak: waktunya ada di fetch)"""
+    def execute(self, query, vars=None):
+        if self.name:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        finally:
+            db_metrics.record_statement(query, vars, time.perf_counter() - started, self.rowcount, failed)
+
+class TimedCursor(_TimedCursorMixin, PlainCursor):
+    pass
+
+class TimedDictCursor(_TimedCursorMixin, RealDictCursor):
+    pass
+
+class TimedAsyncCursor(AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute(query, params, **kwargs)
+            failed = False
+            return result
+        finally:
+            db_metrics.record_statement(query, params, time.perf_counter() - started, self.rowcount, failed)
+
 
 # Connection pool - reuse koneksi untuk performa lebih baik
 _connection_pool = None
@@ -18,7 +61,8 @@ def init_pool(minconn=2, maxconn=10):
             port=DB["port"],
             dbname=DB["dbname"],
             user=DB["user"],
-            password=DB["password"]
+            password=DB["password"],
+            cursor_factory=TimedCursor
         )
     return _connection_pool
 
@@ -33,7 +77,13 @@ def get_pool():
 def get_conn():
     """Context manager untuk koneksi database dengan auto-cleanup"""
     pool = get_pool()
-    conn = pool.getconn()
+    started = time.perf_counter()
+    try:
+        conn = pool.getconn()
+    except psycopg2.pool.PoolError:
+        db_metrics.record_exhausted("sync")
+        raise
+    db_metrics.record_checkout("sync", time.perf_counter() - started)
     try:
         yield conn
     finally:
@@ -43,7 +93,7 @@ def get_conn():
 def get_cursor():
     """Context manager untuk cursor dengan RealDictCursor"""
     with get_conn() as conn:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur = conn.cursor(cursor_factory=TimedDictCursor)
         try:
             yield cur
             conn.commit()
@@ -60,6 +110,134 @@ def close_pool():
         _connection_pool.closeall()
         _connection_pool = None
 
+# Pool async (psycopg 3) untuk route async def; query dibatalkan di server
+# jika task request dibatalkan (client disconnect, lihat utils.cancel_on_disconnect)
+_async_pool = None
+# Kejadian di route async: query dibatalkan karena client putus, statement timeout, pool penuh
+_async_events = {"cancelled": 0, "statement_timeouts": 0, "pool_timeouts": 0}
+_heavy_slots = asyncio.Semaphore(DB_HEAVY_QUERY_SLOTS)
+_heavy = {"running": 0, "waiting": 0}
+
+async def init_async_pool(min_size=DB_ASYNC_POOL_MIN, max_size=DB_ASYNC_POOL_MAX):
+    """Buka pool async; setiap koneksi memakai statement_timeout DB_STATEMENT_TIMEOUT"""
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = AsyncConnectionPool(
+            make_conninfo(
+                host=DB["host"], port=DB["port"], dbname=DB["dbname"],
+                user=DB["user"], password=DB["password"], application_name="iot-api",
+                options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+            ),
+            min_size=min_size,
+            max_size=max_size,
+            timeout=DB_POOL_TIMEOUT,
+            kwargs={"row_factory": dict_row, "cursor_factory": TimedAsyncCursor},
+            open=False,
+        )
+        await _async_pool.open()
+    return _async_pool
+
+def get_async_pool():
+    if _async_pool is None:
+        raise RuntimeError("Pool async belum dibuka (init_async_pool)")
+    return _async_pool
+
+@asynccontextmanager
+async def get_async_cursor(timeout=None, row_factory=None, heavy=False):
+    """
+    Context manager cursor async (baris dict, atau row_factory lain mis.
+    psycopg.rows.tuple_row). timeout: statement_timeout (ms) khusus untuk
+    transaksi ini, menggantikan default pool. heavy: query berat, menunggu
+    slot DB_HEAVY_QUERY_SLOTS dulu sebelum mengambil koneksi.
+    """
+    if heavy:
+        _heavy["waiting"] += 1
+        started = time.perf_counter()
+        try:
+            await _heavy_slots.acquire()
+        finally:
+            _heavy["waiting"] -= 1
+        db_metrics.record_checkout("heavy_slots", time.perf_counter() - started)
+        _heavy["running"] += 1
+    try:
+        async with _pool_cursor(timeout, row_factory) as cur:
+            yield cur
+    finally:
+        if heavy:
+            _heavy["running"] -= 1
+            _heavy_slots.release()
+
+@asynccontextmanager
+async def _pool_cursor(timeout, row_factory):
+    pool = get_async_pool()
+    started = time.perf_counter()
+    try:
+        conn = await pool.getconn()
+    except PoolTimeout:
+        db_metrics.record_exhausted("async")
+        raise
+    db_metrics.record_checkout("async", time.perf_counter() - started)
+    try:
+        cur = conn.cursor(row_factory=row_factory) if row_factory else conn.cursor()
+        try:
+            if timeout is not None:
+                await cur.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(timeout)),))
+            yield cur
+            await conn.commit()
+        except BaseException:
+            # Termasuk CancelledError; koneksi yang rusak setelah cancel dibuang pool
+            try:
+                await conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            await cur.close()
+    finally:
+        await pool.putconn(conn)
+
+def record_async_event(event):
+    _async_events[event] += 1
+
+def pool_stats():
+    """Gauge pool psycopg2 (sync) dan psycopg 3 (async) untuk /admin/metrics"""
+    sync = None
+    if _connection_pool is not None:
+        # Atribut internal AbstractConnectionPool: _used (dipinjam), _pool (idle)
+        sync = {
+            "min_size": _connection_pool.minconn,
+            "max_size": _connection_pool.maxconn,
+            "in_use": len(_connection_pool._used),
+            "idle": len(_connection_pool._pool),
+        }
+    return {"sync": sync, "async": async_pool_stats()}
+
+def async_pool_stats():
+    """Statistik pool async (psycopg_pool) dan kejadian cancel/timeout untuk /admin/metrics"""
+    if _async_pool is None:
+        return None
+    counters = _async_pool.get_stats()
+    return {
+        "size": counters.get("pool_size", 0),
+        "in_use": counters.get("pool_size", 0) - counters.get("pool_available", 0),
+        "idle": counters.get("pool_available", 0),
+        "waiting": counters.get("requests_waiting", 0),
+        "min_size": _async_pool.min_size,
+        "max_size": _async_pool.max_size,
+        "requests": counters.get("requests_num", 0),
+        "requests_queued": counters.get("requests_queued", 0),
+        "heavy_slots": DB_HEAVY_QUERY_SLOTS,
+        "heavy_running": _heavy["running"],
+        "heavy_waiting": _heavy["waiting"],
+        **_async_events,
+    }
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
 def check_database_exists():
     """Cek apakah database target sudah dibuat"""
     try:
@@ -0,0 +1,288 @@
+"""
+Instrumentasi database untuk /admin/metrics dan /admin/metrics/db.
+
+- checkout: lama menunggu koneksi dari pool (histogram per pool: sync
+  psycopg2, async psycopg 3, dan antrean slot query berat) serta kejadian
+  pool habis (PoolError psycopg2 / PoolTimeout psycopg_pool)
+- statement: latensi per fingerprint SQL. Query di routes/sensors.py dan
+  rollups.py dibangun dengan f-string; fingerprint mengganti literal
+  string/angka dengan ? dan merapikan spasi, jadi satu bentuk query (per
+  tabel) = satu baris metrik, berapapun interval/bucket yang dipakai
+- log query lambat: statement >= DB_SLOW_QUERY_MS (disampling
+  DB_SLOW_QUERY_SAMPLE) disimpan di ring buffer beserta rencana EXPLAIN.
+  Yang disimpan hanya teks ter-fingerprint dan tipe parameternya; nilai
+  parameter (bisa berisi bot_token/chat_id Telegram, password) tidak.
+  EXPLAIN (tanpa ANALYZE, query tidak dijalankan ulang) dikerjakan thread
+  sendiri dengan koneksi di luar pool, jadi request tidak ikut menunggu;
+  paling sering sekali per fingerprint per DB_EXPLAIN_INTERVAL, selain itu
+  plan terakhir dipakai ulang.
+
+Pencatatan dipanggil cursor di database.py (TimedCursor, TimedAsyncCursor)
+dan get_conn / get_async_cursor.
+"""
+import hashlib
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+import psycopg2
+from config import (
+    DB, DB_METRICS, DB_METRICS_MAX_STATEMENTS, DB_SLOW_QUERY_MS, DB_SLOW_QUERY_SAMPLE, DB_SLOW_QUERY_LOG_SIZE,
+    DB_EXPLAIN_INTERVAL,
+)
+
+# Batas atas bucket histogram waktu tunggu checkout (ms); bucket terakhir tanpa batas
+CHECKOUT_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+# Jumlah latensi terakhir per fingerprint untuk p50/p95
+_LATENCY_SAMPLES = 200
+# Statement tanpa baris sendiri setelah DB_METRICS_MAX_STATEMENTS fingerprint
+_OTHER = "(lainnya)"
+
+_NORMALIZE = [
+    (re.compile(r"--[^\n]*"), " "),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\$\d+"), "?"),
+    (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """(id, teks ternormalisasi) dari teks query"""
+    text = sql
+    for pattern, replacement in _NORMALIZE:
+        text = pattern.sub(replacement, text)
+    text = text.strip().rstrip(";").strip()
+    return hashlib.sha1(text.encode()).hexdigest()[:12], text
+
+
+def _params_shape(params):
+    """Tipe parameter saja, mis. ['datetime', 'str']; nilainya tidak pernah disimpan"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [type(value).__name__ for value in params]
+    return type(params).__name__
+
+
+def _percentile(ordered, p):
+    return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000, 3)
+
+
+class DbMetrics:
+    def __init__(self, enabled=DB_METRICS, slow_ms=DB_SLOW_QUERY_MS, sample=DB_SLOW_QUERY_SAMPLE,
+                 log_size=DB_SLOW_QUERY_LOG_SIZE, explain_interval=DB_EXPLAIN_INTERVAL,
+                 max_statements=DB_METRICS_MAX_STATEMENTS):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.sample = sample
+        self.explain_interval = explain_interval
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        # pool -> {"count", "total", "max", "buckets"} ; pool -> jumlah pool habis
+        self._checkout = {}
+        self._exhausted = {}
+        # fingerprint id -> metrik statement
+        self._statements = {}
+        self._slow = deque(maxlen=log_size)
+        # fingerprint id -> (monotonic, plan)
+        self._plans = {}
+        self._explain_queue = queue.Queue(maxsize=20)
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+        self._stats = {"statements": 0, "errors": 0, "slow": 0, "slow_logged": 0,
+                       "explains": 0, "explain_errors": 0, "explain_dropped": 0}
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._explain_loop, name="db-explain", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._explain_queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def record_checkout(self, pool, seconds):
+        if not self.enabled:
+            return
+        ms = seconds * 1000
+        bucket = next((i for i, upper in enumerate(CHECKOUT_BUCKETS_MS) if ms <= upper), len(CHECKOUT_BUCKETS_MS))
+        with self._lock:
+            entry = self._checkout.get(pool)
+            if entry is None:
+                entry = self._checkout[pool] = {
+                    "count": 0, "total": 0.0, "max": 0.0, "buckets": [0] * (len(CHECKOUT_BUCKETS_MS) + 1)
+                }
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["buckets"][bucket] += 1
+
+    def record_exhausted(self, pool):
+        with self._lock:
+            self._exhausted[pool] = self._exhausted.get(pool, 0) + 1
+
+    def record_statement(self, sql, params, seconds, rows=None, failed=False):
+        """Satu statement selesai (atau gagal) dalam `seconds` detik"""
+        if not self.enabled:
+            return
+        if isinstance(sql, bytes):
+            sql = sql.decode(errors="replace")
+        elif not isinstance(sql, str):
+            sql = str(sql)
+        fp, text = fingerprint(sql)
+        with self._lock:
+            self._stats["statements"] += 1
+            if failed:
+                self._stats["errors"] += 1
+            entry = self._statements.get(fp)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    fp, text = _OTHER, _OTHER
+                    entry = self._statements.get(fp)
+                if entry is None:
+                    entry = self._statements[fp] = {
+                        "query": text, "calls": 0, "errors": 0, "total": 0.0, "max": 0.0, "rows": 0,
+                        "samples": deque(maxlen=_LATENCY_SAMPLES),
+                    }
+            entry["calls"] += 1
+            entry["errors"] += failed
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["rows"] += max(rows or 0, 0)
+            entry["samples"].append(seconds)
+
+            if seconds * 1000 < self.slow_ms:
+                return
+            self._stats["slow"] += 1
+            if random.random() >= self.sample:
+                return
+            self._stats["slow_logged"] += 1
+            plan = self._plans.get(fp)
+            record = {
+                "at": datetime.utcnow(),
+                "fingerprint": fp,
+                "query": text,
+                "params": _params_shape(params),
+                "ms": round(seconds * 1000, 1),
+                "rows": rows,
+                "failed": failed,
+                "plan": plan[1] if plan else None,
+            }
+            self._slow.append(record)
+            if fp == _OTHER or (plan and time.monotonic() - plan[0] < self.explain_interval):
+                return
+            # Tandai dulu supaya query lambat yang sama tidak antre EXPLAIN berkali-kali
+            self._plans[fp] = (time.monotonic(), plan[1] if plan else None)
+        try:
+            self._explain_queue.put_nowait((fp, sql, params, record))
+        except queue.Full:
+            with self._lock:
+                self._stats["explain_dropped"] += 1
+
+    def _explain_conn(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(
+                host=DB["host"], port=DB["port"], dbname=DB["dbname"],
+                user=DB["user"], password=DB["password"], application_name="iot-api-explain",
+                options="-c statement_timeout=5000"
+            )
+            self._conn.autocommit = True
+        return self._conn
+
+    def _explain_loop(self):
+        while not self._stop.is_set():
+            item = self._explain_queue.get()
+            if item is None:
+                break
+            fp, sql, params, record = item
+            try:
+                with self._explain_conn().cursor() as cur:
+                    cur.execute("EXPLAIN " + sql, params)
+                    plan = [row[0] for row in cur.fetchall()]
+                with self._lock:
+                    self._plans[fp] = (time.monotonic(), plan)
+                    record["plan"] = plan
+                    self._stats["explains"] += 1
+            except Exception as e:
+                with self._lock:
+                    record["plan_error"] = str(e).strip()
+                    self._stats["explain_errors"] += 1
+                if self._conn is not None and self._conn.closed:
+                    self._conn = None
+
+    def _checkout_view(self):
+        labels = [f"<={upper}ms" for upper in CHECKOUT_BUCKETS_MS] + [f">{CHECKOUT_BUCKETS_MS[-1]}ms"]
+        return {
+            pool: {
+                "count": entry["count"],
+                "mean_ms": round(entry["total"] / entry["count"] * 1000, 3) if entry["count"] else None,
+                "max_ms": round(entry["max"] * 1000, 3),
+                "exhausted": self._exhausted.get(pool, 0),
+                "histogram": dict(zip(labels, entry["buckets"])),
+            }
+            for pool, entry in self._checkout.items()
+        } | {
+            pool: {"count": 0, "exhausted": count}
+            for pool, count in self._exhausted.items() if pool not in self._checkout
+        }
+
+    def _statement_view(self, fp, entry, query_chars=None):
+        ordered = sorted(entry["samples"])
+        query = entry["query"]
+        return {
+            "fingerprint": fp,
+            "query": query if query_chars is None or len(query) <= query_chars else query[:query_chars] + "...",
+            "calls": entry["calls"],
+            "errors": entry["errors"],
+            "total_ms": round(entry["total"] * 1000, 1),
+            "mean_ms": round(entry["total"] / entry["calls"] * 1000, 3),
+            "p50_ms": _percentile(ordered, 0.5),
+            "p95_ms": _percentile(ordered, 0.95),
+            "max_ms": round(entry["max"] * 1000, 3),
+            "rows": entry["rows"],
+        }
+
+    def statements(self, limit=50, order="total", query_chars=None):
+        """Statement diurutkan menurut total | mean | max | calls (terbesar dulu)"""
+        key = {"total": "total_ms", "mean": "mean_ms", "max": "max_ms", "calls": "calls"}[order]
+        with self._lock:
+            views = [self._statement_view(fp, entry, query_chars) for fp, entry in self._statements.items()]
+        return sorted(views, key=lambda v: v[key], reverse=True)[:limit]
+
+    def slow_queries(self, limit=50):
+        """Log query lambat, terbaru dulu"""
+        with self._lock:
+            return [dict(record) for record in reversed(self._slow)][:limit]
+
+    def stats(self):
+        """Ringkasan untuk /admin/metrics (detail: /admin/metrics/db)"""
+        with self._lock:
+            summary = {
+                "enabled": self.enabled,
+                "slow_query_ms": self.slow_ms,
+                **self._stats,
+                "fingerprints": len(self._statements),
+                "checkout": self._checkout_view(),
+            }
+        summary["top_statements"] = self.statements(limit=5, query_chars=160)
+        return summary
+
+
+db_metrics = DbMetrics()
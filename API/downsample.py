@@ -0,0 +1,194 @@
+"""
+Downsampling history ke N titik untuk grafik (/history?points=N).
+
+AVG per interval meratakan lonjakan singkat (spike gas 2 detik hilang di
+bucket 4 jam). Di sini setiap field dipilih titik-titiknya dengan:
+
+- lttb: Largest-Triangle-Three-Buckets, memilih titik yang paling
+  mempertahankan bentuk garis (puncak dan lembah tetap ada)
+- minmax: titik minimum dan maksimum setiap bucket
+
+Baris yang terpilih untuk field mana pun dikirim utuh (semua field),
+sehingga grafik tetap memakai satu sumbu waktu. Dua titik ujung dipesan
+dulu, sisa budget dibagi rata antar field, jadi jumlah baris hasil <= N
+(dicek verify_downsample.py).
+
+Sumber data: baris mentah jika satu titik hasil mewakili < 2 menit data,
+selain itu rollup 1 menit (min dan max per menit menjadi dua titik, jadi
+puncak tetap terbawa walau jendelanya berminggu-minggu). Bagian jendela
+sebelum horizon rollup 1m (ROLLUP_MINUTE_RETENTION_DAYS) diambil dari
+rollup 1 jam dengan cara yang sama, dua titik per jam.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from rollups import minute_horizon, floor_bucket
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Lebar data per titik hasil mulai dari mana rollup 1 menit dipakai
+ROLLUP_MIN_SPAN = timedelta(minutes=2)
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(x, y, n):
+    """Index n titik LTTB dari deret (x, y); titik pertama dan terakhir selalu ikut"""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    # n-2 bucket di antara titik pertama dan terakhir
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    selected = np.empty(n, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < n - 1 else size
+        cx, cy = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        # Luas segitiga (titik terpilih sebelumnya, kandidat, rata-rata bucket berikutnya)
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, buckets):
+    """Index minimum dan maksimum setiap bucket (jumlah baris sama per bucket); NaN diabaikan"""
+    size = len(y)
+    if size <= 2 * buckets:
+        return np.arange(size)
+    bucket = np.arange(size) * buckets // size
+    first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    last = np.r_[first[1:] - 1, size - 1]
+    nan = np.isnan(y)
+    by_min = np.lexsort((np.where(nan, np.inf, y), bucket))
+    by_max = np.lexsort((np.where(nan, -np.inf, y), bucket))
+    return np.unique(np.r_[0, by_min[first], by_max[last], size - 1])
+
+
+def select_indices(x, values, points, method="lttb"):
+    """
+    Gabungan index terpilih semua field (urut), maksimal `points` index.
+    values: array (baris, field). Titik pertama dan terakhir dipesan dulu,
+    sisanya dibagi rata antar field.
+    """
+    size, fields = values.shape
+    if size <= points:
+        return np.arange(size)
+    budget = (points - 2) // max(fields, 1)
+    chosen = [np.array([0, size - 1])]
+    for col in range(fields):
+        y = values[:, col]
+        valid = np.flatnonzero(~np.isnan(y))
+        if len(valid) == 0 or budget < 1:
+            continue
+        if method == "minmax":
+            # minmax_indices: 2 per bucket + titik pertama/terakhir field ini
+            buckets = (budget - 2) // 2
+            if buckets < 1:
+                picked = np.linspace(0, len(valid) - 1, min(budget, len(valid))).astype(np.int64)
+            else:
+                picked = minmax_indices(y[valid], buckets)
+        elif budget < 3:
+            picked = np.linspace(0, len(valid) - 1, min(budget, len(valid))).astype(np.int64)
+        else:
+            picked = lttb_indices(x[valid], y[valid], budget)
+        chosen.append(valid[picked])
+    selected = np.unique(np.concatenate(chosen))
+    if len(selected) > points:
+        # Tidak terjadi dengan budget di atas; jaga-jaga, tetap ambil ujung-ujungnya
+        selected = selected[np.linspace(0, len(selected) - 1, points).astype(np.int64)]
+    return selected
+
+
+def use_rollup(span, points):
+    return span / points >= ROLLUP_MIN_SPAN
+
+
+def raw_series_query(table, fields, device_sql="", until=False):
+    """(epoch, field...) baris mentah urut waktu; parameter: since, [until], device"""
+    return f"""
+        SELECT extract(epoch from timestamp)::float8, {", ".join(fields)}
+        FROM {table}
+        WHERE timestamp >= %s{" AND timestamp < %s" if until else ""}{device_sql}
+        ORDER BY timestamp ASC, id ASC;
+    """
+
+
+def rollup_series_query(table, fields, device_sql="", until=False, hourly=False):
+    """
+    (epoch, min field..., max field...) per menit dari rollup 1m; parameter: since, [until], device.
+    hourly: bucket sebelum `split` dari rollup 1h; parameter: since, split, [until], device, split, [until], device
+    """
+    until_sql = " AND bucket < %s" if until else ""
+    select = f"""SELECT extract(epoch from bucket)::float8,
+            {", ".join(f"MIN({f}_min)" for f in fields)},
+            {", ".join(f"MAX({f}_max)" for f in fields)}"""
+    if not hourly:
+        return f"""
+        {select}
+        FROM {table}_1m
+        WHERE bucket >= date_trunc('minute', %s::timestamp){until_sql}{device_sql}
+        GROUP BY bucket
+        ORDER BY bucket ASC;
+    """
+    return f"""
+        {select}
+        FROM {table}_1h
+        WHERE bucket >= date_trunc('hour', %s::timestamp) AND bucket < %s{until_sql}{device_sql}
+        GROUP BY bucket
+        UNION ALL
+        {select}
+        FROM {table}_1m
+        WHERE bucket >= %s{until_sql}{device_sql}
+        GROUP BY bucket
+        ORDER BY 1 ASC;
+    """
+
+
+def series_query(table, fields, since, until, device_sql, device_params, points, rollup=True):
+    """
+    Query jendela [since, until) untuk downsampling: (sql, params, from_rollup).
+    Baris hasilnya (tuple) diteruskan ke downsample_rows.
+    """
+    span = (until or datetime.utcnow()) - since
+    from_rollup = rollup and use_rollup(span, points)
+    tail = (*([until] if until else []), *device_params)
+    if not from_rollup:
+        return raw_series_query(table, fields, device_sql, until is not None), (since, *tail), False
+    horizon = minute_horizon()
+    if horizon is None or since >= horizon:
+        return rollup_series_query(table, fields, device_sql, until is not None), (since, *tail), True
+    # Bucket 1m sebelum horizon sudah dipangkas: sampai jam penuh berikutnya dari rollup 1h
+    split = floor_bucket(horizon, timedelta(hours=1))
+    if split < horizon:
+        split += timedelta(hours=1)
+    return (rollup_series_query(table, fields, device_sql, until is not None, hourly=True),
+            (since, split, *tail, split, *tail), True)
+
+
+def downsample_rows(fetched, fields, from_rollup, points, method="lttb"):
+    """
+    Kecilkan baris hasil series_query ke <= points baris (CPU saja, tanpa DB).
+    Return (rows, source, total_points).
+    """
+    data = np.array(fetched, dtype=np.float64).reshape(-1, 1 + (2 if from_rollup else 1) * len(fields))
+
+    x = data[:, 0]
+    if from_rollup:
+        # Setiap menit jadi dua titik: semua field minimum, lalu semua field maksimum
+        k = len(fields)
+        x = np.repeat(x, 2)
+        values = np.stack([data[:, 1:1 + k], data[:, 1 + k:]], axis=1).reshape(-1, k)
+    else:
+        values = data[:, 1:]
+
+    picked = select_indices(x, values, points, method)
+    key = "time_bucket" if from_rollup else "timestamp"
+    out = values[picked]
+    out = np.where(np.isnan(out), None, out).tolist() if len(out) else []
+    rows = [
+        {key: _EPOCH + timedelta(seconds=t), **dict(zip(fields, row))}
+        for t, row in zip(x[picked].tolist(), out)
+    ]
+    return rows, "rollup_1m" if from_rollup else "raw", len(x)
@@ -0,0 +1,228 @@
+"""
+Export data sensor dengan memori konstan (/export/{sensor}).
+
+Baris dibaca lewat server-side cursor (named cursor psycopg2) per
+EXPORT_BATCH_ROWS baris, jadi besar tabel tidak memengaruhi RSS:
+
+- csv / ndjson: setiap batch langsung dikirim sebagai satu chunk response,
+  byte pertama keluar begitu batch pertama terbaca
+- xlsx: openpyxl write-only (baris ditulis ke file sementara, bukan objek
+  cell di memori), lalu file xlsx dikirim per chunk. Format zip xlsx baru
+  bisa dikirim setelah workbook selesai ditulis.
+
+run_job() menulis export beberapa sensor sekaligus ke file (satu sheet
+per sensor) dan dijalankan di process pool oleh export_jobs.py; modul ini
+sengaja hanya bergantung pada config supaya murah di-import proses worker.
+"""
+import csv
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+import zipfile
+from config import EXPORT_BATCH_ROWS
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# format -> (media type, ekstensi file)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "xlsx": (XLSX_MEDIA_TYPE, "xlsx"),
+}
+
+# openpyxl opsional: dicek sekali saat import, diimport saat workbook ditulis
+XLSX_AVAILABLE = importlib.util.find_spec("openpyxl") is not None
+
+# Warna header sama dengan export Excel lama
+HEADER_COLOR = "0D9488"
+
+
+def export_query(table, columns, device_sql="", start=False, end=False, order="desc"):
+    """SELECT kolom terpilih; parameter: [start], [end], device"""
+    where = ("" if not start else " AND timestamp >= %s") + ("" if not end else " AND timestamp < %s")
+    return f"""
+        SELECT {", ".join(columns)} FROM {table}
+        WHERE TRUE{where}{device_sql}
+        ORDER BY timestamp {"ASC" if order == "asc" else "DESC"}, id {"ASC" if order == "asc" else "DESC"}
+    """
+
+
+def iter_batches(conn, sql, params, batch=EXPORT_BATCH_ROWS):
+    """Batch baris (tuple) dari server-side cursor; transaksi di-rollback setelah selesai/berhenti"""
+    try:
+        with conn.cursor(name=f"export_{uuid.uuid4().hex[:12]}") as cur:
+            cur.itersize = batch
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                yield rows
+    finally:
+        conn.rollback()
+
+
+def _text(value):
+    """Timestamp ditulis seperti export Excel lama"""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+def csv_chunks(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows([[_text(v) for v in row] for row in rows])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(batches, columns):
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=lambda v: v.isoformat()) + "\n" for row in rows
+        ).encode()
+
+
+def xlsx_sheet(wb, title, columns, batches):
+    """Tambah satu sheet write-only ke workbook wb (Workbook(write_only=True))"""
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+
+    ws = wb.create_sheet(title=title[:31])
+    # Lebar kolom harus diset sebelum baris pertama ditulis (write-only)
+    for col_idx, col_name in enumerate(columns, 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = max(len(col_name) + 5, 15)
+    header = []
+    for col_name in columns:
+        cell = WriteOnlyCell(ws, value=col_name.upper())
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color=HEADER_COLOR, end_color=HEADER_COLOR, fill_type="solid")
+        cell.alignment = Alignment(horizontal="center")
+        header.append(cell)
+    ws.append(header)
+    for rows in batches:
+        for row in rows:
+            ws.append([_text(v) for v in row])
+    return ws
+
+
+def write_xlsx(path, sheets):
+    """Tulis workbook write-only ke path; sheets: iterable (judul, kolom, batches)"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for title, columns, batches in sheets:
+        xlsx_sheet(wb, title, columns, batches)
+    wb.save(path)
+
+
+def _file_chunks(path, chunk=1024 * 1024):
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk)
+            if not data:
+                break
+            yield data
+
+
+def stream_export(fmt, title, columns, sql, params, connect):
+    """
+    Generator isi file export. connect: context manager yang memberi
+    koneksi psycopg2 (database.get_conn); koneksi dipegang selama baris
+    dibaca, untuk xlsx dilepas sebelum file dikirim.
+    """
+    if fmt == "xlsx":
+        fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="export_")
+        os.close(fd)
+        try:
+            with connect() as conn:
+                write_xlsx(path, [(title, columns, iter_batches(conn, sql, params))])
+            yield from _file_chunks(path)
+        finally:
+            os.unlink(path)
+        return
+
+    chunks = csv_chunks if fmt == "csv" else ndjson_chunks
+    with connect() as conn:
+        yield from chunks(iter_batches(conn, sql, params), columns)
+
+
+def _write_progress(path, **progress):
+    """Progress job untuk proses API (ditulis atomik: file sementara lalu rename)"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(progress, f, default=str)
+    os.replace(tmp, path)
+
+
+def run_job(fmt, path, progress_path, db, sheets):
+    """
+    Jalankan satu job export di proses worker. sheets: list dict
+    {sensor, title, columns, sql, params, total}. Hasil ditulis ke path
+    lewat file sementara, jadi file di path selalu lengkap. Return ukuran file.
+    """
+    import psycopg2
+
+    written = {"rows": 0, "sensor": None}
+    total = sum(sheet["total"] or 0 for sheet in sheets)
+    last = [0.0]
+
+    def report(force=False):
+        if force or time.monotonic() - last[0] >= 0.5:
+            last[0] = time.monotonic()
+            _write_progress(progress_path, rows=written["rows"], total_rows=total, sensor=written["sensor"])
+
+    def counted(conn, sheet):
+        written["sensor"] = sheet["sensor"]
+        for rows in iter_batches(conn, sheet["sql"], sheet["params"]):
+            written["rows"] += len(rows)
+            report()
+            yield rows
+
+    tmp = f"{path}.part"
+    conn = psycopg2.connect(
+        host=db["host"], port=db["port"], dbname=db["dbname"],
+        user=db["user"], password=db["password"], application_name="export-job"
+    )
+    try:
+        report(force=True)
+        if fmt == "xlsx":
+            write_xlsx(tmp, ((s["title"], s["columns"], counted(conn, s)) for s in sheets))
+        elif fmt == "ndjson":
+            with open(tmp, "wb") as f:
+                for sheet in sheets:
+                    for rows in counted(conn, sheet):
+                        f.write("".join(
+                            json.dumps({"sensor": sheet["sensor"], **dict(zip(sheet["columns"], row))},
+                                       default=lambda v: v.isoformat()) + "\n"
+                            for row in rows
+                        ).encode())
+        elif len(sheets) == 1:
+            with open(tmp, "wb") as f:
+                for chunk in csv_chunks(counted(conn, sheets[0]), sheets[0]["columns"]):
+                    f.write(chunk)
+        else:
+            # csv beberapa sensor: satu file csv per sensor dalam zip
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+                for sheet in sheets:
+                    with zf.open(f"{sheet['sensor']}.csv", "w") as f:
+                        for chunk in csv_chunks(counted(conn, sheet), sheet["columns"]):
+                            f.write(chunk)
+        os.replace(tmp, path)
+        report(force=True)
+        return os.path.getsize(path)
+    finally:
+        conn.close()
+        if os.path.exists(tmp):
+            os.unlink(tmp)
@@ -0,0 +1,203 @@
+"""
+Job export di background: POST /exports -> GET /exports/{id} -> download.
+
+Export besar (banyak sensor, rentang panjang) tidak lagi berjalan di
+thread request. Job dijalankan export.run_job di ProcessPoolExecutor
+(EXPORT_JOB_WORKERS proses, koneksi database sendiri per job) dan hasilnya
+disimpan di EXPORT_DIR dengan nama dari hash permintaan, jadi permintaan
+yang sama (sensor, rentang, format, device) memakai file yang sudah ada
+selama umurnya < EXPORT_CACHE_TTL, juga setelah API restart. Permintaan
+yang sama saat job masih berjalan mendapat job yang sama.
+
+Progress ditulis worker ke <hash>.progress (jumlah baris ditulis / total
+dari rollup) dan dibaca saat status job diminta.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from config import DB, EXPORT_DIR, EXPORT_JOB_WORKERS, EXPORT_JOB_MAX_PENDING, EXPORT_CACHE_TTL
+from export import run_job
+
+
+class ExportJobs:
+    def __init__(self, directory=EXPORT_DIR, workers=EXPORT_JOB_WORKERS,
+                 max_pending=EXPORT_JOB_MAX_PENDING, ttl=EXPORT_CACHE_TTL):
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        # id -> job ; hash permintaan -> id job terbaru
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._stats = {"submitted": 0, "reused": 0, "completed": 0, "failed": 0, "rejected": 0, "expired_files": 0}
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # spawn: proses API punya banyak thread (pool DB, LISTEN, notifier), fork tidak aman
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _paths(self, key, extension):
+        base = os.path.join(self.directory, key)
+        return f"{base}.{extension}", f"{base}.progress"
+
+    def submit(self, request, extension, sheets):
+        """
+        Buat job (atau pakai job/file yang sama) untuk permintaan `request`
+        (dict yang bisa di-JSON). Return job, atau None jika antrean penuh.
+        """
+        key = hashlib.sha1(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()[:24]
+        path, progress_path = self._paths(key, extension)
+
+        with self._lock:
+            self._expire()
+            self._stats["submitted"] += 1
+            job = self._jobs.get(self._by_key.get(key))
+            if job and (job["status"] in ("queued", "running") or (job["status"] == "done" and os.path.exists(path))):
+                self._stats["reused"] += 1
+                return job
+
+            job = {
+                "id": uuid.uuid4().hex[:16],
+                "key": key,
+                "status": "queued",
+                "request": request,
+                "path": path,
+                "progress_path": progress_path,
+                "created_at": datetime.utcnow(),
+                "finished_at": None,
+                "cached": False,
+                "size": None,
+                "error": None,
+                "total_rows": sum(sheet["total"] or 0 for sheet in sheets),
+            }
+            if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.ttl:
+                # File hasil permintaan yang sama masih baru (mis. dari sebelum restart)
+                # finished_at dari mtime file: umur job dan umur file memakai jam yang sama
+                job.update(status="done", cached=True, finished_at=datetime.utcfromtimestamp(os.path.getmtime(path)),
+                           size=os.path.getsize(path))
+                self._stats["reused"] += 1
+            else:
+                pending = sum(1 for j in self._jobs.values() if j["status"] in ("queued", "running"))
+                if pending >= self.max_pending:
+                    self._stats["rejected"] += 1
+                    return None
+                if os.path.exists(progress_path):
+                    os.unlink(progress_path)
+                future = self._executor().submit(run_job, request["format"], path, progress_path, DB, sheets)
+                future.add_done_callback(lambda f, job_id=job["id"]: self._finish(job_id, f))
+
+            self._jobs[job["id"]] = job
+            self._by_key[key] = job["id"]
+            return job
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["finished_at"] = datetime.utcnow()
+            try:
+                job["size"] = future.result()
+                job["status"] = "done"
+                self._stats["completed"] += 1
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e) or type(e).__name__
+                self._stats["failed"] += 1
+                print(f"[export] Job {job_id} gagal: {job['error']}")
+
+    def _expire(self):
+        """
+        Buang job selesai dan file hasil yang lebih tua dari ttl (dipanggil
+        dengan lock). Job done mengikuti mtime filenya (jam yang sama dengan
+        pembersihan file) dan ikut dibuang jika filenya sudah tidak ada.
+        """
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] == "done":
+                try:
+                    expired = now - os.path.getmtime(job["path"]) >= self.ttl
+                except OSError:
+                    expired = True
+            else:
+                expired = job["finished_at"] and (datetime.utcnow() - job["finished_at"]).total_seconds() >= self.ttl
+            if expired:
+                del self._jobs[job_id]
+                if self._by_key.get(job["key"]) == job_id:
+                    del self._by_key[job["key"]]
+        if not os.path.isdir(self.directory):
+            return
+        active = {job["key"] for job in self._jobs.values() if job["status"] in ("queued", "running")}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.split(".")[0] not in active and now - os.path.getmtime(path) >= self.ttl:
+                os.unlink(path)
+                self._stats["expired_files"] += 1
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def view(self, job):
+        """Status job untuk response API"""
+        progress = {"rows": 0, "total_rows": job["total_rows"], "sensor": None}
+        started = False
+        try:
+            with open(job["progress_path"]) as f:
+                progress.update(json.load(f))
+            started = True
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            # Worker menulis progress pertama saat job mulai
+            if started and job["status"] == "queued":
+                job["status"] = "running"
+            status = job["status"]
+        if status == "done":
+            if not started:
+                progress["rows"] = progress["total_rows"]
+            progress["percent"] = 100.0
+        else:
+            total = progress["total_rows"]
+            progress["percent"] = round(min(progress["rows"] / total, 1) * 100, 1) if total else None
+        return {
+            "id": job["id"],
+            "status": status,
+            **{k: job["request"][k] for k in ("sensors", "format", "start", "end", "device", "order")},
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+            "cached": job["cached"],
+            "progress": progress,
+            "size": job["size"],
+            "error": job["error"],
+            "download": f"/exports/{job['id']}/download" if status == "done" else None,
+        }
+
+    def stats(self):
+        s = dict(self._stats)
+        statuses = [job["status"] for job in self._jobs.values()]
+        for status in ("queued", "running", "done", "failed"):
+            s[status] = statuses.count(status)
+        s["workers"] = self.workers
+        return s
+
+
+export_jobs = ExportJobs()
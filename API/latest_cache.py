@@ -0,0 +1,194 @@
+"""
+Cache nilai terbaru per sensor dan per device untuk /latest.
+
+Listener MQTT mengirim baris terbaru tiap device lewat
+pg_notify(LATEST_NOTIFY_CHANNEL) di statement insert-nya (dikirim saat
+commit). Thread cache memegang satu koneksi khusus di luar pool yang
+LISTEN ke channel tersebut, mengisi cache dari database saat start
+(setelah LISTEN, jadi tidak ada update yang terlewat) dan mengisi ulang
+setiap kali koneksi tersambung kembali.
+
+Baca /latest cukup lookup dict tanpa koneksi pool. Selama koneksi
+LISTEN putus cache dianggap tidak siap dan /latest membaca database
+seperti biasa. Baris yang tidak lewat listener (mis. insert manual)
+baru terlihat setelah cache miss atau reconnect.
+
+Penghitung data (data_version, invalidasi bucket terbuka response_cache)
+naik untuk setiap notifikasi, termasuk baris terlambat (timestamp lebih
+lama dari isi cache, mis. replay spool listener) yang bisa jatuh di
+bucket terbuka walau tidak mengganti baris terbaru.
+"""
+import json
+import select
+import threading
+from datetime import datetime
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from config import DB, LATEST_NOTIFY_CHANNEL, LATEST_CACHE_RECONNECT
+from utils import TABLES
+
+
+def prime_query(table):
+    """Baris terbaru tiap device: loose index scan device_id lewat uq_<tabel>_device_ts"""
+    return f"""
+        WITH RECURSIVE devices AS (
+            SELECT MIN(device_id) AS device_id FROM {table}
+            UNION ALL
+            SELECT (SELECT MIN(device_id) FROM {table} WHERE device_id > d.device_id)
+            FROM devices d WHERE d.device_id IS NOT NULL
+        )
+        SELECT latest.* FROM devices d
+        CROSS JOIN LATERAL (
+            SELECT * FROM {table}
+            WHERE device_id = d.device_id AND timestamp IS NOT NULL
+            ORDER BY timestamp DESC LIMIT 1
+        ) latest
+    """
+
+
+class LatestCache:
+    def __init__(self, channel=LATEST_NOTIFY_CHANNEL, reconnect=LATEST_CACHE_RECONNECT):
+        self.channel = channel
+        self.reconnect = reconnect
+        self._sensors = {table: sensor for sensor, table in TABLES.items()}
+        # (sensor, device_id) -> row ; sensor -> row terbaru semua device
+        self._devices = {}
+        self._latest = {}
+        self._lock = threading.Lock()
+        # Naik setiap kali baris terbaru suatu sensor berubah (ETag /snapshot)
+        self.version = 0
+        # (sensor, device_id) dan (sensor, None) -> jumlah baris baru yang diterima
+        # (invalidasi bucket terbuka di response_cache)
+        self._versions = {}
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"hits": 0, "misses": 0, "notifications": 0, "bad_notifications": 0,
+                       "reconnects": 0, "primed_rows": 0, "primed_at": None}
+
+    def start(self):
+        if self.channel and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="latest-cache", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._ready.clear()
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def get(self, sensor, device=None):
+        """Baris terbaru dari cache, None jika cache belum siap atau tidak ada (baca DB)"""
+        row = None
+        if self._ready.is_set():
+            row = self._latest.get(sensor) if device is None else self._devices.get((sensor, device))
+        self._stats["hits" if row is not None else "misses"] += 1
+        return row
+
+    def put(self, sensor, row, notified=False):
+        """
+        Simpan baris jika lebih baru dari isi cache (dipakai notifikasi dan
+        fallback DB). notified: baris baru dari listener, penghitung data
+        naik walau baris itu terlambat.
+        """
+        ts = row.get("timestamp")
+        if ts is None:
+            return
+        with self._lock:
+            key = (sensor, row.get("device_id"))
+            current = self._devices.get(key)
+            newer = current is None or ts >= current["timestamp"]
+            if newer:
+                self._devices[key] = row
+            if newer or notified:
+                self._versions[key] = self._versions.get(key, 0) + 1
+                self._versions[(sensor, None)] = self._versions.get((sensor, None), 0) + 1
+            current = self._latest.get(sensor)
+            if current is None or ts >= current["timestamp"]:
+                self._latest[sensor] = row
+                self.version += 1
+
+    def data_version(self, sensor, device=None):
+        """Penghitung data baru per sensor (atau per device); None jika cache belum siap"""
+        if not self._ready.is_set():
+            return None
+        return self._versions.get((sensor, device), 0)
+
+    def keys(self):
+        """(sensor, device_id) yang ada di cache"""
+        return list(self._devices)
+
+    def stats(self):
+        s = dict(self._stats)
+        s["ready"] = self._ready.is_set()
+        s["devices"] = len(self._devices)
+        return s
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(
+                    host=DB["host"], port=DB["port"], dbname=DB["dbname"],
+                    user=DB["user"], password=DB["password"], application_name="latest-cache"
+                )
+                conn.autocommit = True
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                    self._prime(cur)
+                self._ready.set()
+                self._listen(conn)
+            except Exception as e:
+                print(f"[latest-cache] Koneksi LISTEN error: {e}")
+            finally:
+                self._ready.clear()
+                if conn is not None:
+                    conn.close()
+            if not self._stop.wait(self.reconnect):
+                self._stats["reconnects"] += 1
+
+    def _prime(self, cur):
+        primed = 0
+        for table, sensor in self._sensors.items():
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            if not list(cur.fetchone().values())[0]:
+                continue
+            cur.execute(prime_query(table))
+            for row in cur.fetchall():
+                self.put(sensor, dict(row))
+                primed += 1
+        self._stats["primed_rows"] = primed
+        self._stats["primed_at"] = datetime.utcnow().isoformat()
+        print(f"[latest-cache] {primed} device dimuat, LISTEN {self.channel}")
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                self._apply(conn.notifies.pop(0).payload)
+
+    def _apply(self, payload):
+        try:
+            message = json.loads(payload)
+            sensor = self._sensors[message["table"]]
+            row = message["row"]
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        except (ValueError, KeyError, TypeError):
+            self._stats["bad_notifications"] += 1
+            return
+        self._stats["notifications"] += 1
+        self.put(sensor, row, notified=True)
+
+
+latest_cache = LatestCache()
@@ -4,10 +4,18 @@ Smart Home IoT API - Main Entry Point
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from database import init_pool, close_pool, check_database_exists
-from config import DB, API_TITLE, API_VERSION, CORS_ORIGINS
+from database import init_pool, close_pool, init_async_pool, close_async_pool, check_database_exists
+from config import DB, API_TITLE, API_VERSION, CORS_ORIGINS, DB_POOL_MIN, DB_POOL_MAX
 from utils import init_db
-from routes import auth_router, relay_router, admin_router, sensors_router, settings_router, profile_router
+from notifier import dispatcher
+from partitions import maintainer
+from latest_cache import latest_cache
+from export_jobs import export_jobs
+from db_metrics import db_metrics
+from routes import (
+    auth_router, relay_router, admin_router, sensors_router, settings_router, profile_router, snapshot_router,
+    exports_router,
+)
 
 
 @asynccontextmanager
@@ -20,13 +28,24 @@ async def lifespan(app: FastAPI):
         raise RuntimeError(f"Database '{DB['dbname']}' belum dibuat.")
 
     # Startup: inisialisasi pool dan db
-    init_pool(minconn=2, maxconn=10)
+    db_metrics.start()
+    init_pool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX)
+    await init_async_pool()
     init_db()
+    dispatcher.start()
+    maintainer.start()
+    latest_cache.start()
     
     yield
     
-    # Shutdown: tutup pool
+    # Shutdown: hentikan thread/proses background lalu tutup pool
+    export_jobs.stop()
+    latest_cache.stop()
+    maintainer.stop()
+    dispatcher.stop()
+    await close_async_pool()
     close_pool()
+    db_metrics.stop()
 
 
 # Create FastAPI app
@@ -59,6 +78,8 @@ app.include_router(admin_router)
 app.include_router(sensors_router)
 app.include_router(profile_router)
 app.include_router(settings_router)
+app.include_router(snapshot_router)
+app.include_router(exports_router)
 
 
 @app.get("/")
@@ -0,0 +1,203 @@
+"""
+Migrasi skema database berversi.
+
+Setiap migrasi punya nomor versi dan hanya dijalankan sekali; versi yang
+sudah diterapkan dicatat di tabel schema_migrations. Runner memegang
+advisory lock supaya beberapa proses API yang start bersamaan tidak
+menjalankan migrasi yang sama.
+
+Migrasi biasa berjalan dalam satu transaksi bersama pencatatan versinya.
+Migrasi dengan transactional=False (mis. CREATE INDEX CONCURRENTLY pada
+tabel data yang besar) berjalan autocommit dan harus idempotent.
+
+Tabel data sensor dibuat oleh MQTT/init_db.py dari registry, jadi
+migrasi melewati tabel yang belum ada.
+"""
+from database import get_conn
+from utils import TABLES, COLUMNS, numeric_columns
+
+# Kunci pg_advisory_lock untuk runner migrasi
+MIGRATION_LOCK_ID = 7_271_001
+
+
+def _existing_tables(cur):
+    """(sensor, tabel) untuk tabel data yang sudah ada"""
+    for sensor, table in TABLES.items():
+        cur.execute("SELECT to_regclass(%s)", (table,))
+        if cur.fetchone()[0]:
+            yield sensor, table
+
+
+def time_index_ddl(table):
+    """
+    (nama, DDL) index waktu tabel data sensor: BRIN untuk filter rentang
+    waktu (/history, /stats) pada data append-only, btree timestamp untuk
+    /latest tanpa filter device. /latest per device memakai uq_<tabel>_device_ts.
+    """
+    return [
+        (f"brin_{table}_ts",
+         f"CREATE INDEX CONCURRENTLY IF NOT EXISTS brin_{table}_ts "
+         f"ON {table} USING brin (timestamp) WITH (pages_per_range = 32)"),
+        (f"idx_{table}_ts",
+         f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{table}_ts ON {table} (timestamp)"),
+    ]
+
+
+def create_index_concurrently(cur, name, ddl):
+    """CREATE INDEX CONCURRENTLY yang aman diulang (index INVALID sisa kegagalan dibuat ulang)"""
+    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    if row and row[0]:
+        return
+    if row:
+        cur.execute(f"DROP INDEX{' CONCURRENTLY' if ' CONCURRENTLY ' in ddl else ''} IF EXISTS {name}")
+    cur.execute(ddl)
+    print(f"Migration: index {name} dibuat")
+
+
+# ---- Migrasi ----
+
+def _users(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            is_active BOOLEAN DEFAULT true,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT true;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS force_password_change BOOLEAN DEFAULT false;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS avatar_url TEXT DEFAULT NULL;
+    """)
+
+
+def _relay_and_settings(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS status_relay (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            gpio INT,
+            is_active BOOLEAN DEFAULT false
+        );
+        CREATE TABLE IF NOT EXISTS app_settings (
+            id SERIAL PRIMARY KEY,
+            setting_key TEXT UNIQUE NOT NULL,
+            setting_value JSONB NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+
+
+def _sensor_natural_key(cur):
+    """Dimensi device_id + natural key unik (device_id, timestamp)"""
+    for sensor, table in list(_existing_tables(cur)):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS device_id TEXT NOT NULL DEFAULT 'default'")
+
+        cur.execute("SELECT to_regclass(%s)", (f"uq_{table}_device_ts",))
+        if cur.fetchone()[0]:
+            continue
+        # Buang duplikat lama (pesan retransmit) sebelum index unik dibuat
+        cur.execute(f"""
+            DELETE FROM {table} a USING {table} b
+            WHERE a.device_id = b.device_id AND a.timestamp = b.timestamp AND a.id > b.id
+        """)
+        if cur.rowcount:
+            print(f"Migration {table}: {cur.rowcount} baris duplikat dihapus")
+        cur.execute(f"""
+            CREATE UNIQUE INDEX uq_{table}_device_ts
+            ON {table} (device_id, timestamp) INCLUDE ({", ".join(numeric_columns(COLUMNS[sensor]))})
+        """)
+        cur.execute(f"DROP INDEX IF EXISTS idx_{table}_device_ts")
+
+
+def _sensor_time_indexes(cur):
+    for _, table in list(_existing_tables(cur)):
+        # Tabel partisi (MQTT/init_db.py baru) tidak mendukung CONCURRENTLY: index biasa
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        partitioned = cur.fetchone()[0] == "p"
+        for name, ddl in time_index_ddl(table):
+            create_index_concurrently(cur, name, ddl.replace(" CONCURRENTLY", "") if partitioned else ddl)
+        cur.execute(f"ANALYZE {table}")
+
+
+def _sensor_time_partitions(cur):
+    """Tabel data biasa -> tabel partisi RANGE (timestamp), lihat partitions.py"""
+    from partitions import convert_to_partitioned
+
+    for sensor, table in list(_existing_tables(cur)):
+        convert_to_partitioned(cur, sensor, table)
+
+
+def _sensor_rollups(cur):
+    """Tabel rollup 1m/1h/1d per sensor, diisi dari data lama (lihat rollups.py)"""
+    from rollups import backfill_rollups
+    from shared.registry import rollup_ddl
+
+    for sensor, table in list(_existing_tables(cur)):
+        # Tahan insert listener selama backfill supaya tidak ada baris yang terlewat
+        cur.execute(f"LOCK TABLE {table} IN SHARE MODE")
+        cur.execute(rollup_ddl(table, numeric_columns(COLUMNS[sensor])))
+        backfill_rollups(cur, table, numeric_columns(COLUMNS[sensor]))
+
+
+# (versi, nama, fungsi(cur), transactional)
+MIGRATIONS = [
+    (1, "users", _users, True),
+    (2, "status_relay_app_settings", _relay_and_settings, True),
+    (3, "sensor_device_natural_key", _sensor_natural_key, True),
+    (4, "sensor_time_indexes", _sensor_time_indexes, False),
+    (5, "sensor_time_partitions", _sensor_time_partitions, True),
+    (6, "sensor_rollups", _sensor_rollups, True),
+]
+
+
+def applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def run_migrations():
+    """Terapkan semua migrasi yang belum tercatat, berurutan menurut versi"""
+    with get_conn() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+                try:
+                    done = applied_versions(cur)
+                    for version, name, migrate, transactional in MIGRATIONS:
+                        if version in done:
+                            continue
+                        print(f"Migration {version:03d}_{name}...")
+                        if transactional:
+                            cur.execute("BEGIN")
+                            try:
+                                migrate(cur)
+                                cur.execute(
+                                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                    (version, name)
+                                )
+                                cur.execute("COMMIT")
+                            except Exception:
+                                cur.execute("ROLLBACK")
+                                raise
+                        else:
+                            migrate(cur)
+                            cur.execute(
+                                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                (version, name)
+                            )
+                finally:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        finally:
+            conn.autocommit = False
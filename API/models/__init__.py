@@ -2,6 +2,7 @@
 from .user import UserLogin, UserRegister, UserUpdate, UserCreateAdmin
 from .relay import RelayUpdate, RelayRename
 from .settings import SettingsUpdate, TelegramTest
+from .export import ExportJobCreate
 
 __all__ = [
     "UserLogin",
@@ -12,4 +13,5 @@ __all__ = [
     "RelayRename",
     "SettingsUpdate",
     "TelegramTest",
+    "ExportJobCreate",
 ]
@@ -0,0 +1,13 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class ExportJobCreate(BaseModel):
+    sensors: List[str]
+    format: str = "xlsx"
+    range: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    device: Optional[str] = None
+    order: str = "desc"
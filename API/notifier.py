@@ -0,0 +1,40 @@
+"""
+Dispatcher notifikasi Telegram milik API (implementasi di shared/telegram.py)
+dan cache telegram_config dari app_settings.
+"""
+import threading
+from database import get_cursor
+from config import (
+    TELEGRAM_API_URL, NOTIFY_QUEUE_SIZE, NOTIFY_RATE_PER_SEC, NOTIFY_BURST,
+    NOTIFY_MAX_RETRIES, NOTIFY_BACKOFF_BASE
+)
+from shared.telegram import TelegramDispatcher
+
+
+dispatcher = TelegramDispatcher(
+    api_url=TELEGRAM_API_URL, queue_size=NOTIFY_QUEUE_SIZE, rate_per_sec=NOTIFY_RATE_PER_SEC,
+    burst=NOTIFY_BURST, max_retries=NOTIFY_MAX_RETRIES, backoff_base=NOTIFY_BACKOFF_BASE,
+)
+
+# Cache telegram_config supaya tiap alert tidak membaca DB
+_telegram_config = None
+_config_lock = threading.Lock()
+
+
+def get_telegram_config():
+    """telegram_config dari app_settings (di-cache sampai invalidate_config dipanggil)"""
+    global _telegram_config
+    with _config_lock:
+        if _telegram_config is None:
+            with get_cursor() as cur:
+                cur.execute("SELECT setting_value FROM app_settings WHERE setting_key = 'telegram_config'")
+                res = cur.fetchone()
+            _telegram_config = res['setting_value'] if res else {}
+        return _telegram_config
+
+
+def invalidate_config():
+    """Dipanggil setelah settings diubah/direset"""
+    global _telegram_config
+    with _config_lock:
+        _telegram_config = None
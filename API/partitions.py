@@ -0,0 +1,258 @@
+"""
+Partisi waktu dan retensi untuk tabel data sensor.
+
+Tabel data_* adalah tabel partisi RANGE (timestamp) dengan satu partisi
+per hari atau per bulan (PARTITION_INTERVAL, nama <tabel>_pYYYYMMDD /
+<tabel>_pYYYYMM) plus partisi <tabel>_default untuk timestamp yang belum
+punya partisi. Thread maintenance membuat partisi PARTITION_PREMAKE
+periode ke depan dan melepas partisi yang sudah lewat retention_days
+sensor tersebut (registry sensors.json, 0 = simpan selamanya):
+RETENTION_MODE=detach melepas partisi dari tabel (tetap ada untuk
+diarsip), RETENTION_MODE=drop menghapusnya.
+
+Query /history dan /stats memfilter timestamp, jadi planner hanya
+membaca partisi yang relevan (partition pruning) tanpa perubahan API.
+Thread yang sama membuang bucket rollup lama (rollups.prune_rollups).
+"""
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+import psycopg2
+from database import get_conn
+from utils import SENSORS, TABLES, COLUMNS, numeric_columns
+from rollups import prune_rollups
+from config import PARTITION_INTERVAL, PARTITION_PREMAKE, PARTITION_MAINTENANCE_INTERVAL, RETENTION_MODE
+
+# Kunci advisory lock supaya hanya satu proses API yang menjalankan maintenance
+MAINTENANCE_LOCK_ID = 7_271_002
+
+_SUFFIX = {"day": "%Y%m%d", "month": "%Y%m"}
+
+# Timestamp sebelum ini dianggap rusak (jam device belum sinkron) dan dibiarkan di partisi default
+_MIN_VALID_TS = datetime(2000, 1, 1)
+
+
+def period_start(ts, interval=PARTITION_INTERVAL):
+    if interval == "day":
+        return datetime(ts.year, ts.month, ts.day)
+    return datetime(ts.year, ts.month, 1)
+
+
+def next_period(start, interval=PARTITION_INTERVAL):
+    if interval == "day":
+        return start + timedelta(days=1)
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(table, start, interval=PARTITION_INTERVAL):
+    return f"{table}_p{start.strftime(_SUFFIX[interval])}"
+
+
+def partition_bounds(table, name):
+    """(start, end) dari nama partisi buatan modul ini, None untuk partisi lain"""
+    match = re.fullmatch(rf"{table}_p(\d{{8}}|\d{{6}})", name)
+    if not match:
+        return None
+    interval = "day" if len(match.group(1)) == 8 else "month"
+    start = datetime.strptime(match.group(1), _SUFFIX[interval])
+    return start, next_period(start, interval)
+
+
+def is_partitioned(cur, table):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions(cur, table):
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def create_partition(cur, table, start, interval=PARTITION_INTERVAL):
+    """
+    Buat partisi [start, periode berikutnya). Baris periode itu yang sudah
+    masuk partisi default dipindahkan dulu. Return True jika partisi dibuat.
+    """
+    name = partition_name(table, start, interval)
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    if cur.fetchone()[0]:
+        return False
+
+    end = next_period(start, interval)
+    cur.execute("SAVEPOINT partition")
+    try:
+        cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {table}_default WHERE timestamp >= %s AND timestamp < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, (start, end))
+        cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    except psycopg2.errors.InvalidObjectDefinition as e:
+        # Tumpang tindih dengan partisi lama (PARTITION_INTERVAL pernah diganti)
+        cur.execute("ROLLBACK TO SAVEPOINT partition")
+        print(f"[partition] {name} dilewati: {e}".strip())
+        return False
+    cur.execute("RELEASE SAVEPOINT partition")
+    return True
+
+
+def ensure_partitions(cur, table, start, end, interval=PARTITION_INTERVAL):
+    """Pastikan ada partisi untuk setiap periode dari start sampai end; return jumlah yang dibuat"""
+    created = 0
+    period = period_start(start, interval)
+    while period < end:
+        created += create_partition(cur, table, period, interval)
+        period = next_period(period, interval)
+    return created
+
+
+def apply_retention(cur, table, days, mode=RETENTION_MODE, now=None):
+    """Lepas (detach/drop) partisi yang seluruh isinya lebih tua dari `days` hari"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    removed = []
+    for name in list_partitions(cur, table):
+        bounds = partition_bounds(table, name)
+        if bounds is None or bounds[1] > cutoff:
+            continue
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        if mode == "drop":
+            cur.execute(f"DROP TABLE {name}")
+        removed.append(name)
+    # Sisa lama di partisi default (mis. timestamp device yang kacau)
+    cur.execute(f"DELETE FROM {table}_default WHERE timestamp < %s", (cutoff,))
+    return removed
+
+
+def convert_to_partitioned(cur, sensor, table, interval=PARTITION_INTERVAL, premake=PARTITION_PREMAKE):
+    """
+    Ubah tabel data biasa menjadi tabel partisi (dipakai migrasi). Data lama
+    disalin ke partisi per periode, sequence id tetap dipakai.
+    """
+    if is_partitioned(cur, table):
+        return
+    values = numeric_columns(COLUMNS[sensor])
+    columns = ", ".join(["id", "device_id", *values, "timestamp"])
+
+    cur.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+    sequence = cur.fetchone()[0]
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cur.execute(f"ALTER TABLE {table} RENAME TO {table}_heap")
+
+    cur.execute(f"""
+        CREATE TABLE {table} (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            device_id TEXT NOT NULL DEFAULT 'default',
+            {", ".join(f"{col} FLOAT" for col in values)},
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    cur.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    cur.execute(f"SELECT MIN(timestamp) FROM {table}_heap WHERE timestamp >= %s", (_MIN_VALID_TS,))
+    oldest = cur.fetchone()[0]
+    end = datetime.utcnow()
+    for _ in range(premake + 1):
+        end = next_period(period_start(end, interval), interval)
+    created = ensure_partitions(cur, table, oldest or datetime.utcnow(), end, interval)
+
+    cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_heap")
+    moved = cur.rowcount
+    cur.execute(f"DROP TABLE {table}_heap")
+
+    # Index dibuat di tabel induk, otomatis menurun ke setiap partisi
+    cur.execute(f"""
+        CREATE UNIQUE INDEX uq_{table}_device_ts
+        ON {table} (device_id, timestamp) INCLUDE ({", ".join(values)})
+    """)
+    cur.execute(f"CREATE INDEX brin_{table}_ts ON {table} USING brin (timestamp) WITH (pages_per_range = 32)")
+    cur.execute(f"CREATE INDEX idx_{table}_ts ON {table} (timestamp)")
+    cur.execute(f"ANALYZE {table}")
+    print(f"Migration {table}: {moved} baris dipindah ke {created} partisi ({interval})")
+
+
+class PartitionMaintainer:
+    """Thread periodik: pre-create partisi ke depan dan terapkan retensi per sensor"""
+
+    def __init__(self, interval=PARTITION_INTERVAL, premake=PARTITION_PREMAKE,
+                 every=PARTITION_MAINTENANCE_INTERVAL, retention_mode=RETENTION_MODE):
+        self.interval = interval
+        self.premake = premake
+        self.every = every
+        self.retention_mode = retention_mode
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"runs": 0, "skipped": 0, "created": 0, "removed": 0, "rollup_pruned": 0,
+                       "errors": 0, "last_run": None, "last_run_ms": 0.0}
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="partition-maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"[partition] Maintenance error: {e}")
+            self._stop.wait(self.every)
+
+    def run_once(self):
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        end = now
+        for _ in range(self.premake + 1):
+            end = next_period(period_start(end, self.interval), self.interval)
+
+        for sensor, table in TABLES.items():
+            with get_conn() as conn:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))", (MAINTENANCE_LOCK_ID, table))
+                        if not cur.fetchone()[0]:
+                            self._stats["skipped"] += 1
+                            continue
+                        days = SENSORS[sensor].get("retention_days") or 0
+                        cur.execute("SELECT to_regclass(%s)", (f"{table}_1m",))
+                        if cur.fetchone()[0]:
+                            self._stats["rollup_pruned"] += prune_rollups(cur, table, days, now)
+                        if not is_partitioned(cur, table):
+                            continue
+
+                        created = ensure_partitions(cur, table, now, end, self.interval)
+                        removed = []
+                        if days > 0:
+                            removed = apply_retention(cur, table, days, self.retention_mode, now)
+
+            self._stats["created"] += created
+            self._stats["removed"] += len(removed)
+            if created or removed:
+                print(f"[partition] {table}: {created} partisi dibuat, {self.retention_mode} {removed or '-'}")
+
+        self._stats["runs"] += 1
+        self._stats["last_run"] = now.isoformat()
+        self._stats["last_run_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    def stats(self):
+        return dict(self._stats)
+
+
+maintainer = PartitionMaintainer()
@@ -0,0 +1,127 @@
+"""
+Cache response /history dan /stats untuk rentang preset (range=1h..7d).
+
+Jendela rentang preset disejajarkan ke batas interval sampling-nya
+(24h -> kelipatan 4 jam), sehingga semua request dalam satu interval
+memakai jendela dan key cache yang sama. Jendela dibagi dua:
+
+- bagian tertutup [awal, awal bucket terbuka): tidak berubah lagi, di-cache
+  sampai RESPONSE_CACHE_TTL (menampung data telat dari spool device)
+- bucket terbuka [awal bucket terbuka, sekarang): dihitung ulang hanya
+  jika ada data baru untuk sensor/device itu (penghitung data_version dari
+  cache /latest yang diisi LISTEN/NOTIFY), atau setelah
+  RESPONSE_CACHE_OPEN_TTL detik jika cache /latest belum siap
+
+Cache ada di memori tiap proses API (LRU + TTL). Request serentak dengan
+key yang sama menunggu satu perhitungan (asyncio lock per key), tidak ikut
+menghitung.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+
+# Jumlah sampel latensi terakhir per endpoint/hasil untuk p50/p95
+_LATENCY_SAMPLES = 1000
+OUTCOMES = ("hit", "partial", "miss", "not_modified", "bypass")
+
+
+def digest(value):
+    """Hash pendek isi response (bagian ETag)"""
+    body = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(body.encode()).hexdigest()[:16]
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [asyncio.Lock() for _ in range(64)]
+        self._evictions = 0
+        # endpoint -> {outcome: jumlah}, endpoint -> {outcome: deque(detik)}
+        self._counts = {}
+        self._latency = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    async def get_or_compute(self, key, compute, valid=None):
+        """
+        Nilai dari cache jika ada dan valid(value), selain itu await compute()
+        sekali untuk semua request serentak. Return (value, dihitung_ulang).
+        """
+        value = self.get(key)
+        if value is not None and (valid is None or valid(value)):
+            return value, False
+        async with self._key_locks[hash(key) % len(self._key_locks)]:
+            value = self.get(key)
+            if value is not None and (valid is None or valid(value)):
+                return value, False
+            value = await compute()
+            self.put(key, value)
+            return value, True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, endpoint, outcome, seconds):
+        """Catat satu request endpoint: outcome salah satu OUTCOMES"""
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, dict.fromkeys(OUTCOMES, 0))
+            counts[outcome] += 1
+            latency = self._latency.setdefault(endpoint, {})
+            latency.setdefault(outcome, deque(maxlen=_LATENCY_SAMPLES)).append(seconds)
+
+    def stats(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, counts in self._counts.items():
+                cacheable = counts["hit"] + counts["partial"] + counts["miss"] + counts["not_modified"]
+                latency = {}
+                for outcome, samples in self._latency[endpoint].items():
+                    ordered = sorted(samples)
+                    latency[outcome] = {
+                        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+                        "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 3),
+                    }
+                endpoints[endpoint] = {
+                    **counts,
+                    # hit penuh (termasuk 304) dan hit bagian tertutup (bucket terbuka dihitung ulang)
+                    "hit_ratio": round((counts["hit"] + counts["not_modified"]) / cacheable, 3) if cacheable else None,
+                    "closed_hit_ratio": round(
+                        (counts["hit"] + counts["not_modified"] + counts["partial"]) / cacheable, 3
+                    ) if cacheable else None,
+                    "latency": latency,
+                }
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "endpoints": endpoints,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,282 @@
+"""
+Tabel rollup untuk /history dan /stats.
+
+Setiap tabel data punya rollup <tabel>_1m, <tabel>_1h dan <tabel>_1d:
+satu baris per (device_id, bucket) berisi jumlah sampel, timestamp
+pertama/terakhir, dan per field count/sum/sumsq/min/max. Listener MQTT
+menambahkan baris baru ke ketiganya di statement insert yang sama
+(MQTT/database.py), migrasi mengisi rollup dari data lama.
+
+Query memilih level paling kasar yang masih pas: /history memakai level
+yang lebarnya membagi interval sampling (10 menit -> 1m, 1-4 jam -> 1h,
+1 hari -> 1d), /stats memakai level paling kasar yang tidak lebih lebar
+dari rentangnya. Awal (dan akhir) rentang dipenuhi dari level yang
+lebih halus (menit sampai batas jam, jam sampai batas hari), jadi stats
+7d membaca < 100 baris rollup, bukan ~600 ribu baris mentah. Sisa menit
+yang tidak penuh di ujung rentang dibaca dari data mentah (paling banyak
+dua menit per device), sehingga hasilnya sama persis dengan query mentah
+untuk start/end sembarang.
+
+Rollup 1m hanya disimpan ROLLUP_MINUTE_RETENTION_DAYS hari (prune_rollups),
+lebih pendek dari data mentah. Bagian rentang sebelum horizon itu yang
+seharusnya dibaca dari level menit (level 0 atau ujung level yang lebih
+kasar) diambil dari data mentah.
+"""
+import math
+import re
+from datetime import datetime, timedelta
+from utils import numeric_columns
+from config import ROLLUP_MINUTE_RETENTION_DAYS
+# (suffix tabel, unit date_trunc, lebar bucket), didefinisikan sekali di registry bersama
+from shared.registry import ROLLUP_LEVELS as LEVELS
+
+_EPOCH = datetime(1970, 1, 1)
+_INTERVAL = re.compile(r"^(\d+)\s*(second|minute|hour|day)s?$")
+
+
+def backfill_rollups(cur, table, fields):
+    """
+    Hitung ulang semua rollup dari tabel mentah: level menit dari data
+    mentah, level jam dari menit, level hari dari jam. Pemanggil harus
+    menahan insert baru (LOCK TABLE ... IN SHARE MODE).
+    """
+    columns = ", ".join(f"{f}_count, {f}_sum, {f}_sumsq, {f}_min, {f}_max" for f in fields)
+    from_raw = ", ".join(f"COUNT({f}), SUM({f}), SUM({f} * {f}), MIN({f}), MAX({f})" for f in fields)
+    from_rollup = ", ".join(
+        f"SUM({f}_count), SUM({f}_sum), SUM({f}_sumsq), MIN({f}_min), MAX({f}_max)" for f in fields
+    )
+    source = None
+    for suffix, unit, _ in LEVELS:
+        target = f"{table}_{suffix}"
+        cur.execute(f"DELETE FROM {target}")
+        if source is None:
+            cur.execute(f"""
+                INSERT INTO {target} (device_id, bucket, samples, first_ts, last_ts, {columns})
+                SELECT device_id, date_trunc('{unit}', timestamp), COUNT(*), MIN(timestamp), MAX(timestamp), {from_raw}
+                FROM {table}
+                WHERE timestamp IS NOT NULL
+                GROUP BY 1, 2
+            """)
+        else:
+            cur.execute(f"""
+                INSERT INTO {target} (device_id, bucket, samples, first_ts, last_ts, {columns})
+                SELECT device_id, date_trunc('{unit}', bucket), SUM(samples), MIN(first_ts), MAX(last_ts), {from_rollup}
+                FROM {source}
+                GROUP BY 1, 2
+            """)
+        print(f"Rollup {target}: {cur.rowcount} bucket")
+        cur.execute(f"ANALYZE {target}")
+        source = target
+
+
+def prune_rollups(cur, table, days, now=None):
+    """Hapus bucket rollup yang lebih tua dari retensi; return jumlah baris yang dihapus"""
+    now = now or datetime.utcnow()
+    removed = 0
+    for suffix, _, _ in LEVELS:
+        keep = days
+        if suffix == "1m" and ROLLUP_MINUTE_RETENTION_DAYS > 0:
+            keep = min(days, ROLLUP_MINUTE_RETENTION_DAYS) if days > 0 else ROLLUP_MINUTE_RETENTION_DAYS
+        if keep > 0:
+            cur.execute(f"DELETE FROM {table}_{suffix} WHERE bucket < %s", (now - timedelta(days=keep),))
+            removed += cur.rowcount
+    return removed
+
+
+def minute_horizon(now=None):
+    """Bucket 1m tertua yang pasti belum dipangkas prune_rollups (None = tidak dipangkas)"""
+    if ROLLUP_MINUTE_RETENTION_DAYS <= 0:
+        return None
+    return _ceil((now or datetime.utcnow()) - timedelta(days=ROLLUP_MINUTE_RETENTION_DAYS), LEVELS[0][2])
+
+
+def interval_width(interval):
+    """'10 minutes' -> timedelta(minutes=10); None jika format tidak dikenal atau lebarnya 0"""
+    match = _INTERVAL.match(interval.strip())
+    if not match or int(match.group(1)) <= 0:
+        return None
+    return timedelta(**{f"{match.group(2)}s": int(match.group(1))})
+
+
+def history_level(interval):
+    """Level paling kasar yang lebarnya membagi interval sampling (None = pakai data mentah)"""
+    width = interval_width(interval) if interval else None
+    if width is None:
+        return None
+    fitting = [i for i, (_, _, step) in enumerate(LEVELS) if width % step == timedelta(0)]
+    return fitting[-1] if fitting else None
+
+
+def stats_level(delta):
+    """Level paling kasar yang tidak lebih lebar dari rentang"""
+    fitting = [i for i, (_, _, step) in enumerate(LEVELS) if step <= delta]
+    return fitting[-1] if fitting else 0
+
+
+def _ceil(ts, step):
+    steps = -(-(ts - _EPOCH) // step)
+    return _EPOCH + steps * step
+
+
+def floor_bucket(ts, step):
+    """Awal bucket selebar `step` (sejajar epoch) yang memuat ts"""
+    return _EPOCH + ((ts - _EPOCH) // step) * step
+
+
+def rollup_source(table, fields, level, since, device_sql="", device_params=(), until=None):
+    """
+    Subquery UNION ALL bucket rollup dalam [since, until): level `level`
+    untuk bagian yang sejajar bucket-nya, level yang lebih halus untuk awal
+    (dan akhir) rentang sampai batas bucket level berikutnya, dan baris
+    mentah untuk sisa menit yang tidak penuh di kedua ujung. Level None =
+    seluruh rentang dari baris mentah (dalam bentuk baris rollup). Segmen
+    level menit sebelum minute_horizon() juga dibaca dari baris mentah.
+    """
+    columns = "device_id, bucket, samples, first_ts, last_ts, " + ", ".join(
+        f"{f}_count, {f}_sum, {f}_sumsq, {f}_min, {f}_max" for f in fields
+    )
+    # Baris mentah dalam bentuk baris rollup satu sampel
+    raw_columns = (
+        "device_id, date_trunc('minute', timestamp) AS bucket, 1::bigint AS samples, "
+        "timestamp AS first_ts, timestamp AS last_ts, " + ", ".join(
+            f"({f} IS NOT NULL)::int::bigint AS {f}_count, {f} AS {f}_sum, {f} * {f} AS {f}_sumsq, "
+            f"{f} AS {f}_min, {f} AS {f}_max" for f in fields
+        )
+    )
+    if level is None:
+        sql = f"SELECT {raw_columns} FROM {table} WHERE timestamp >= %s"
+        if until:
+            return f"{sql} AND timestamp < %s{device_sql}", [since, until, *device_params]
+        return f"{sql}{device_sql}", [since, *device_params]
+
+    steps = [step for _, _, step in LEVELS[:level + 1]]
+    lo = [_ceil(since, step) for step in steps]
+    hi = [floor_bucket(until, step) if until else None for step in steps]
+    # Rentang pendek bisa tidak memuat satu bucket utuh level ini: turun level
+    while level > 0 and hi[level] is not None and lo[level] > hi[level]:
+        level -= 1
+
+    parts, params = [], []
+    minute_table, horizon = f"{table}_{LEVELS[0][0]}", minute_horizon()
+
+    def segment(source, start, end, select=columns):
+        if source == minute_table and horizon and start < horizon:
+            # Bucket 1m sebelum horizon sudah dipangkas
+            raw_segment(start, horizon if end is None else min(end, horizon))
+            if end is not None and end <= horizon:
+                return
+            start = horizon
+        if end is None:
+            parts.append(f"SELECT {select} FROM {source} WHERE bucket >= %s{device_sql}")
+            params.extend([start, *device_params])
+        elif start < end:
+            parts.append(f"SELECT {select} FROM {source} WHERE bucket >= %s AND bucket < %s{device_sql}")
+            params.extend([start, end, *device_params])
+
+    def raw_segment(start, end):
+        if start < end:
+            parts.append(f"SELECT {raw_columns} FROM {table} WHERE timestamp >= %s AND timestamp < %s{device_sql}")
+            params.extend([start, end, *device_params])
+
+    if until and lo[0] > hi[0]:
+        # Rentang di dalam satu menit: seluruhnya dari data mentah
+        raw_segment(since, until)
+        return "\n            UNION ALL ".join(parts), params
+
+    raw_segment(since, lo[0])
+    for i in range(level + 1):
+        rollup = f"{table}_{LEVELS[i][0]}"
+        if i < level:
+            segment(rollup, lo[i], lo[i + 1])
+            if until:
+                segment(rollup, hi[i + 1], hi[i])
+        else:
+            segment(rollup, lo[i], hi[i])
+    if until:
+        raw_segment(hi[0], until)
+    if not parts:
+        parts.append(f"SELECT {columns} FROM {table}_{LEVELS[0][0]} WHERE FALSE")
+    return "\n            UNION ALL ".join(parts), params
+
+
+def history_rollup_query(table, columns, interval, level, since, device_sql="", device_params=(), until=None):
+    """Sama dengan history_query(table, columns, interval) tetapi dari rollup; return (sql, params)"""
+    source, params = rollup_source(table, numeric_columns(columns), level, since, device_sql, device_params, until)
+    avg_cols = ", ".join(
+        f"SUM({col}_sum) / NULLIF(SUM({col}_count), 0) as {col}" for col in numeric_columns(columns)
+    )
+    return f"""
+        SELECT
+            to_timestamp(floor(extract(epoch from bucket) / extract(epoch from interval '{interval}')) * extract(epoch from interval '{interval}'))
+            AS time_bucket,
+            {avg_cols},
+            SUM(samples)::bigint as sample_count
+        FROM ({source}) r
+        GROUP BY time_bucket
+        ORDER BY time_bucket ASC;
+    """, params
+
+
+def stats_rollup_query(table, columns, level, since, device_sql="", device_params=(), until=None):
+    """Sama dengan stats_query(table, columns) tetapi dari rollup; return (sql, params)"""
+    source, params = rollup_source(table, numeric_columns(columns), level, since, device_sql, device_params, until)
+    agg_parts = []
+    for col in numeric_columns(columns):
+        n = f"SUM({col}_count)::float8"
+        agg_parts.extend([
+            f"MIN({col}_min) as {col}_min",
+            f"MAX({col}_max) as {col}_max",
+            f"SUM({col}_sum) / NULLIF({n}, 0) as {col}_avg",
+            f"SQRT(GREATEST(SUM({col}_sumsq) - SUM({col}_sum) ^ 2 / NULLIF({n}, 0), 0) / NULLIF({n} - 1, 0)) as {col}_stddev",
+        ])
+    return f"""
+        SELECT
+            COALESCE(SUM(samples), 0)::bigint as total_records,
+            MIN(first_ts) as first_record,
+            MAX(last_ts) as last_record,
+            {", ".join(agg_parts)}
+        FROM ({source}) r;
+    """, params
+
+
+def stats_partial_query(table, columns, level, since, device_sql="", device_params=(), until=None):
+    """
+    Komponen stats yang bisa digabung antar rentang (count/sum/sumsq/min/max
+    per field, lihat merge_stats); level None = dari data mentah. Return (sql, params).
+    """
+    source, params = rollup_source(table, numeric_columns(columns), level, since, device_sql, device_params, until)
+    parts = [
+        f"SUM({col}_count)::bigint as {col}_count, SUM({col}_sum) as {col}_sum, SUM({col}_sumsq) as {col}_sumsq, "
+        f"MIN({col}_min) as {col}_min, MAX({col}_max) as {col}_max"
+        for col in numeric_columns(columns)
+    ]
+    return f"""
+        SELECT
+            COALESCE(SUM(samples), 0)::bigint as total_records,
+            MIN(first_ts) as first_record,
+            MAX(last_ts) as last_record,
+            {", ".join(parts)}
+        FROM ({source}) r;
+    """, params
+
+
+def merge_stats(partials, fields):
+    """Gabungkan hasil stats_partial_query menjadi baris seperti stats_rollup_query"""
+    def values(key):
+        return [p[key] for p in partials if p[key] is not None]
+
+    first, last = values("first_record"), values("last_record")
+    row = {
+        "total_records": sum(p["total_records"] for p in partials),
+        "first_record": min(first) if first else None,
+        "last_record": max(last) if last else None,
+    }
+    for f in fields:
+        n = sum(values(f"{f}_count"))
+        total, sumsq = sum(values(f"{f}_sum")), sum(values(f"{f}_sumsq"))
+        mins, maxs = values(f"{f}_min"), values(f"{f}_max")
+        row[f"{f}_min"] = min(mins) if mins else None
+        row[f"{f}_max"] = max(maxs) if maxs else None
+        row[f"{f}_avg"] = total / n if n else None
+        row[f"{f}_stddev"] = math.sqrt(max(sumsq - total ** 2 / n, 0) / (n - 1)) if n > 1 else None
+    return row
@@ -5,6 +5,8 @@ from .relay import router as relay_router
 from .admin import router as admin_router
 from .sensors import router as sensors_router
 from .settings import router as settings_router
+from .snapshot import router as snapshot_router
+from .exports import router as exports_router
 
 __all__ = [
     "auth_router",
@@ -13,4 +15,6 @@ __all__ = [
     "sensors_router",
     "settings_router",
     "profile_router",
+    "snapshot_router",
+    "exports_router",
 ]
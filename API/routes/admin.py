@@ -1,11 +1,21 @@
 """
 Admin Router - User management endpoints (Admin only)
 """
+import hmac
 import random
 import string
-from fastapi import APIRouter, HTTPException
-from database import get_cursor
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from config import METRICS_TOKEN
+from database import get_cursor, pool_stats
+from db_metrics import db_metrics
 from models import UserCreateAdmin
+from notifier import dispatcher
+from partitions import maintainer
+from latest_cache import latest_cache
+from response_cache import response_cache
+from export_jobs import export_jobs
+from .snapshot import snapshot_stats
 from utils import hash_password
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -102,3 +112,48 @@ def reset_password(user_id: int):
         raise
     except Exception as e:
         raise HTTPException(500, f"Reset password error: {e}")
+
+
+def require_metrics_access(request: Request, x_metrics_token: Optional[str] = Header(None)):
+    """Metrics memuat teks query dan statistik internal: token METRICS_TOKEN, atau localhost jika tidak diset"""
+    if METRICS_TOKEN:
+        if not x_metrics_token or not hmac.compare_digest(x_metrics_token, METRICS_TOKEN):
+            raise HTTPException(403, "X-Metrics-Token tidak valid")
+    elif not request.client or request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(403, "Metrics hanya dari localhost (set METRICS_TOKEN untuk akses remote)")
+
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_access)])
+def get_metrics():
+    """Runtime metrics (Admin only)"""
+    return {
+        "notifier": dispatcher.stats(),
+        "partitions": maintainer.stats(),
+        "latest_cache": latest_cache.stats(),
+        "snapshot": snapshot_stats(),
+        "response_cache": response_cache.stats(),
+        "export_jobs": export_jobs.stats(),
+        "db": {"pools": pool_stats(), **db_metrics.stats()}
+    }
+
+
+@router.get("/metrics/db", dependencies=[Depends(require_metrics_access)])
+def get_db_metrics(
+    limit: int = Query(50, ge=1, le=500, description="Jumlah statement dan query lambat"),
+    order: str = Query("total", description="Urutan statement: total | mean | max | calls"),
+):
+    """
+    Detail instrumentasi database (Admin only): gauge pool, histogram waktu
+    tunggu checkout, latensi per fingerprint SQL dan log query lambat
+    beserta EXPLAIN (lihat db_metrics.py)
+    """
+    if order not in ("total", "mean", "max", "calls"):
+        raise HTTPException(400, "order harus total, mean, max atau calls")
+    summary = db_metrics.stats()
+    summary.pop("top_statements")
+    return {
+        "pools": pool_stats(),
+        **summary,
+        "statements": db_metrics.statements(limit, order),
+        "slow_queries": db_metrics.slow_queries(limit),
+    }
@@ -0,0 +1,124 @@
+"""
+Exports Router - Job export background (beberapa sensor, satu sheet per sensor)
+"""
+import os
+from datetime import datetime, timedelta
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from database import get_cursor
+from config import ROLLUP_QUERIES
+from export import FORMATS, XLSX_AVAILABLE, export_query
+from export_jobs import export_jobs
+from models import ExportJobCreate
+from rollups import floor_bucket, stats_level, stats_rollup_query
+from utils import validate_sensor, RANGES, device_filter, utc_naive
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+
+# Awal rentang jika start kosong (seluruh history)
+_BEGINNING = datetime(1970, 1, 1)
+
+
+def _resolve_window(data: ExportJobCreate):
+    """
+    (start, end) job. Rentang preset disejajarkan ke menit, jadi permintaan
+    yang sama dalam menit yang sama memakai file hasil yang sama.
+    """
+    if data.range is not None:
+        if data.range not in RANGES:
+            raise HTTPException(400, f"Rentang waktu tidak valid. Pilihan: {list(RANGES.keys())}")
+        end = floor_bucket(datetime.utcnow(), timedelta(minutes=1))
+        return end - RANGES[data.range]["delta"], end
+    start, end = utc_naive(data.start), utc_naive(data.end)
+    if start and end and end <= start:
+        raise HTTPException(400, "end harus lebih besar dari start")
+    return start, end
+
+
+def _row_count(cur, table, columns, start, end, device_sql, device_params):
+    """Jumlah baris dalam rentang (dari rollup, untuk progress); None tanpa rollup"""
+    if not ROLLUP_QUERIES:
+        return None
+    since = start or _BEGINNING
+    level = stats_level((end or datetime.utcnow()) - since)
+    cur.execute(*stats_rollup_query(table, columns, level, since, device_sql, device_params, until=end))
+    return cur.fetchone()["total_records"]
+
+
+@router.post("", status_code=202)
+def create_export(data: ExportJobCreate):
+    """
+    Buat job export. Hasilnya satu file: xlsx (satu sheet per sensor),
+    ndjson (field "sensor" per baris), csv (zip berisi satu csv per sensor
+    jika lebih dari satu sensor). Pantau lewat GET /exports/{id}.
+    """
+    if data.format not in FORMATS:
+        raise HTTPException(400, f"Format tidak valid. Pilihan: {list(FORMATS)}")
+    if data.format == "xlsx" and not XLSX_AVAILABLE:
+        raise HTTPException(500, "openpyxl not installed. Run: pip install openpyxl")
+    if data.order not in ("asc", "desc"):
+        raise HTTPException(400, "order harus asc atau desc")
+    sensors = list(dict.fromkeys(data.sensors))
+    if not sensors:
+        raise HTTPException(400, "Pilih minimal satu sensor")
+    targets = [(sensor, *validate_sensor(sensor)) for sensor in sensors]
+    start, end = _resolve_window(data)
+    device_sql, device_params = device_filter(data.device)
+    params = (*[ts for ts in (start, end) if ts is not None], *device_params)
+
+    try:
+        sheets = []
+        with get_cursor() as cur:
+            for sensor, table, columns in targets:
+                sheets.append({
+                    "sensor": sensor,
+                    "title": f"{sensor.upper()} History",
+                    "columns": columns,
+                    "sql": export_query(table, columns, device_sql, start is not None, end is not None, data.order),
+                    "params": params,
+                    "total": _row_count(cur, table, columns, start, end, device_sql, device_params),
+                })
+    except Exception as e:
+        raise HTTPException(500, f"Database error: {e}")
+
+    extension = FORMATS[data.format][1]
+    if data.format == "csv" and len(sensors) > 1:
+        extension = "zip"
+    request = {
+        "sensors": sensors, "format": data.format, "start": start, "end": end,
+        "device": data.device, "order": data.order,
+    }
+    job = export_jobs.submit(request, extension, sheets)
+    if job is None:
+        raise HTTPException(429, "Antrean export penuh, coba lagi nanti")
+    return export_jobs.view(job)
+
+
+@router.get("/{job_id}")
+def get_export(job_id: str):
+    """Status dan progress job export"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job export tidak ditemukan (atau sudah kedaluwarsa)")
+    return export_jobs.view(job)
+
+
+@router.get("/{job_id}/download")
+def download_export(job_id: str):
+    """Download file hasil job yang sudah selesai"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job export tidak ditemukan (atau sudah kedaluwarsa)")
+    if job["status"] == "failed":
+        raise HTTPException(500, f"Export error: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(409, "Export belum selesai")
+    if not os.path.exists(job["path"]):
+        # File dihapus di luar API (atau kedaluwarsa di antara get dan download)
+        raise HTTPException(410, "File export sudah tidak ada, kirim ulang POST /exports")
+
+    request = job["request"]
+    extension = job["path"].rsplit(".", 1)[1]
+    media_type = "application/zip" if extension == "zip" else FORMATS[request["format"]][0]
+    filename = f"{'_'.join(request['sensors'])}_history_{job['created_at'].strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return FileResponse(job["path"], media_type=media_type, filename=filename)
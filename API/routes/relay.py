@@ -2,72 +2,70 @@
 Relay Router - Relay control endpoints
 """
 from fastapi import APIRouter, HTTPException
-from database import get_cursor
+from database import get_async_cursor
 from models import RelayUpdate, RelayRename
+from utils import db_error
+from .snapshot import invalidate_snapshot
 
 router = APIRouter(prefix="/relays", tags=["Relays"])
 
 
 @router.get("")
-def get_relays():
+async def get_relays():
     """Get all relays status"""
     try:
-        with get_cursor() as cur:
-            cur.execute("SELECT * FROM status_relay ORDER BY id ASC")
-            return cur.fetchall()
+        async with get_async_cursor() as cur:
+            await cur.execute("SELECT * FROM status_relay ORDER BY id ASC")
+            return await cur.fetchall()
     except Exception as e:
-        raise HTTPException(500, f"Error: {e}")
+        raise db_error(e, "Error")
 
 
 @router.get("/{relay_id}")
-def get_relay_by_id(relay_id: int):
+async def get_relay_by_id(relay_id: int):
     """Get single relay by ID"""
     try:
-        with get_cursor() as cur:
-            cur.execute("SELECT * FROM status_relay WHERE id = %s", (relay_id,))
-            result = cur.fetchone()
+        async with get_async_cursor() as cur:
+            await cur.execute("SELECT * FROM status_relay WHERE id = %s", (relay_id,))
+            result = await cur.fetchone()
             if not result:
                 raise HTTPException(404, f"Relay dengan ID {relay_id} tidak ditemukan")
             return result
-    except HTTPException:
-        raise
     except Exception as e:
-        raise HTTPException(500, f"Error: {e}")
+        raise db_error(e, "Error")
 
 
 @router.put("/{relay_id}")
-def update_relay_status(relay_id: int, update: RelayUpdate):
+async def update_relay_status(relay_id: int, update: RelayUpdate):
     """Update single relay status (on/off)"""
     try:
-        with get_cursor() as cur:
-            cur.execute(
+        async with get_async_cursor() as cur:
+            await cur.execute(
                 "UPDATE status_relay SET is_active = %s WHERE id = %s RETURNING id, name, is_active",
                 (update.is_active, relay_id)
             )
-            result = cur.fetchone()
+            result = await cur.fetchone()
             if not result:
                 raise HTTPException(404, f"Relay dengan ID {relay_id} tidak ditemukan")
-            return {"success": True, "relay": result}
-    except HTTPException:
-        raise
+        invalidate_snapshot()
+        return {"success": True, "relay": result}
     except Exception as e:
-        raise HTTPException(500, f"Error updating relay: {e}")
+        raise db_error(e, "Error updating relay")
 
 
 @router.patch("/{relay_id}/name")
-def rename_relay(relay_id: int, update: RelayRename):
+async def rename_relay(relay_id: int, update: RelayRename):
     """Rename relay"""
     try:
-        with get_cursor() as cur:
-            cur.execute(
+        async with get_async_cursor() as cur:
+            await cur.execute(
                 "UPDATE status_relay SET name = %s WHERE id = %s RETURNING id, name, gpio, is_active",
                 (update.name, relay_id)
             )
-            result = cur.fetchone()
+            result = await cur.fetchone()
             if not result:
                 raise HTTPException(404, f"Relay dengan ID {relay_id} tidak ditemukan")
-            return {"success": True, "relay": result}
-    except HTTPException:
-        raise
+        invalidate_snapshot()
+        return {"success": True, "relay": result}
     except Exception as e:
-        raise HTTPException(500, f"Error renaming relay: {e}")
+        raise db_error(e, "Error renaming relay")
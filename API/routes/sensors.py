@@ -1,226 +1,631 @@
 """
 Sensors Router - Sensor data endpoints
 """
-import io
+import time
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from database import get_cursor
-from utils import validate_sensor, RANGES
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from psycopg.rows import tuple_row
+from database import get_conn, get_async_cursor
+from config import (
+    ROLLUP_QUERIES, HISTORY_PAGE_LIMIT, HISTORY_MAX_LIMIT, HISTORY_MAX_BUCKETS, DOWNSAMPLE_MAX_POINTS,
+    RESPONSE_CACHE, RESPONSE_CACHE_OPEN_TTL, DB_HISTORY_STATEMENT_TIMEOUT,
+)
+from columnar import (
+    FORMATS as HISTORY_FORMATS, BINARY_MEDIA_TYPE, epoch_select, micros_to_datetime, columns_from_tuples,
+    columns_from_dicts, columnar_body, binary_body,
+)
+from export import FORMATS, XLSX_AVAILABLE, export_query, stream_export
+from latest_cache import latest_cache
+from response_cache import response_cache, digest
+from rollups import (
+    LEVELS, history_level, stats_level, history_rollup_query, stats_rollup_query, interval_width,
+    floor_bucket, stats_partial_query, merge_stats,
+)
+from utils import (
+    validate_sensor, numeric_columns, RANGES, etag_matches, device_filter, utc_naive, db_error, cancel_on_disconnect,
+)
 
 router = APIRouter(tags=["Sensors"])
 
+DEVICE_QUERY = Query(None, description="Filter device_id (kosong = semua device)")
+
+
+def _window(range: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+    """
+    Rentang waktu request: preset `range` (sampai sekarang) atau start/end
+    bebas. Return (since, until, delta); until None = sampai sekarang.
+    """
+    start, end = utc_naive(start), utc_naive(end)
+    if start is None:
+        if range is None:
+            raise HTTPException(400, "Isi parameter range atau start")
+        if range not in RANGES:
+            raise HTTPException(400, f"Rentang waktu tidak valid. Pilihan: {list(RANGES.keys())}")
+        start = datetime.utcnow() - RANGES[range]["delta"]
+    if end is not None and end <= start:
+        raise HTTPException(400, "end harus lebih besar dari start")
+    return start, end, (end or datetime.utcnow()) - start
+
+
+def _parse_after(after: Optional[str]):
+    """Cursor keyset '<timestamp>,<id>' dari next_after halaman sebelumnya"""
+    if after is None:
+        return None
+    try:
+        ts, row_id = after.rsplit(",", 1)
+        return utc_naive(datetime.fromisoformat(ts.strip())), int(row_id)
+    except ValueError:
+        raise HTTPException(400, "after harus berformat <timestamp>,<id>")
+
+
+# Builder SQL per endpoint (dipakai juga oleh verify_indexes.py untuk cek EXPLAIN)
+
+def latest_query(table, device_sql=""):
+    """Baris terbaru: idx_<tabel>_ts, atau uq_<tabel>_device_ts jika difilter device"""
+    return f"""
+        SELECT * FROM {table}
+        WHERE TRUE{device_sql}
+        ORDER BY timestamp DESC
+        LIMIT 1;
+    """
+
+
+def history_query(table, columns, interval=None, device_sql="", until=False, after=False, select="*"):
+    """
+    History di-sampling per interval, atau satu halaman data mentah (interval
+    None) urut (timestamp, id) dengan cursor keyset. Parameter: since,
+    [until], device, [after_ts, after_id], limit (limit hanya untuk mentah).
+    `select` daftar kolom mode mentah (format kolom: columnar.epoch_select).
+    """
+    until_sql = " AND timestamp < %s" if until else ""
+    if not interval:
+        # Range scan idx_<tabel>_ts yang berhenti setelah LIMIT baris
+        after_sql = " AND (timestamp, id) > (%s, %s)" if after else ""
+        return f"""
+            SELECT {select}
+            FROM {table}
+            WHERE timestamp >= %s{until_sql}{device_sql}{after_sql}
+            ORDER BY timestamp ASC, id ASC
+            LIMIT %s;
+        """
+    avg_cols = ", ".join([f"AVG({col}) as {col}" for col in numeric_columns(columns)])
+    # Sampling dengan date_trunc-style bucket, kompatibel dengan PostgreSQL biasa (tanpa TimescaleDB)
+    return f"""
+        SELECT 
+            to_timestamp(floor(extract(epoch from timestamp) / extract(epoch from interval '{interval}')) * extract(epoch from interval '{interval}'))
+            AS time_bucket,
+            {avg_cols},
+            COUNT(*) as sample_count
+        FROM {table}
+        WHERE timestamp >= %s{until_sql}{device_sql}
+        GROUP BY time_bucket
+        ORDER BY time_bucket ASC;
+    """
+
+
+def stats_query(table, columns, device_sql="", until=False):
+    """Agregat min/max/avg per kolom numerik dalam rentang waktu"""
+    agg_parts = []
+    for col in numeric_columns(columns):
+        agg_parts.extend([
+            f"MIN({col}) as {col}_min",
+            f"MAX({col}) as {col}_max",
+            f"AVG({col}) as {col}_avg",
+            f"STDDEV_SAMP({col}) as {col}_stddev"
+        ])
+    return f"""
+        SELECT 
+            COUNT(*) as total_records,
+            MIN(timestamp) as first_record,
+            MAX(timestamp) as last_record,
+            {", ".join(agg_parts)}
+        FROM {table}
+        WHERE timestamp >= %s{" AND timestamp < %s" if until else ""}{device_sql};
+    """
+
+
+async def _sampled_rows(cur, table, columns, interval, level, since, until, device_sql, device_params):
+    """Baris history ter-sampling dalam [since, until) dari rollup `level` atau data mentah (level None)"""
+    if level is not None:
+        await cur.execute(*history_rollup_query(
+            table, columns, interval, level, since, device_sql, device_params, until=until
+        ))
+    else:
+        await cur.execute(
+            history_query(table, columns, interval, device_sql, until=until is not None),
+            (since, *([until] if until else []), *device_params)
+        )
+    return await cur.fetchall()
+
+
+def _aligned_window(range, interval):
+    """
+    Jendela preset disejajarkan ke batas interval: (since, open_start).
+    [since, open_start) tertutup, bucket [open_start, sekarang) masih terbuka.
+    """
+    step = interval_width(interval)
+    now = datetime.utcnow()
+    return floor_bucket(now - RANGES[range]["delta"], step), floor_bucket(now, step)
+
+
+async def _cached_parts(key, sensor, device, since, open_start, compute_closed, compute_open):
+    """
+    Bagian tertutup dan bucket terbuka dari response_cache; compute_*()
+    (coroutine) hanya dijalankan jika bagiannya tidak ada / bucket terbuka
+    sudah berubah. Return (closed, open, outcome, etag).
+    """
+    def entry(value, **extra):
+        return {"value": value, "digest": digest(value), **extra}
+
+    async def closed_entry():
+        return entry(await compute_closed())
+
+    closed, closed_new = await response_cache.get_or_compute((*key, "closed", since, open_start), closed_entry)
+    version = latest_cache.data_version(sensor, device)
+
+    def fresh(entry):
+        # Tanpa LISTEN/NOTIFY tidak tahu kapan ada data baru: pakai umur
+        if version is None:
+            return time.monotonic() - entry["at"] < RESPONSE_CACHE_OPEN_TTL
+        return entry["version"] == version
+
+    async def open_entry():
+        return entry(await compute_open(), version=version, at=time.monotonic())
+
+    opened, open_new = await response_cache.get_or_compute((*key, "open", open_start), open_entry, fresh)
+    outcome = "miss" if closed_new else "partial" if open_new else "hit"
+    return closed["value"], opened["value"], outcome, f'"{closed["digest"]}-{opened["digest"]}"'
+
+
+def _columns_response(body, fmt, data, headers=None):
+    """Response /history format columnar/binary; data: dict kolom -> list nilai"""
+    meta = {key: value for key, value in body.items() if key != "data"}
+    if fmt == "binary":
+        try:
+            content = binary_body(meta, data)
+        except ImportError:
+            raise HTTPException(500, "numpy not installed. Run: pip install numpy")
+        return Response(content, media_type=BINARY_MEDIA_TYPE, headers=headers)
+    return Response(columnar_body(meta, data), media_type="application/json", headers=headers)
+
+
+async def _json_response(body, headers=None):
+    """JSONResponse yang di-encode di threadpool, supaya list baris besar tidak menahan event loop"""
+    return await run_in_threadpool(lambda: JSONResponse(jsonable_encoder(body), headers=headers))
+
+
+def _cached_response(request, endpoint, started, outcome, etag, body):
+    """Response dengan ETag (304 jika If-None-Match cocok), plus catat metrik cache"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Cache": outcome}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        response_cache.record(endpoint, "not_modified", time.perf_counter() - started)
+        return Response(status_code=304, headers=headers)
+    response_cache.record(endpoint, outcome, time.perf_counter() - started)
+    return body, headers
+
 
 @router.get("/latest/{sensor}")
-def get_latest(sensor: str):
-    """Mendapatkan data terbaru dari sensor"""
+async def get_latest(sensor: str, device: Optional[str] = DEVICE_QUERY):
+    """Mendapatkan data terbaru dari sensor (dari cache memori, DB hanya saat cache miss)"""
     table, columns = validate_sensor(sensor)
+    row = latest_cache.get(sensor, device)
+    if row is not None:
+        return row
+
+    device_sql, device_params = device_filter(device)
 
     try:
-        with get_cursor() as cur:
-            cur.execute(f"""
-                SELECT * FROM {table}
-                ORDER BY timestamp DESC
-                LIMIT 1;
-            """)
-            row = cur.fetchone()
+        async with get_async_cursor() as cur:
+            await cur.execute(latest_query(table, device_sql), device_params)
+            row = await cur.fetchone()
 
         if not row:
             return {"message": f"Belum ada data untuk sensor '{sensor}'"}
 
+        latest_cache.put(sensor, dict(row))
         return row
 
     except Exception as e:
-        raise HTTPException(500, f"Database error: {e}")
+        raise db_error(e)
 
 
 @router.get("/history/{sensor}")
-def get_history(
+@cancel_on_disconnect
+async def get_history(
+    request: Request,
     sensor: str, 
-    range: str,
-    raw: Optional[bool] = Query(False, description="Jika True, ambil semua data tanpa sampling")
+    range: Optional[str] = None,
+    raw: Optional[bool] = Query(False, description="Jika True, ambil data mentah per halaman tanpa sampling"),
+    device: Optional[str] = DEVICE_QUERY,
+    start: Optional[datetime] = Query(None, description="Awal rentang (ISO 8601, UTC jika tanpa zona); menggantikan range"),
+    end: Optional[datetime] = Query(None, description="Akhir rentang, eksklusif (default: sekarang)"),
+    bucket: Optional[str] = Query(None, description="Interval sampling, mis. '15 minutes' (default: mengikuti rentang)"),
+    after: Optional[str] = Query(None, description="Mode raw: cursor next_after dari halaman sebelumnya"),
+    limit: int = Query(HISTORY_PAGE_LIMIT, ge=1, le=HISTORY_MAX_LIMIT, description="Mode raw: jumlah baris per halaman"),
+    points: Optional[int] = Query(None, ge=3, le=DOWNSAMPLE_MAX_POINTS, description="Kecilkan ke maksimal N titik untuk grafik"),
+    method: str = Query("lttb", description="Metode downsampling points: lttb | minmax"),
+    format: str = Query("json", description="json | columnar | binary (lihat columnar.py)"),
 ):
     """
     Mendapatkan history data sensor dengan rentang waktu tertentu.
     
     - **sensor**: nama sensor (dht22, mq2, pzem004t, bh1750)
-    - **range**: rentang waktu (1h, 6h, 12h, 24h, 7d)
-    - **raw**: jika True, ambil semua data tanpa sampling (hati-hati data besar)
+    - **range**: rentang waktu preset (1h, 6h, 12h, 24h, 7d), atau pakai **start**/**end**
+    - **raw**: jika True, ambil data mentah per halaman (`limit` baris); lanjutkan
+      dengan `after=<next_after>` sampai next_after bernilai null
+    - **bucket**: interval sampling untuk mode non-raw
+    - **points**: kecilkan ke maksimal N titik yang mempertahankan puncak
+      (lihat downsample.py), menggantikan bucket/raw
+    - **device**: filter device_id (opsional)
+    - **format**: `columnar` (array per kolom, timestamp epoch ms) atau
+      `binary` (array float yang di-pack) untuk grafik; default `json`
+
+    Rentang preset (tanpa start/end, raw dan points) disejajarkan ke batas
+    interval dan di-cache (lihat response_cache.py); mendukung ETag/If-None-Match.
+    Query dibatasi DB_HISTORY_STATEMENT_TIMEOUT dan dibatalkan jika client
+    memutus koneksi.
     """
+    started = time.perf_counter()
     table, columns = validate_sensor(sensor)
+    if format not in HISTORY_FORMATS:
+        raise HTTPException(400, f"Format tidak valid. Pilihan: {list(HISTORY_FORMATS)}")
+    since, until, delta = _window(range, start, end)
+    device_sql, device_params = device_filter(device)
+    sampled_keys = ["time_bucket", *numeric_columns(columns), "sample_count"]
 
-    if range not in RANGES:
-        raise HTTPException(
-            400,
-            f"Rentang waktu tidak valid. Pilihan: {list(RANGES.keys())}"
+    if points is not None:
+        result = await _downsampled_history(
+            sensor, device, range if start is None else None, table, columns,
+            since, until, device_sql, device_params, points, method
         )
+        response_cache.record("history", "bypass", time.perf_counter() - started)
+        if format != "json":
+            keys = ["time_bucket" if result["source"] != "raw" else "timestamp", *numeric_columns(columns)]
+            return await run_in_threadpool(
+                lambda: _columns_response(result, format, columns_from_dicts(keys, result["data"]))
+            )
+        return await _json_response(result)
+
+    interval = None
+    if not raw:
+        if bucket is not None:
+            width = interval_width(bucket)
+            if width is None:
+                raise HTTPException(400, "bucket tidak valid. Contoh: '30 seconds', '15 minutes', '1 hour', '1 day'")
+            if delta / width > HISTORY_MAX_BUCKETS:
+                raise HTTPException(400, f"Terlalu banyak bucket (maks {HISTORY_MAX_BUCKETS}), perbesar bucket")
+            interval = bucket
+        elif range is not None and start is None:
+            interval = RANGES[range]["interval"]
+        else:
+            # Interval preset terkecil yang rentangnya mencakup window ini
+            fitting = [cfg["interval"] for cfg in RANGES.values() if cfg["delta"] >= delta]
+            interval = fitting[0] if fitting else "1 day"
+    # Sampling dibaca dari rollup paling kasar yang pas dengan interval
+    level = history_level(interval) if ROLLUP_QUERIES and interval else None
+    cursor = _parse_after(after) if raw else None
+
+    if RESPONSE_CACHE and interval and start is None and end is None:
+        since, open_start = _aligned_window(range, interval)
 
-    range_config = RANGES[range]
-    time_limit = datetime.utcnow() - range_config["delta"]
-    interval = range_config["interval"]
+        async def sampled(part_since, part_until):
+            # Koneksi (dan slot query berat) hanya diambil saat bagian ini harus dihitung
+            async with get_async_cursor(DB_HISTORY_STATEMENT_TIMEOUT, heavy=True) as cur:
+                return await _sampled_rows(cur, table, columns, interval, level, part_since, part_until,
+                                           device_sql, device_params)
+
+        try:
+            closed, opened, outcome, etag = await _cached_parts(
+                ("history", sensor, device, interval), sensor, device, since, open_start,
+                lambda: sampled(since, open_start),
+                lambda: sampled(open_start, None),
+            )
+        except Exception as e:
+            raise db_error(e)
+
+        if format != "json":
+            # Representasi berbeda, ETag berbeda
+            etag = f'{etag[:-1]}-{format}"'
+        rows = closed + opened
+        result = _cached_response(request, "history", started, outcome, etag, {
+            "sensor": sensor,
+            "device": device,
+            "range": range,
+            "start": since,
+            "end": None,
+            "sampled": True,
+            "interval": interval,
+            "source": f"rollup_{LEVELS[level][0]}" if level is not None else "raw",
+            "count": len(rows),
+            "limit": None,
+            "next_after": None,
+            "data": rows
+        })
+        if isinstance(result, Response):
+            return result
+        if format != "json":
+            return await run_in_threadpool(
+                lambda: _columns_response(result[0], format, columns_from_dicts(sampled_keys, rows), result[1])
+            )
+        return await _json_response(*result)
+
+    if format != "json" and not interval:
+        return await _raw_columns_history(
+            sensor, device, range if start is None else None, table, columns,
+            since, until, device_sql, device_params, cursor, limit, format, started
+        )
 
     try:
-        with get_cursor() as cur:
-            if interval and not raw:
-                # Query dengan sampling menggunakan time_bucket (TimescaleDB) atau date_trunc
-                # Menggunakan pendekatan yang kompatibel dengan PostgreSQL biasa
-                numeric_cols = [c for c in columns if c not in ["id", "timestamp"]]
-                avg_cols = ", ".join([f"AVG({col}) as {col}" for col in numeric_cols])
-                
-                cur.execute(f"""
-                    SELECT 
-                        to_timestamp(floor(extract(epoch from timestamp) / extract(epoch from interval '{interval}')) * extract(epoch from interval '{interval}'))
-                        AS time_bucket,
-                        {avg_cols},
-                        COUNT(*) as sample_count
-                    FROM {table}
-                    WHERE timestamp >= %s
-                    GROUP BY time_bucket
-                    ORDER BY time_bucket ASC;
-                """, (time_limit,))
+        async with get_async_cursor(DB_HISTORY_STATEMENT_TIMEOUT, heavy=True) as cur:
+            if interval:
+                rows = await _sampled_rows(
+                    cur, table, columns, interval, level, since, until, device_sql, device_params
+                )
             else:
-                # Query tanpa sampling (untuk 1h atau jika raw=True)
-                cur.execute(f"""
-                    SELECT *
-                    FROM {table}
-                    WHERE timestamp >= %s
-                    ORDER BY timestamp ASC;
-                """, (time_limit,))
+                params = [max(since, cursor[0]) if cursor else since]
+                if until:
+                    params.append(until)
+                params.extend(device_params)
+                if cursor:
+                    params.extend(cursor)
+                params.append(limit)
+                await cur.execute(
+                    history_query(table, columns, None, device_sql, until=until is not None, after=cursor is not None),
+                    params
+                )
+                rows = await cur.fetchall()
 
-            rows = cur.fetchall()
+        next_after = None
+        if not interval and len(rows) == limit:
+            last = rows[-1]
+            next_after = f"{last['timestamp'].isoformat()},{last['id']}"
 
-        return {
+        response_cache.record("history", "bypass", time.perf_counter() - started)
+        result = {
             "sensor": sensor,
-            "range": range,
-            "sampled": bool(interval and not raw),
-            "interval": interval if (interval and not raw) else None,
+            "device": device,
+            "range": range if start is None else None,
+            "start": since,
+            "end": until,
+            "sampled": bool(interval),
+            "interval": interval,
+            "source": f"rollup_{LEVELS[level][0]}" if level is not None else "raw",
             "count": len(rows),
+            "limit": None if interval else limit,
+            "next_after": next_after,
             "data": rows
         }
 
     except Exception as e:
-        raise HTTPException(500, f"Database error: {e}")
+        raise db_error(e)
+
+    if format != "json":
+        return await run_in_threadpool(
+            lambda: _columns_response(result, format, columns_from_dicts(sampled_keys, rows))
+        )
+    return await _json_response(result)
+
+
+async def _raw_columns_history(sensor, device, range, table, columns, since, until, device_sql, device_params,
+                         cursor, limit, fmt, started):
+    """
+    Halaman data mentah format columnar/binary: baris tuple dengan timestamp
+    epoch mikrodetik langsung dari PostgreSQL, tanpa dict/datetime per baris
+    """
+    params = [max(since, cursor[0]) if cursor else since]
+    if until:
+        params.append(until)
+    params.extend(device_params)
+    if cursor:
+        params.extend(cursor)
+    params.append(limit)
+    try:
+        async with get_async_cursor(DB_HISTORY_STATEMENT_TIMEOUT, row_factory=tuple_row, heavy=True) as cur:
+            await cur.execute(
+                history_query(table, columns, None, device_sql, until=until is not None,
+                              after=cursor is not None, select=epoch_select(columns)),
+                params
+            )
+            rows = await cur.fetchall()
+    except Exception as e:
+        raise db_error(e)
+
+    next_after = None
+    if len(rows) == limit:
+        last = rows[-1]
+        ts = micros_to_datetime(last[columns.index("timestamp")])
+        next_after = f"{ts.isoformat()},{last[columns.index('id')]}"
+
+    body = {
+        "sensor": sensor,
+        "device": device,
+        "range": range,
+        "start": since,
+        "end": until,
+        "sampled": False,
+        "interval": None,
+        "source": "raw",
+        "count": len(rows),
+        "limit": limit,
+        "next_after": next_after,
+    }
+    result = await run_in_threadpool(lambda: _columns_response(body, fmt, columns_from_tuples(columns, rows)))
+    response_cache.record("history", "bypass", time.perf_counter() - started)
+    return result
+
+
+async def _downsampled_history(sensor, device, range, table, columns, since, until, device_sql, device_params,
+                               points, method):
+    """/history?points=N: jendela diambil utuh (async) lalu dikecilkan dengan NumPy di threadpool"""
+    try:
+        from downsample import METHODS, series_query, downsample_rows
+    except ImportError:
+        raise HTTPException(500, "numpy not installed. Run: pip install numpy")
+    if method not in METHODS:
+        raise HTTPException(400, f"method tidak valid. Pilihan: {list(METHODS)}")
+
+    fields = numeric_columns(columns)
+    query, params, from_rollup = series_query(
+        table, fields, since, until, device_sql, device_params, points, rollup=ROLLUP_QUERIES
+    )
+    try:
+        async with get_async_cursor(DB_HISTORY_STATEMENT_TIMEOUT, row_factory=tuple_row, heavy=True) as cur:
+            await cur.execute(query, params)
+            fetched = await cur.fetchall()
+    except Exception as e:
+        raise db_error(e)
+
+    rows, source, total = await run_in_threadpool(downsample_rows, fetched, fields, from_rollup, points, method)
+    return {
+        "sensor": sensor,
+        "device": device,
+        "range": range,
+        "start": since,
+        "end": until,
+        "sampled": True,
+        "interval": None,
+        "points": points,
+        "method": method,
+        "source": source,
+        "total_points": total,
+        "count": len(rows),
+        "data": rows
+    }
 
 
 @router.get("/stats/{sensor}")
-def get_stats(sensor: str, range: str):
+@cancel_on_disconnect
+async def get_stats(
+    request: Request,
+    response: Response,
+    sensor: str,
+    range: Optional[str] = None,
+    device: Optional[str] = DEVICE_QUERY,
+    start: Optional[datetime] = Query(None, description="Awal rentang (ISO 8601); menggantikan range"),
+    end: Optional[datetime] = Query(None, description="Akhir rentang, eksklusif (default: sekarang)"),
+):
     """
-    Mendapatkan statistik agregasi dari sensor (min, max, avg).
-    Sangat cepat karena hanya menghitung agregat.
+    Mendapatkan statistik agregasi dari sensor (min, max, avg, stddev).
+    Dihitung dari tabel rollup (lihat rollups.py), bukan dari data mentah.
+    Rentang preset disejajarkan ke batas interval dan di-cache seperti /history.
     """
+    started = time.perf_counter()
     table, columns = validate_sensor(sensor)
+    since, until, delta = _window(range, start, end)
+    device_sql, device_params = device_filter(device)
+    level = stats_level(delta) if ROLLUP_QUERIES else None
 
-    if range not in RANGES:
-        raise HTTPException(400, f"Rentang waktu tidak valid. Pilihan: {list(RANGES.keys())}")
+    if RESPONSE_CACHE and start is None and end is None:
+        interval = RANGES[range]["interval"]
+        since, open_start = _aligned_window(range, interval)
+        open_level = stats_level(interval_width(interval)) if ROLLUP_QUERIES else None
 
-    range_config = RANGES[range]
-    time_limit = datetime.utcnow() - range_config["delta"]
-    
-    # Kolom numerik untuk agregasi
-    numeric_cols = [c for c in columns if c not in ["id", "timestamp"]]
-    
-    # Build aggregation query
-    agg_parts = []
-    for col in numeric_cols:
-        agg_parts.extend([
-            f"MIN({col}) as {col}_min",
-            f"MAX({col}) as {col}_max",
-            f"AVG({col}) as {col}_avg"
-        ])
-    agg_query = ", ".join(agg_parts)
+        async def partial(part_level, part_since, part_until):
+            # Koneksi hanya diambil saat bagian ini harus dihitung (hit / 304 tanpa query)
+            async with get_async_cursor(DB_HISTORY_STATEMENT_TIMEOUT, heavy=True) as cur:
+                await cur.execute(*stats_partial_query(
+                    table, columns, part_level, part_since, device_sql, device_params, until=part_until
+                ))
+                return await cur.fetchone()
+
+        try:
+            closed, opened, outcome, etag = await _cached_parts(
+                ("stats", sensor, device), sensor, device, since, open_start,
+                lambda: partial(level, since, open_start),
+                lambda: partial(open_level, open_start, None),
+            )
+        except Exception as e:
+            raise db_error(e)
+
+        result = _cached_response(request, "stats", started, outcome, etag, {
+            "sensor": sensor,
+            "device": device,
+            "range": range,
+            "start": since,
+            "end": None,
+            "source": f"rollup_{LEVELS[level][0]}" if level is not None else "raw",
+            "stats": merge_stats([closed, opened], numeric_columns(columns))
+        })
+        if isinstance(result, Response):
+            return result
+        response.headers.update(result[1])
+        return result[0]
 
     try:
-        with get_cursor() as cur:
-            cur.execute(f"""
-                SELECT 
-                    COUNT(*) as total_records,
-                    MIN(timestamp) as first_record,
-                    MAX(timestamp) as last_record,
-                    {agg_query}
-                FROM {table}
-                WHERE timestamp >= %s;
-            """, (time_limit,))
-            
-            row = cur.fetchone()
+        async with get_async_cursor(DB_HISTORY_STATEMENT_TIMEOUT, heavy=True) as cur:
+            if level is not None:
+                await cur.execute(
+                    *stats_rollup_query(table, columns, level, since, device_sql, device_params, until=until)
+                )
+            else:
+                await cur.execute(
+                    stats_query(table, columns, device_sql, until=until is not None),
+                    (since, *([until] if until else []), *device_params)
+                )
+            row = await cur.fetchone()
 
+        response_cache.record("stats", "bypass", time.perf_counter() - started)
         return {
             "sensor": sensor,
-            "range": range,
+            "device": device,
+            "range": range if start is None else None,
+            "start": since,
+            "end": until,
+            "source": f"rollup_{LEVELS[level][0]}" if level is not None else "raw",
             "stats": row
         }
 
     except Exception as e:
-        raise HTTPException(500, f"Database error: {e}")
+        raise db_error(e)
 
 
 @router.get("/export/{sensor}")
-def export_excel(sensor: str):
+def export_data(
+    sensor: str,
+    device: Optional[str] = DEVICE_QUERY,
+    format: str = Query("xlsx", description="Format file: xlsx | csv | ndjson"),
+    start: Optional[datetime] = Query(None, description="Awal rentang (ISO 8601, opsional)"),
+    end: Optional[datetime] = Query(None, description="Akhir rentang, eksklusif (opsional)"),
+    columns: Optional[str] = Query(None, description="Kolom dipisah koma, mis. timestamp,temperature (default: semua)"),
+    order: str = Query("desc", description="Urutan waktu: desc (terbaru dulu) | asc"),
+):
     """
-    Download semua data history sensor dalam format Excel.
+    Download history data sensor (xlsx, csv atau ndjson).
+
+    Data dibaca per batch lewat server-side cursor dan dikirim bertahap,
+    jadi memori API tetap datar berapapun besar tabelnya (lihat export.py).
     """
-    table, columns = validate_sensor(sensor)
+    table, all_columns = validate_sensor(sensor)
+    if format not in FORMATS:
+        raise HTTPException(400, f"Format tidak valid. Pilihan: {list(FORMATS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(400, "order harus asc atau desc")
+    selected = all_columns
+    if columns:
+        selected = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in selected if c not in all_columns]
+        if unknown or not selected:
+            raise HTTPException(400, f"Kolom tidak dikenal: {unknown}. Pilihan: {all_columns}")
+    start, end = utc_naive(start), utc_naive(end)
+    if start and end and end <= start:
+        raise HTTPException(400, "end harus lebih besar dari start")
+    if format == "xlsx" and not XLSX_AVAILABLE:
+        raise HTTPException(500, "openpyxl not installed. Run: pip install openpyxl")
 
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"{sensor.upper()} History"
-        
-        with get_cursor() as cur:
-            # Fetch all data descending (newest first)
-            col_list = ", ".join(columns)
-            cur.execute(f"SELECT {col_list} FROM {table} ORDER BY timestamp DESC")
-            
-            # Use defined columns order
-            col_names = columns
-            
-            # Style for header
-            header_font = Font(bold=True, color="FFFFFF")
-            header_fill = PatternFill(start_color="0D9488", end_color="0D9488", fill_type="solid")
-            
-            # Write headers
-            for col_idx, col_name in enumerate(col_names, 1):
-                cell = ws.cell(row=1, column=col_idx, value=col_name.upper())
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = Alignment(horizontal="center")
-            
-            # Write data rows
-            row_num = 2
-            while True:
-                rows = cur.fetchmany(1000)
-                if not rows:
-                    break
-                for row in rows:
-                    for col_idx, col_name in enumerate(col_names, 1):
-                        value = row[col_name]
-                        # Format timestamp for better readability
-                        if col_name == 'timestamp' and value:
-                            value = value.strftime('%Y-%m-%d %H:%M:%S') if hasattr(value, 'strftime') else str(value)
-                        ws.cell(row=row_num, column=col_idx, value=value)
-                    row_num += 1
-            
-            # Auto-adjust column widths
-            for col_idx, col_name in enumerate(col_names, 1):
-                ws.column_dimensions[ws.cell(row=1, column=col_idx).column_letter].width = max(len(col_name) + 5, 15)
-        
-        # Save to bytes
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        filename = f"{sensor}_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+    device_sql, device_params = device_filter(device)
+    sql = export_query(table, selected, device_sql, start is not None, end is not None, order)
+    params = (*[ts for ts in (start, end) if ts is not None], *device_params)
 
-    except ImportError:
-        raise HTTPException(500, "openpyxl not installed. Run: pip install openpyxl")
-    except Exception as e:
-        raise HTTPException(500, f"Export error: {e}")
+    media_type, extension = FORMATS[format]
+    prefix = f"{sensor}_{device}" if device else sensor
+    filename = f"{prefix}_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+    return StreamingResponse(
+        stream_export(format, f"{sensor.upper()} History", selected, sql, params, get_conn),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
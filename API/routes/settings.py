@@ -2,23 +2,16 @@
 Settings Router - App settings & notifications endpoints
 """
 import json
-import requests
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
 from database import get_cursor
 from models import SettingsUpdate, TelegramTest
-from utils import DEFAULT_THRESHOLDS
+from notifier import dispatcher, get_telegram_config, invalidate_config
+from utils import DEFAULT_THRESHOLDS, settings_with_defaults
+from .snapshot import invalidate_snapshot
 
 router = APIRouter(tags=["Settings"])
 
 
-def _do_send_telegram(url: str, payload: dict):
-    """Internal helper to send telegram message without blocking API thread"""
-    try:
-        requests.post(url, json=payload, timeout=5)
-    except Exception as e:
-        print(f"Background Telegram Error: {e}")
-
-
 @router.get("/settings")
 def get_settings():
     """Get all application settings including thresholds"""
@@ -31,19 +24,7 @@ def get_settings():
             for row in rows:
                 settings[row['setting_key']] = row['setting_value']
             
-            # Return default if no settings found
-            if not settings.get('thresholds'):
-                settings['thresholds'] = DEFAULT_THRESHOLDS
-            
-            # Get enable_thresholds setting (default to True if not found)
-            if 'enable_thresholds' not in settings:
-                settings['enable_thresholds'] = True
-                
-            # Get telegram_config setting (default dict if not found)
-            if 'telegram_config' not in settings:
-                settings['telegram_config'] = {"bot_token": "", "chat_id": "", "enabled": False}
-            
-            return {"success": True, "settings": settings}
+            return {"success": True, "settings": settings_with_defaults(settings)}
     except Exception as e:
         raise HTTPException(500, f"Error fetching settings: {e}")
 
@@ -127,14 +108,17 @@ def update_settings(settings_data: SettingsUpdate):
             # Fetch the updated thresholds to return
             cur.execute("SELECT setting_value FROM app_settings WHERE setting_key = 'thresholds'")
             result = cur.fetchone()
-            
-            return {
-                "success": True, 
-                "message": "Pengaturan berhasil disimpan",
-                "thresholds": result['setting_value'] if result else thresholds,
-                "enable_thresholds": settings_data.enable_thresholds,
-                "telegram_config": settings_data.telegram_config
-            }
+
+        invalidate_config()
+        invalidate_snapshot()
+
+        return {
+            "success": True, 
+            "message": "Pengaturan berhasil disimpan",
+            "thresholds": result['setting_value'] if result else thresholds,
+            "enable_thresholds": settings_data.enable_thresholds,
+            "telegram_config": settings_data.telegram_config
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -172,59 +156,52 @@ def reset_settings():
                 ON CONFLICT (setting_key) 
                 DO UPDATE SET setting_value = EXCLUDED.setting_value, updated_at = NOW()
             """, (json.dumps(default_telegram_config),))
-            
-            return {
-                "success": True, 
-                "message": "Pengaturan berhasil direset ke default (Notifikasi dinonaktifkan)",
-                "thresholds": DEFAULT_THRESHOLDS,
-                "enable_thresholds": default_enable_thresholds,
-                "telegram_config": default_telegram_config
-            }
+
+        invalidate_config()
+        invalidate_snapshot()
+
+        return {
+            "success": True, 
+            "message": "Pengaturan berhasil direset ke default (Notifikasi dinonaktifkan)",
+            "thresholds": DEFAULT_THRESHOLDS,
+            "enable_thresholds": default_enable_thresholds,
+            "telegram_config": default_telegram_config
+        }
     except Exception as e:
         raise HTTPException(500, f"Error resetting settings: {e}")
 
 
 @router.post("/notify/telegram/test")
-def test_telegram(data: TelegramTest, background_tasks: BackgroundTasks):
+def test_telegram(data: TelegramTest):
     """Test send Telegram message"""
     try:
-        url = f"https://api.telegram.org/bot{data.bot_token}/sendMessage"
-        
         # Simulasikan pesan alert jika diminta
         if "alert" in data.message.lower() or data.message == "test_alert":
             message = "⚠️ *SAMPLE ALERT (TEST)*\nSensor: *DHT22*\nKondisi: *Suhu Tinggi*\nNilai: *36.5 °C* (Batas: 35.0 °C)"
         else:
             message = f"🔔 *TEST KONEKSI SUCCESS*\n\n{data.message}\n\nJika Anda menerima pesan ini, berarti Bot Token dan Chat ID Anda sudah benar! ✅"
 
-        payload = {
-            "chat_id": data.chat_id,
-            "text": message,
-            "parse_mode": "Markdown"
-        }
-        
-        # Use background task to avoid blocking
-        background_tasks.add_task(_do_send_telegram, url, payload)
+        # Dikirim oleh dispatcher di background
+        if not dispatcher.submit(data.bot_token, data.chat_id, message):
+            raise HTTPException(503, "Antrean notifikasi penuh")
         
         return {"success": True, "message": "Permintaan tes terkirim ke antrean background."}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Error queuing message: {e}")
 
 
 @router.post("/notify/telegram/send")
-def send_telegram_alert(data: dict, background_tasks: BackgroundTasks):
+def send_telegram_alert(data: dict):
     """Send generic Telegram alert using stored configuration"""
     try:
         message = data.get("message")
         if not message:
              raise HTTPException(400, "Message is required")
 
-        tg_config = None
-        # Get config from DB and release connection ASAP
-        with get_cursor() as cur:
-            cur.execute("SELECT setting_value FROM app_settings WHERE setting_key = 'telegram_config'")
-            res = cur.fetchone()
-            if res:
-                tg_config = res['setting_value']
+        # Config di-cache, tidak membaca DB per alert
+        tg_config = get_telegram_config()
             
         if not tg_config:
             return {"success": False, "message": "Telegram config not found"}
@@ -238,18 +215,14 @@ def send_telegram_alert(data: dict, background_tasks: BackgroundTasks):
         if not token or not chat_id:
             return {"success": False, "message": "Incomplete Telegram config"}
 
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        payload = {
-            "chat_id": chat_id,
-            "text": message,
-            "parse_mode": "Markdown"
-        }
-        
-        # Dispatch to background
-        background_tasks.add_task(_do_send_telegram, url, payload)
+        # Rate limit, penggabungan burst dan retry ditangani dispatcher
+        if not dispatcher.submit(token, chat_id, message):
+            return {"success": False, "message": "Alert queue full"}
         
         return {"success": True, "message": "Alert queued"}
                 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error queuing alert: {e}")
         raise HTTPException(500, str(e))
@@ -0,0 +1,138 @@
+"""
+Snapshot Router - Semua data awal dashboard dalam satu request
+"""
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+from fastapi import APIRouter, Request, Response
+from database import get_async_cursor
+from config import ROLLUP_QUERIES, SNAPSHOT_CACHE_TTL
+from latest_cache import latest_cache
+from rollups import stats_level, stats_rollup_query
+from utils import TABLES, COLUMNS, RANGES, settings_with_defaults, etag_matches, db_error
+from .sensors import latest_query, stats_query
+
+router = APIRouter(tags=["Snapshot"])
+
+# Rentang statistik ringkasan di snapshot
+SNAPSHOT_RANGE = "24h"
+
+# Bagian snapshot dari DB: {"data", "digest", "expires", "with_latest"}
+_cache = {"data": None, "digest": None, "expires": 0.0, "with_latest": None}
+_lock = asyncio.Lock()
+_stats = {"requests": 0, "not_modified": 0, "db_queries": 0}
+
+
+def invalidate_snapshot():
+    """Paksa snapshot berikutnya membaca DB (dipanggil setelah relay/settings diubah)"""
+    _cache["expires"] = 0.0
+
+
+def snapshot_stats():
+    return dict(_stats)
+
+
+def _subquery(sql):
+    return sql.strip().rstrip(";")
+
+
+def snapshot_query(with_latest, since):
+    """
+    Satu statement yang membangun seluruh snapshot sebagai satu objek JSON:
+    relay, settings, stats per sensor (dari rollup) dan, jika cache /latest
+    belum siap, baris terbaru per sensor. Return (sql, params).
+    """
+    params = []
+    stats_parts = []
+    for sensor, table in TABLES.items():
+        if ROLLUP_QUERIES:
+            sql, sensor_params = stats_rollup_query(
+                table, COLUMNS[sensor], stats_level(RANGES[SNAPSHOT_RANGE]["delta"]), since
+            )
+        else:
+            sql, sensor_params = stats_query(table, COLUMNS[sensor]), [since]
+        stats_parts.append(f"SELECT %s AS sensor, (SELECT row_to_json(s) FROM ({_subquery(sql)}) s) AS value")
+        params += [sensor, *sensor_params]
+
+    latest = "NULL::json"
+    if with_latest:
+        latest_parts = [
+            f"SELECT %s AS sensor, (SELECT row_to_json(l) FROM ({_subquery(latest_query(table))}) l) AS value"
+            for table in TABLES.values()
+        ]
+        params += list(TABLES)
+        latest = f"(SELECT json_object_agg(sensor, value) FROM ({' UNION ALL '.join(latest_parts)}) x)"
+
+    return f"""
+        SELECT json_build_object(
+            'relays', (SELECT COALESCE(json_agg(r ORDER BY r.id), '[]'::json) FROM status_relay r),
+            'settings', (SELECT COALESCE(json_object_agg(setting_key, setting_value), '{{}}'::json) FROM app_settings),
+            'stats', (SELECT json_object_agg(sensor, value) FROM ({' UNION ALL '.join(stats_parts)}) x),
+            'latest', {latest}
+        ) AS snapshot
+    """, params
+
+
+async def _db_part(with_latest):
+    """Bagian snapshot dari DB, dibaca ulang paling sering sekali per SNAPSHOT_CACHE_TTL"""
+    async with _lock:
+        if (_cache["data"] is None or time.monotonic() >= _cache["expires"]
+                or _cache["with_latest"] != with_latest):
+            since = datetime.utcnow() - RANGES[SNAPSHOT_RANGE]["delta"]
+            sql, params = snapshot_query(with_latest, since)
+            async with get_async_cursor() as cur:
+                await cur.execute(sql, params)
+                data = (await cur.fetchone())["snapshot"]
+            _stats["db_queries"] += 1
+
+            data["settings"] = settings_with_defaults(data["settings"])
+            body = json.dumps(data, sort_keys=True, separators=(",", ":"))
+            _cache.update(
+                data=data,
+                digest=hashlib.sha1(body.encode()).hexdigest()[:16],
+                expires=time.monotonic() + SNAPSHOT_CACHE_TTL,
+                with_latest=with_latest,
+            )
+        return _cache["data"], _cache["digest"]
+
+
+@router.get("/snapshot")
+async def get_snapshot(request: Request, response: Response):
+    """
+    Data awal dashboard dalam satu response: nilai terbaru semua sensor,
+    status relay, settings dan statistik 24 jam.
+
+    Paling banyak satu query DB (nol jika bagian DB masih di cache dan
+    nilai terbaru diambil dari cache /latest). Mendukung ETag: kirim
+    If-None-Match untuk mendapat 304 jika tidak ada yang berubah.
+    """
+    _stats["requests"] += 1
+    ready = latest_cache.is_ready()
+
+    try:
+        data, digest = await _db_part(with_latest=not ready)
+    except Exception as e:
+        raise db_error(e)
+
+    if ready:
+        etag = f'"{digest}-{latest_cache.version}"'
+        latest = {sensor: latest_cache.get(sensor) for sensor in TABLES}
+    else:
+        etag = f'"{digest}"'
+        latest = data["latest"]
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return {
+        "latest": latest,
+        "relays": data["relays"],
+        "settings": data["settings"],
+        "stats": data["stats"],
+        "stats_range": SNAPSHOT_RANGE,
+    }
@@ -1,27 +1,30 @@
 """
 Utility functions dan konstanta untuk API Smart Home
 """
+import asyncio
+import functools
 import hashlib
-from datetime import timedelta
-from fastapi import HTTPException
-from database import get_cursor
-from config import DB
-
-# Mapping sensor → nama tabel (hanya nama yang valid, mencegah SQL injection)
-TABLES = {
-    "dht22": "data_dht22",
-    "mq2": "data_mq2",
-    "pzem004t": "data_pzem004t",
-    "bh1750": "data_bh1750"
-}
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException, Response
+from psycopg.errors import QueryCanceled
+from psycopg_pool import PoolTimeout
+from database import get_cursor, record_async_event
+from config import DB, SENSOR_REGISTRY
+from shared.registry import load_registry
 
-# Mapping kolom per sensor (Updated to match DB schema)
-COLUMNS = {
-    "dht22": ["timestamp", "id", "temperature", "humidity"],
-    "mq2": ["timestamp", "id", "gas_lpg", "gas_co", "smoke"],
-    "pzem004t": ["timestamp", "id", "voltage", "current", "power", "energy", "power_factor"],
-    "bh1750": ["timestamp", "id", "lux"]
-}
+# Kolom non-numerik (tidak ikut agregasi)
+KEY_COLUMNS = ["timestamp", "id", "device_id"]
+
+# Definisi sensor dari registry bersama (sensors.json)
+SENSORS = load_registry(SENSOR_REGISTRY)
+
+# Mapping sensor → nama tabel (hanya nama dari registry yang valid, mencegah SQL injection)
+TABLES = {sensor: spec["table"] for sensor, spec in SENSORS.items()}
+
+# Mapping kolom per sensor
+COLUMNS = {sensor: [*KEY_COLUMNS, *spec["fields"]] for sensor, spec in SENSORS.items()}
 
 # Range waktu dengan interval sampling optimal
 RANGES = {
@@ -33,12 +36,7 @@ RANGES = {
 }
 
 # Default threshold settings
-DEFAULT_THRESHOLDS = {
-    "dht22": {"tempMax": 35, "tempMin": 15, "humMax": 80, "humMin": 30},
-    "mq2": {"smokeMax": 500, "smokeWarn": 350, "lpgMax": 1000, "lpgWarn": 500, "coMax": 500, "coWarn": 200},
-    "pzem004t": {"powerMax": 2000, "voltageMin": 180, "voltageMax": 240, "currentMax": 10, "energyMax": 100, "pfMin": 0.85},
-    "bh1750": {"luxMax": 100000, "luxMin": 0}
-}
+DEFAULT_THRESHOLDS = {sensor: dict(spec.get("thresholds", {})) for sensor, spec in SENSORS.items()}
 
 
 def hash_password(password: str) -> str:
@@ -53,77 +51,132 @@ def validate_sensor(sensor: str):
     return TABLES[sensor], COLUMNS[sensor]
 
 
+def numeric_columns(columns):
+    """Kolom nilai sensor (tanpa kolom kunci) untuk agregasi"""
+    return [c for c in columns if c not in KEY_COLUMNS]
+
+
+def settings_with_defaults(settings):
+    """Lengkapi dict app_settings dengan nilai default (thresholds, enable_thresholds, telegram_config)"""
+    # Return default if no settings found
+    if not settings.get('thresholds'):
+        settings['thresholds'] = DEFAULT_THRESHOLDS
+
+    # Get enable_thresholds setting (default to True if not found)
+    if 'enable_thresholds' not in settings:
+        settings['enable_thresholds'] = True
+
+    # Get telegram_config setting (default dict if not found)
+    if 'telegram_config' not in settings:
+        settings['telegram_config'] = {"bot_token": "", "chat_id": "", "enabled": False}
+    return settings
+
+
+def device_filter(device: Optional[str]):
+    """Potongan WHERE untuk filter device beserta parameternya"""
+    if device is None:
+        return "", ()
+    return " AND device_id = %s", (device,)
+
+
+def utc_naive(ts: Optional[datetime]):
+    """Timestamp dengan zona waktu -> UTC naive (kolom timestamp disimpan UTC tanpa zona)"""
+    if ts is not None and ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def etag_matches(header, etag):
+    """True jika header If-None-Match memuat etag (atau *)"""
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def db_error(e, label="Database error"):
+    """
+    HTTPException untuk error query di route async: statement timeout -> 504,
+    pool async penuh -> 503, selain itu 500
+    """
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, QueryCanceled):
+        record_async_event("statement_timeouts")
+        return HTTPException(504, f"Query terlalu lama (statement timeout): {e}")
+    if isinstance(e, PoolTimeout):
+        record_async_event("pool_timeouts")
+        return HTTPException(503, "Database sibuk, coba lagi")
+    return HTTPException(500, f"{label}: {e}")
+
+
+def cancel_on_disconnect(endpoint):
+    """
+    Decorator route async def yang punya parameter `request`: jika client
+    memutus koneksi sebelum response siap, task route dibatalkan (query
+    yang sedang berjalan ikut dibatalkan di server oleh psycopg).
+    Hanya untuk GET (body request tidak dibaca route).
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        receive = kwargs["request"].receive
+
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        task = asyncio.ensure_future(endpoint(*args, **kwargs))
+        watcher = asyncio.ensure_future(disconnected())
+        try:
+            await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            watcher.cancel()
+        if task.done():
+            return task.result()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        record_async_event("cancelled")
+        # Client sudah pergi; status ala nginx "client closed request"
+        return Response(status_code=499)
+
+    return wrapper
+
+
 def init_db():
-    """Inisialisasi database dan tabel users jika belum ada"""
+    """Jalankan migrasi skema lalu isi data default jika belum ada"""
+    from migrations import run_migrations
+
     try:
+        run_migrations()
+
         with get_cursor() as cur:
-            # Create users table if not exists
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL DEFAULT 'user',
-                    is_active BOOLEAN DEFAULT true,
-                    created_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-            
-            # Check for missing columns (migration for existing tables)
-            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='users'")
-            columns = [row['column_name'] for row in cur.fetchall()]
-            
-            if 'is_active' not in columns:
-                cur.execute("ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT true")
-            if 'created_at' not in columns:
-                cur.execute("ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT NOW()")
-            if 'force_password_change' not in columns:
-                cur.execute("ALTER TABLE users ADD COLUMN force_password_change BOOLEAN DEFAULT false")
-            if 'avatar_url' not in columns:
-                cur.execute("ALTER TABLE users ADD COLUMN avatar_url TEXT DEFAULT NULL")
-                
-            print("Database initialized successfully.")
-
-            # Create status_relay table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS status_relay (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    gpio INT,
-                    is_active BOOLEAN DEFAULT false
-                );
-            """)
-            
-            # Create settings table for threshold configurations
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS app_settings (
-                    id SERIAL PRIMARY KEY,
-                    setting_key TEXT UNIQUE NOT NULL,
-                    setting_value JSONB NOT NULL,
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-            
             # Check defaults for status_relay
             cur.execute("SELECT COUNT(*) as count FROM status_relay")
             if cur.fetchone()['count'] == 0:
-                 print("Seeding default status_relay...")
-                 cur.execute("""
-                    INSERT INTO status_relay (id, name, gpio, is_active) VALUES 
+                print("Seeding default status_relay...")
+                cur.execute("""
+                    INSERT INTO status_relay (id, name, gpio, is_active) VALUES
                     (1, 'Lampu Teras', 12, false),
                     (2, 'Pompa Air', 14, false),
                     (3, 'Exhaust Fan', 27, false),
                     (4, 'Door Lock', 26, false)
-                 """)
-            
+                """)
+
             # Check defaults for app_settings (thresholds)
             cur.execute("SELECT COUNT(*) as count FROM app_settings WHERE setting_key = 'thresholds'")
             if cur.fetchone()['count'] == 0:
                 print("Seeding default threshold settings...")
-                import json
                 cur.execute(
                     "INSERT INTO app_settings (setting_key, setting_value) VALUES (%s, %s)",
                     ('thresholds', json.dumps(DEFAULT_THRESHOLDS))
                 )
+
+        print("Database initialized successfully.")
     except Exception as e:
         print(f"Database init error: {e}")
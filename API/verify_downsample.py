@@ -0,0 +1,65 @@
+"""
+Uji downsampling (downsample.py) tanpa database: untuk berbagai jumlah
+baris, field, points, metode dan proporsi NaN, hasil select_indices harus
+
+- tidak lebih dari points (termasuk points kecil dengan banyak field)
+- urut naik tanpa duplikat, titik pertama dan terakhir ikut
+- minmax: nilai minimum dan maksimum global setiap field tetap terbawa
+  (selama budget per field cukup untuk minimal satu bucket)
+
+    python verify_downsample.py [jumlah_kasus_acak]     # default: 2000
+"""
+import sys
+import numpy as np
+from downsample import METHODS, select_indices
+
+SEED = 20240601
+
+
+def check(x, values, points, method):
+    """None jika lolos, selain itu pesan kesalahan"""
+    size, fields = values.shape
+    picked = select_indices(x, values, points, method)
+    if len(picked) > min(points, size):
+        return f"{len(picked)} index > points {points}"
+    if len(picked) and (np.any(np.diff(picked) <= 0) or picked[0] != 0 or picked[-1] != size - 1):
+        return "index tidak urut / ujung tidak ikut"
+    if method == "minmax" and size > points and ((points - 2) // fields - 2) // 2 >= 1:
+        for col in range(fields):
+            y = values[:, col]
+            if np.isnan(y).all():
+                continue
+            if np.nanmin(y) not in y[picked] or np.nanmax(y) not in y[picked]:
+                return f"min/max field {col} hilang"
+    return None
+
+
+def run_test():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = np.random.default_rng(SEED)
+    failed = 0
+    for i in range(cases):
+        size = int(rng.integers(1, 20000))
+        fields = int(rng.integers(1, 6))
+        points = int(rng.choice([3, 4, 5, 7, 10, 50, 300, 1000, 5000]))
+        method = METHODS[i % len(METHODS)]
+        x = np.cumsum(rng.uniform(0.5, 1.5, size))
+        values = rng.normal(size=(size, fields)).cumsum(axis=0)
+        # Sebagian field punya NaN (sensor mati), kadang seluruhnya
+        for col in range(fields):
+            ratio = rng.choice([0, 0, 0.1, 0.9, 1.0])
+            values[rng.random(size) < ratio, col] = np.nan
+        error = check(x, values, points, method)
+        if error:
+            failed += 1
+            if failed <= 10:
+                print(f"  FAIL size={size} fields={fields} points={points} {method}: {error}")
+
+    if failed:
+        print(f"\nFAIL: {failed}/{cases} kasus downsampling salah.")
+        sys.exit(1)
+    print(f"SUCCESS: {cases} kasus acak, jumlah baris hasil selalu <= points.")
+
+
+if __name__ == "__main__":
+    run_test()
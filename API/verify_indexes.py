@@ -0,0 +1,182 @@
+"""
+Uji EXPLAIN: pastikan query di routes/sensors.py memakai index pada tabel besar.
+
+Script membuat schema terpisah (verify_idx) berisi tabel sensor dengan
+VERIFY_ROWS baris (default 10 juta, 1 Hz mundur dari sekarang), membuat
+index yang sama dengan migrasi, lalu menjalankan EXPLAIN untuk setiap
+query /latest, /history (termasuk halaman raw keyset) dan /stats. Gagal jika ada Seq Scan pada tabel
+data atau tidak ada node index sama sekali.
+
+    python verify_indexes.py [sensor]     # default: dht22
+    VERIFY_ROWS=20000000 VERIFY_KEEP=1 python verify_indexes.py pzem004t
+
+VERIFY_KEEP=1 menyimpan schema verify_idx supaya run berikutnya tidak
+perlu mengisi ulang data. VERIFY_PARTITIONED=1 membuat tabelnya sebagai
+tabel partisi (PARTITION_INTERVAL) dan juga memeriksa partition pruning:
+query rentang waktu hanya boleh menyentuh partisi di rentang tersebut
+(Seq Scan pada partisi yang seluruhnya di dalam rentang tidak dianggap gagal).
+
+    VERIFY_PARTITIONED=1 PARTITION_INTERVAL=day VERIFY_ROWS=3000000 python verify_indexes.py
+"""
+import json
+import os
+import sys
+import math
+import time
+from datetime import datetime, timedelta
+from database import get_conn, close_pool
+from config import PARTITION_INTERVAL, HISTORY_PAGE_LIMIT
+from migrations import time_index_ddl, create_index_concurrently
+from partitions import ensure_partitions, next_period, period_start
+from routes.sensors import latest_query, history_query, stats_query
+from utils import TABLES, COLUMNS, RANGES, numeric_columns
+
+SCHEMA = "verify_idx"
+TOTAL_ROWS = int(os.getenv("VERIFY_ROWS", 10_000_000))
+KEEP = os.getenv("VERIFY_KEEP") == "1"
+PARTITIONED = os.getenv("VERIFY_PARTITIONED") == "1"
+PERIOD = timedelta(days=1 if PARTITION_INTERVAL == "day" else 31)
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+def prepare(cur, sensor):
+    table = TABLES[sensor]
+    values = numeric_columns(COLUMNS[sensor])
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    cur.execute(f"SET search_path = {SCHEMA}")
+
+    cur.execute("SELECT to_regclass(%s)", (f"{SCHEMA}.{table}",))
+    if cur.fetchone()[0]:
+        cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.{table}")
+        if cur.fetchone()[0] >= TOTAL_ROWS:
+            print(f"Memakai data yang sudah ada di {SCHEMA}.{table}")
+            return table
+        cur.execute(f"DROP TABLE {SCHEMA}.{table}")
+
+    print(f"Mengisi {TOTAL_ROWS:,} baris ke {SCHEMA}.{table}{' (partisi ' + PARTITION_INTERVAL + ')' if PARTITIONED else ''}...")
+    start = time.perf_counter()
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.{table} (
+            id SERIAL{"" if PARTITIONED else " PRIMARY KEY"},
+            device_id TEXT NOT NULL DEFAULT 'default',
+            {", ".join(f"{col} FLOAT" for col in values)},
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ){" PARTITION BY RANGE (timestamp)" if PARTITIONED else ""}
+    """)
+    if PARTITIONED:
+        now = datetime.utcnow()
+        cur.execute(f"CREATE TABLE {SCHEMA}.{table}_default PARTITION OF {SCHEMA}.{table} DEFAULT")
+        # create_partition memakai savepoint, koneksi ini autocommit
+        cur.execute("BEGIN")
+        ensure_partitions(cur, table, now - timedelta(seconds=TOTAL_ROWS), next_period(period_start(now)))
+        cur.execute("COMMIT")
+    # Urutan insert = urutan waktu, seperti data ingest append-only
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.{table} (device_id, {", ".join(values)}, timestamp)
+        SELECT 'default', {", ".join("random() * 100" for _ in values)},
+               date_trunc('second', now() AT TIME ZONE 'UTC') - make_interval(secs => %s - g)
+        FROM generate_series(1, %s) g
+    """, (TOTAL_ROWS, TOTAL_ROWS))
+    cur.execute(f"""
+        CREATE UNIQUE INDEX uq_{table}_device_ts
+        ON {SCHEMA}.{table} (device_id, timestamp) INCLUDE ({", ".join(values)})
+    """)
+    for name, ddl in time_index_ddl(table):
+        # Index tabel partisi tidak bisa dibuat CONCURRENTLY
+        create_index_concurrently(cur, name, ddl.replace(" CONCURRENTLY", "") if PARTITIONED else ddl)
+    cur.execute(f"VACUUM ANALYZE {SCHEMA}.{table}")
+    print(f"Selesai dalam {time.perf_counter() - start:.1f}s")
+    return table
+
+
+def plan_nodes(plan):
+    """Kumpulkan node plan JSON secara rekursif"""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def check(cur, table, label, sql, params, delta=None):
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    result = cur.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    nodes = plan_nodes(result[0]["Plan"])
+    ours = [n for n in nodes if (n.get("Relation Name") or "").startswith(table)]
+    # Seq Scan yang benar-benar membaca baris (partisi kosong diabaikan)
+    seq_scans = [
+        n for n in ours
+        if n["Node Type"] == "Seq Scan" and n.get("Actual Rows", 0) + n.get("Rows Removed by Filter", 0) > 0
+    ]
+    indexes = sorted({n["Index Name"] for n in nodes if n["Node Type"] in INDEX_NODES})
+    ok = not seq_scans and bool(indexes)
+    detail = f"index={indexes or '-'}"
+
+    if PARTITIONED:
+        # Seq Scan pada partisi yang seluruhnya di dalam rentang memang
+        # plan terbaik; yang diuji adalah pruning: partisi dalam rentang +
+        # partisi default + satu partisi batas. /latest membuka semua
+        # partisi tapi berhenti setelah satu baris (Merge Append + LIMIT).
+        partitions = {n["Relation Name"] for n in ours}
+        limit = math.ceil(delta / PERIOD) + 2 if delta else None
+        ok = bool(indexes) if limit is None else len(partitions) <= limit
+        detail = f"partisi={len(partitions)}{f'/{limit}' if limit else ''} index_scan={len(indexes)} seq_scan={len(seq_scans)}"
+    print(f"  {'OK  ' if ok else 'FAIL'} {label:<32} {result[0]['Execution Time']:>9.1f}ms  {detail}")
+    return ok
+
+
+def run_test():
+    sensor = sys.argv[1] if len(sys.argv) > 1 else "dht22"
+    if sensor not in TABLES:
+        print(f"Sensor tidak dikenal: {sensor}. Pilihan: {list(TABLES)}")
+        sys.exit(2)
+    columns = COLUMNS[sensor]
+
+    with get_conn() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                table = prepare(cur, sensor)
+
+                device_sql = " AND device_id = %s"
+                cases = [
+                    ("latest", latest_query(table), (), None),
+                    ("latest device", latest_query(table, device_sql), ("default",), None),
+                ]
+                for name, cfg in RANGES.items():
+                    since = datetime.utcnow() - cfg["delta"]
+                    delta = cfg["delta"]
+                    cases += [
+                        (f"history {name} sampled", history_query(table, columns, cfg["interval"]), (since,), delta),
+                        (f"history {name} raw page", history_query(table, columns),
+                         (since, HISTORY_PAGE_LIMIT), delta),
+                        (f"history {name} raw after", history_query(table, columns, after=True),
+                         (since + delta / 2, since + delta / 2, 0, HISTORY_PAGE_LIMIT), delta),
+                        (f"history {name} window", history_query(table, columns, cfg["interval"], until=True),
+                         (since, since + delta / 2), delta),
+                        (f"history {name} device", history_query(table, columns, cfg["interval"], device_sql),
+                         (since, "default"), delta),
+                        (f"stats {name}", stats_query(table, columns), (since,), delta),
+                        (f"stats {name} device", stats_query(table, columns, device_sql), (since, "default"), delta),
+                    ]
+
+                print(f"\nEXPLAIN query sensors.py pada {TOTAL_ROWS:,} baris:")
+                results = [check(cur, table, *case) for case in cases]
+
+                if not KEEP:
+                    cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        finally:
+            conn.autocommit = False
+    close_pool()
+
+    failed = results.count(False)
+    what = "memakai index/pruning partisi" if PARTITIONED else "memakai index"
+    if failed:
+        print(f"\nFAIL: {failed}/{len(results)} query tidak {what}.")
+        sys.exit(1)
+    print(f"\nSUCCESS: semua {len(results)} query {what}.")
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,106 @@
+"""
+Uji cache /latest (latest_cache.py).
+
+Script menjalankan LatestCache, mengukur latency lookup cache
+dibandingkan query /latest ke database, lalu selama VERIFY_WATCH detik
+menerima notifikasi dari listener MQTT. Setelah itu isi cache untuk
+setiap sensor dan device harus sama dengan baris terbaru di database.
+
+    python verify_latest_cache.py
+
+    # bersamaan dengan ingest (terminal lain, di folder MQTT):
+    python benchmark.py run --devices 50 --rate 1000 --duration 10
+    VERIFY_WATCH=15 python verify_latest_cache.py
+
+Jalankan pemeriksaan akhir setelah ingest berhenti (VERIFY_WATCH lebih
+lama dari benchmark), karena baris yang masih di-flush writer wajar
+belum ada di cache.
+"""
+import os
+import sys
+import time
+from database import get_cursor, close_pool
+from latest_cache import latest_cache
+from routes.sensors import latest_query
+from utils import TABLES
+
+WATCH = float(os.getenv("VERIFY_WATCH", 0))
+LOOKUPS = int(os.getenv("VERIFY_LOOKUPS", 100_000))
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def db_latest(cur, table, device=None):
+    if device is None:
+        cur.execute(latest_query(table))
+    else:
+        cur.execute(latest_query(table, " AND device_id = %s"), (device,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def run_test():
+    latest_cache.start()
+    if not latest_cache.wait_ready(30):
+        print("FAIL: cache tidak siap dalam 30 detik")
+        sys.exit(1)
+
+    sensors = list(TABLES)
+    keys = [(s, None) for s in sensors] + latest_cache.keys()
+    timings = []
+    for i in range(LOOKUPS):
+        sensor, device = keys[i % len(keys)]
+        start = time.perf_counter()
+        latest_cache.get(sensor, device)
+        timings.append((time.perf_counter() - start) * 1e6)
+    print(f"Lookup cache  : {LOOKUPS:,} kali, p50={percentile(timings, 50):.2f}us "
+          f"p99={percentile(timings, 99):.2f}us")
+
+    timings = []
+    with get_cursor() as cur:
+        for i in range(min(LOOKUPS, 2000)):
+            sensor, device = keys[i % len(keys)]
+            start = time.perf_counter()
+            db_latest(cur, TABLES[sensor], device)
+            timings.append((time.perf_counter() - start) * 1e6)
+    print(f"Query DB      : {len(timings):,} kali, p50={percentile(timings, 50):.0f}us "
+          f"p99={percentile(timings, 99):.0f}us")
+
+    if WATCH:
+        print(f"Menunggu notifikasi selama {WATCH:.0f} detik...")
+        time.sleep(WATCH)
+
+    mismatches = 0
+    checked = 0
+    with get_cursor() as cur:
+        for sensor, device in [(s, None) for s in sensors] + sorted(latest_cache.keys()):
+            expected = db_latest(cur, TABLES[sensor], device)
+            cached = latest_cache.get(sensor, device)
+            checked += 1
+            if expected is None or cached is None:
+                if expected is not cached:
+                    mismatches += 1
+                    print(f"  FAIL {sensor}/{device or '*'}: db={expected} cache={cached}")
+                continue
+            # Baris dengan timestamp sama dari device berbeda boleh mana saja
+            if expected["timestamp"] != cached["timestamp"] or (
+                    device is not None and expected["id"] != cached["id"]):
+                mismatches += 1
+                print(f"  FAIL {sensor}/{device or '*'}: db={expected['timestamp']} cache={cached['timestamp']}")
+
+    stats = latest_cache.stats()
+    latest_cache.stop()
+    close_pool()
+    print(f"Cache         : {stats}")
+
+    if mismatches:
+        print(f"\nFAIL: {mismatches}/{checked} entri cache berbeda dengan database.")
+        sys.exit(1)
+    print(f"\nSUCCESS: {checked} entri cache sama dengan database.")
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,80 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from notifier import TelegramDispatcher
+
+# Stand-in lokal untuk api.telegram.org: catat request, kadang balas 429/500
+received = []
+fail_plan = {"429": 1, "500": 1}
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if fail_plan["429"]:
+            fail_plan["429"] -= 1
+            self._reply(429, {"ok": False, "parameters": {"retry_after": 1}})
+            return
+        if fail_plan["500"]:
+            fail_plan["500"] -= 1
+            self._reply(500, {"ok": False})
+            return
+        received.append((time.monotonic(), body))
+        self._reply(200, {"ok": True})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_test():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Fake Telegram di {url}")
+
+    dispatcher = TelegramDispatcher(api_url=url, rate_per_sec=1, burst=1, backoff_base=0.2).start()
+
+    # Burst 30 alert ke chat yang sama (seperti verify_api.py, tapi 3x lipat)
+    print("\nMengirim burst 30 alert...")
+    for i in range(30):
+        dispatcher.submit("TOKEN", "42", f"Test Alert {i}")
+
+    deadline = time.monotonic() + 30
+    while dispatcher.stats()["delivered"] + dispatcher.stats()["failed"] < 30 and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+    stats = dispatcher.stats()
+    dispatcher.stop()
+    server.shutdown()
+
+    print(f"Statistik: {stats}")
+    print(f"Request sukses ke Telegram: {len(received)}")
+    gaps = [b[0] - a[0] for a, b in zip(received, received[1:])]
+    if gaps:
+        print(f"Jarak minimum antar pesan: {min(gaps):.2f}s")
+
+    ok = (
+        stats["delivered"] == 30
+        and stats["retries"] >= 2
+        and len(received) < 30
+        and all(g >= 0.9 for g in gaps)
+    )
+    if ok:
+        print("SUCCESS: burst digabung, rate limit dipatuhi, retry berjalan.")
+    else:
+        print("FAIL: perilaku dispatcher tidak sesuai.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_test()
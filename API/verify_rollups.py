@@ -0,0 +1,157 @@
+"""
+Uji rollup: /history dan /stats dari tabel rollup harus sama dengan
+query mentah pada rentang yang sama.
+
+Untuk setiap sensor dan setiap RANGES (sampai sekarang, dan sebagai
+jendela start/end yang tidak sejajar menit), script menjalankan query rollup
+(rollups.py) dan query mentah (routes/sensors.py), membandingkan
+hasilnya (jumlah sampel, min/max persis, avg/stddev dengan toleransi
+float), lalu mencetak jumlah baris yang dibaca masing-masing plan dari
+EXPLAIN ANALYZE.
+
+    python verify_rollups.py [sensor ...]      # default: semua sensor
+    VERIFY_DEVICE=esp32-dapur python verify_rollups.py dht22
+
+Jalankan setelah ada data (mis. MQTT/benchmark.py run) supaya jalur
+insert listener ikut teruji.
+
+Kasus horizon: dalam transaksi yang di-rollback, rollup 1m yang lebih tua
+dari HORIZON_DAYS hari dihapus (seperti prune_rollups) lalu jendela 7d yang
+melewati horizon itu dibandingkan lagi dengan data mentah.
+"""
+import json
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+import rollups
+from database import get_cursor, close_pool
+from rollups import LEVELS, history_level, stats_level, history_rollup_query, stats_rollup_query, minute_horizon
+from routes.sensors import history_query, stats_query
+from utils import TABLES, COLUMNS, RANGES, numeric_columns
+
+DEVICE = os.getenv("VERIFY_DEVICE")
+SCAN_NODES = {"Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan"}
+# Retensi rollup 1m untuk kasus horizon (harus lebih pendek dari jendela 7d)
+HORIZON_DAYS = 3
+
+
+def rows_read(cur, sql, params):
+    """Jumlah baris yang dibaca node scan (lolos filter + dibuang filter)"""
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    plan = list(cur.fetchone().values())[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    def walk(node):
+        total = 0
+        if node["Node Type"] in SCAN_NODES:
+            loops = node.get("Actual Loops", 1)
+            total += (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * loops
+        return total + sum(walk(child) for child in node.get("Plans", []))
+    return walk(plan[0]["Plan"])
+
+
+def same(a, b):
+    """Angka dibandingkan dengan toleransi float (urutan penjumlahan berbeda), selain itu harus persis"""
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+    return a == b
+
+
+def compare_rows(expected, actual, columns):
+    if len(expected) != len(actual):
+        return f"jumlah baris {len(expected)} != {len(actual)}"
+    for e, a in zip(expected, actual):
+        for key in columns:
+            if not same(e[key], a[key]):
+                return f"{key}: {e[key]} != {a[key]} ({e.get('time_bucket', '')})"
+    return None
+
+
+def check_window(cur, table, columns, name, interval, since, until, device_sql, device_params):
+    """Bandingkan history dan stats rollup dengan query mentah untuk satu jendela; return [ok history, ok stats]"""
+    values = numeric_columns(columns)
+    results = []
+    raw_params = (since, *([until] if until else []), *device_params)
+
+    level = history_level(interval)
+    sql, params = history_rollup_query(table, columns, interval, level, since,
+                                       device_sql, device_params, until=until)
+    raw_sql = history_query(table, columns, interval, device_sql, until=until is not None)
+    cur.execute(sql, params)
+    actual = cur.fetchall()
+    cur.execute(raw_sql, raw_params)
+    expected = cur.fetchall()
+    error = compare_rows(expected, actual, ["time_bucket", *values, "sample_count"])
+    results.append(error is None)
+    print(f"  {'OK  ' if error is None else 'FAIL'} history {name:<6} rollup_{LEVELS[level][0]}"
+          f"  baris dibaca {rows_read(cur, raw_sql, raw_params):>9,} -> {rows_read(cur, sql, params):>5,}"
+          f"{'  ' + error if error else ''}")
+
+    level = stats_level((until or datetime.utcnow()) - since)
+    sql, params = stats_rollup_query(table, columns, level, since, device_sql, device_params, until=until)
+    raw_sql = stats_query(table, columns, device_sql, until=until is not None)
+    cur.execute(sql, params)
+    actual = cur.fetchall()
+    cur.execute(raw_sql, raw_params)
+    expected = cur.fetchall()
+    error = compare_rows(expected, actual, [
+        "total_records", "first_record", "last_record",
+        *[f"{v}_{agg}" for v in values for agg in ("min", "max", "avg", "stddev")],
+    ])
+    results.append(error is None)
+    print(f"  {'OK  ' if error is None else 'FAIL'} stats   {name:<6} rollup_{LEVELS[level][0]}"
+          f"  baris dibaca {rows_read(cur, raw_sql, raw_params):>9,} -> {rows_read(cur, sql, params):>5,}"
+          f"{'  ' + error if error else ''}")
+    return results
+
+
+def run_test():
+    sensors = sys.argv[1:] or list(TABLES)
+    device_sql, device_params = (" AND device_id = %s", (DEVICE,)) if DEVICE else ("", ())
+    results = []
+
+    with get_cursor() as cur:
+        for sensor in sensors:
+            table, columns = TABLES[sensor], COLUMNS[sensor]
+            cur.execute(f"SELECT COUNT(*) AS n FROM {table}")
+            print(f"\n{sensor} ({table}, {cur.fetchone()['n']:,} baris mentah)")
+
+            windows = []
+            for name, cfg in RANGES.items():
+                since = datetime.utcnow() - cfg["delta"]
+                windows.append((name, cfg, since, None))
+                # Jendela start/end sembarang: kedua ujung jatuh di tengah menit
+                windows.append((f"{name}/w", cfg, since, since + cfg["delta"] * 0.6 + timedelta(seconds=17.3)))
+
+            for name, cfg, since, until in windows:
+                results += check_window(cur, table, columns, name, cfg["interval"], since, until,
+                                        device_sql, device_params)
+
+            # Rollup 1m sebelum horizon sudah dipangkas: bagian itu harus dibaca dari data mentah
+            retention = rollups.ROLLUP_MINUTE_RETENTION_DAYS
+            rollups.ROLLUP_MINUTE_RETENTION_DAYS = HORIZON_DAYS
+            try:
+                cur.execute(f"DELETE FROM {table}_{LEVELS[0][0]} WHERE bucket < %s", (minute_horizon(),))
+                delta = RANGES["7d"]["delta"]
+                since = datetime.utcnow() - delta
+                until = since + delta * 0.6 + timedelta(seconds=17.3)
+                for name, interval, end in (("7d/h", "1 day", None), ("7d/hw", "1 day", until),
+                                            ("10m/h", "10 minutes", None), ("10m/hw", "10 minutes", until)):
+                    results += check_window(cur, table, columns, name, interval, since, end,
+                                            device_sql, device_params)
+            finally:
+                rollups.ROLLUP_MINUTE_RETENTION_DAYS = retention
+                cur.connection.rollback()
+    close_pool()
+
+    failed = results.count(False)
+    if failed:
+        print(f"\nFAIL: {failed}/{len(results)} query rollup berbeda dengan data mentah.")
+        sys.exit(1)
+    print(f"\nSUCCESS: semua {len(results)} query rollup sama dengan data mentah.")
+
+
+if __name__ == "__main__":
+    run_test()
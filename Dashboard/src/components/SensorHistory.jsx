@@ -35,6 +35,9 @@ const SENSORS = [
     { id: 'bh1750', name: 'Cahaya (BH1750)' },
 ];
 
+// Jumlah titik maksimal per grafik (/history?points=N, puncak tetap terlihat)
+const CHART_POINTS = 500;
+
 const RANGES = [
     { id: '1h', name: '1 Jam Terakhir' },
     { id: '6h', name: '6 Jam Terakhir' },
@@ -60,7 +63,7 @@ export default function SensorHistory() {
         setError(null);
         try {
             // Fetch History Data
-            const historyRes = await fetch(`${API_BASE_URL}/history/${selectedSensor}?range=${selectedRange}`);
+            const historyRes = await fetch(`${API_BASE_URL}/history/${selectedSensor}?range=${selectedRange}&points=${CHART_POINTS}`);
             if (!historyRes.ok) throw new Error('Gagal mengambil data history');
             const historyJson = await historyRes.json();
             setHistoryData(historyJson.data || []);
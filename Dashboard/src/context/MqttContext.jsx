@@ -32,6 +32,24 @@ export function MqttProvider({ children }) {
     bh1750: { lux: [], time: [] },
   }));
 
+  const updateSettings = useCallback((newSettings) => {
+    setSettings((prev) => {
+      const merged = {
+        ...prev,
+        ...newSettings,
+        topics: newSettings.topics
+          ? { ...prev.topics, ...newSettings.topics }
+          : prev.topics,
+        thresholds: newSettings.thresholds
+          ? { ...prev.thresholds, ...newSettings.thresholds }
+          : prev.thresholds,
+      };
+
+      localStorage.setItem("mqttSettings", JSON.stringify(merged));
+      return merged;
+    });
+  }, []);
+
   const [relayStates, setRelayStates] = useState({
     1: false,
     2: false,
@@ -39,25 +57,33 @@ export function MqttProvider({ children }) {
     4: false,
   });
 
-  // Fetch initial relay states from database on mount
+  // Fetch initial relay states and settings in one request on mount.
+  // /snapshot sends an ETag, so the browser revalidates with a cheap 304 on reload.
   useEffect(() => {
-    const fetchRelayStates = async () => {
+    const fetchSnapshot = async () => {
       try {
-        const res = await fetch(`${API_BASE_URL}/relays`);
+        const res = await fetch(`${API_BASE_URL}/snapshot`);
         if (res.ok) {
           const data = await res.json();
           const states = {};
-          data.forEach((relay) => {
+          data.relays.forEach((relay) => {
             states[relay.id] = relay.is_active;
           });
           setRelayStates((prev) => ({ ...prev, ...states }));
+          if (data.settings) {
+            updateSettings({
+              thresholds: data.settings.thresholds || {},
+              enableThresholds: data.settings.enable_thresholds ?? true,
+              telegramConfig: data.settings.telegram_config || { bot_token: "", chat_id: "", enabled: false },
+            });
+          }
         }
       } catch (err) {
-        console.error("Failed to fetch initial relay states:", err);
+        console.error("Failed to fetch initial snapshot:", err);
       }
     };
-    fetchRelayStates();
-  }, []);
+    fetchSnapshot();
+  }, [updateSettings]);
 
   const [history, setHistory] = useState(() => {
     const saved = localStorage.getItem("history");
@@ -155,22 +181,8 @@ export function MqttProvider({ children }) {
     setNotifications([]);
   }, []);
 
-  // Check thresholds and trigger notifications
-  const sendTelegramAlert = useCallback(async (message) => {
-    // Check if thresholds are globally enabled AND telegram is specifically enabled
-    if (!settings.enableThresholds || !settings.telegramConfig?.enabled) return;
-
-    try {
-      await fetch(`${API_BASE_URL}/notify/telegram/send`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message })
-      });
-    } catch (err) {
-      console.error("Failed to send telegram alert:", err);
-    }
-  }, [settings.telegramConfig]);
-
+  // Check thresholds and trigger local notifications.
+  // Telegram alerts are sent once by the MQTT listener (server-side), not per tab.
   const checkThresholds = useCallback((sensor, data) => {
     // Ensure we respect the global enable switch
     if (!settings.enableThresholds) return;
@@ -207,9 +219,8 @@ export function MqttProvider({ children }) {
           addNotification(msg.replace(/\*/g, ''), 'warning', sensor.toUpperCase());
         }
 
-        // Telegram Alert (with cooldown)
+        // History entry (with cooldown)
         if (!lastAlertRef.current[alertKey] || now - lastAlertRef.current[alertKey] > ALERT_COOLDOWN) {
-          sendTelegramAlert(msg);
           lastAlertRef.current[alertKey] = now;
           addHistoryEntry(`${sensor.toUpperCase()}: ${label} ${type === 'max' ? '>' : '<'} ${numLimit}`, 'Alert', 'text-red-600');
         }
@@ -255,7 +266,7 @@ export function MqttProvider({ children }) {
         break;
       }
     }
-  }, [settings, addNotification, addHistoryEntry, sendTelegramAlert]);
+  }, [settings, addNotification, addHistoryEntry]);
 
   const setupNewConnection = useCallback((isManualReconnect = false) => {
     if (isManualReconnect) {
@@ -615,24 +626,6 @@ export function MqttProvider({ children }) {
     [isConnected, relayStates, settings.topics.relay_cmd, addHistoryEntry]
   );
 
-  const updateSettings = useCallback((newSettings) => {
-    setSettings((prev) => {
-      const merged = {
-        ...prev,
-        ...newSettings,
-        topics: newSettings.topics
-          ? { ...prev.topics, ...newSettings.topics }
-          : prev.topics,
-        thresholds: newSettings.thresholds
-          ? { ...prev.thresholds, ...newSettings.thresholds }
-          : prev.thresholds,
-      };
-
-      localStorage.setItem("mqttSettings", JSON.stringify(merged));
-      return merged;
-    });
-  }, []);
-
   useEffect(() => {
     const cleanup = connect();
     return cleanup;
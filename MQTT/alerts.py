@@ -0,0 +1,273 @@
+"""
+Evaluator threshold di sisi server.
+
+Threshold dari tabel app_settings di-cache di memori dan dimuat ulang
+saat updated_at berubah (dicek tiap SETTINGS_RELOAD_INTERVAL). Setiap
+pembacaan dievaluasi terhadap rule sensor tersebut (jumlah rule per
+sensor tetap, jadi O(1) per rule). State breach per
+(sensor, device, metric, level) dengan hysteresis: alert dikirim sekali
+saat nilai masuk kondisi breach, dan baru bisa terkirim lagi setelah
+nilai kembali melewati batas sejauh pita hysteresis.
+
+Sumber kebenaran state breach adalah kolom alert_state.active (tabel
+dibuat oleh init_db.py dari config.TABLES). Klaim kirim bersifat atomik
+dan hanya berhasil bila breach belum aktif dan cooldown sudah lewat,
+sehingga walaupun ada beberapa proses worker (mode multi-proses) satu
+breach tetap menghasilkan satu alert. Set _active di memori hanya cache
+dari baris aktif dan disinkronkan ulang tiap SETTINGS_RELOAD_INTERVAL,
+supaya nilai yang kembali normal di worker mana pun ikut menutup breach
+yang dibuka worker lain. Alert yang lolos
+klaim dikirim lewat TelegramDispatcher (shared/telegram.py): rate limit per chat,
+penggabungan burst dan retry/backoff.
+"""
+import queue
+import re
+import threading
+from config import (
+    SENSORS, NOTIFY_QUEUE_SIZE, NOTIFY_RATE_PER_SEC, NOTIFY_BURST, NOTIFY_MAX_RETRIES, NOTIFY_BACKOFF_BASE
+)
+from database import get_conn
+from shared.telegram import TelegramDispatcher
+from shared.registry import alert_rules
+
+# (metric, threshold key, arah, level, label, unit) — dari registry sensor, sama dengan MqttContext.jsx
+RULES = alert_rules(SENSORS)
+
+# Karakter entity parse_mode Markdown (legacy) Telegram
+_MARKDOWN_SPECIAL = re.compile(r"([_*`\[])")
+
+
+def escape_markdown(text):
+    """Escape nama dari luar (device_id, sensor, label) supaya tidak merusak format Markdown"""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", str(text))
+
+
+class AlertEngine:
+    def __init__(self, reload_interval=5, cooldown=60, hysteresis_pct=2.0,
+                 telegram_api_url="https://api.telegram.org", default_device_id="default"):
+        self.reload_interval = reload_interval
+        self.cooldown = cooldown
+        self.hysteresis_pct = hysteresis_pct
+        self.default_device_id = default_device_id
+
+        self.enabled = False
+        self.telegram = {}
+        # sensor -> [(metric, key, arah, level, label, unit, limit, band)]
+        self._rules = {}
+        self._version = None
+
+        # Cache alert_key yang aktif di alert_state
+        self._active = set()
+        self._lock = threading.Lock()
+        self._outbox = queue.Queue(maxsize=1000)
+        self.dispatcher = TelegramDispatcher(
+            api_url=telegram_api_url, queue_size=NOTIFY_QUEUE_SIZE, rate_per_sec=NOTIFY_RATE_PER_SEC,
+            burst=NOTIFY_BURST, max_retries=NOTIFY_MAX_RETRIES, backoff_base=NOTIFY_BACKOFF_BASE,
+        )
+        self._stop = threading.Event()
+        self._threads = []
+
+        self._stats = {"evaluated": 0, "breaches": 0, "dispatched": 0, "suppressed": 0, "send_errors": 0, "reloads": 0}
+
+    # ---- Settings ----
+
+    def load_settings(self):
+        """Muat threshold, enable_thresholds dan telegram_config dari app_settings"""
+        try:
+            with get_conn() as conn:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT setting_key, setting_value, updated_at FROM app_settings")
+                        rows = cur.fetchall()
+                        cur.execute("SELECT alert_key FROM alert_state WHERE active")
+                        active = {key for (key,) in cur.fetchall()}
+        except Exception as e:
+            print("[alert] Gagal memuat settings:", e)
+            return False
+
+        settings = {key: value for key, value, _ in rows}
+        self._version = max((updated for _, _, updated in rows), default=None)
+        self.enabled = bool(settings.get("enable_thresholds", True))
+        self.telegram = settings.get("telegram_config") or {}
+        self._rules = self._compile(settings.get("thresholds") or {})
+        with self._lock:
+            self._active = active
+        self._stats["reloads"] += 1
+        print(f"[alert] Settings dimuat (threshold {'aktif' if self.enabled else 'nonaktif'})")
+        return True
+
+    def _compile(self, thresholds):
+        compiled = {}
+        for sensor, rules in RULES.items():
+            limits = thresholds.get(sensor) or {}
+            for metric, key, direction, level, label, unit in rules:
+                limit = limits.get(key)
+                if limit is None or limit == "":
+                    continue
+                try:
+                    limit = float(limit)
+                except (TypeError, ValueError):
+                    continue
+                band = abs(limit) * self.hysteresis_pct / 100
+                compiled.setdefault(sensor, []).append((metric, key, direction, level, label, unit, limit, band))
+        return compiled
+
+    def _settings_version(self):
+        with get_conn() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT MAX(updated_at) FROM app_settings")
+                    return cur.fetchone()[0]
+
+    def _sync_active(self):
+        """Samakan cache breach aktif dengan alert_state (bisa diubah worker lain)"""
+        with get_conn() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT alert_key FROM alert_state WHERE active")
+                    active = {key for (key,) in cur.fetchall()}
+        with self._lock:
+            self._active = active
+
+    def _reload_loop(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                if self._settings_version() != self._version:
+                    self.load_settings()
+                else:
+                    self._sync_active()
+            except Exception as e:
+                print("[alert] Gagal cek perubahan settings:", e)
+
+    # ---- Evaluasi ----
+
+    def evaluate(self, sensor, device_id, values):
+        """Cek satu pembacaan terhadap semua rule sensor tersebut"""
+        if not self.enabled:
+            return
+        rules = self._rules.get(sensor)
+        if not rules:
+            return
+
+        self._stats["evaluated"] += 1
+        for metric, key, direction, level, label, unit, limit, band in rules:
+            value = values.get(metric)
+            if value is None:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+
+            if direction == "max":
+                breach, cleared = value > limit, value <= limit - band
+            else:
+                breach, cleared = value < limit, value >= limit + band
+
+            alert_key = f"{sensor}:{device_id}:{key}"
+            with self._lock:
+                if alert_key in self._active:
+                    if cleared:
+                        self._active.discard(alert_key)
+                        self._enqueue(alert_key, None)
+                    continue
+                if not breach:
+                    continue
+                self._active.add(alert_key)
+
+            self._stats["breaches"] += 1
+            self._emit(sensor, device_id, key, direction, level, label, unit, value, limit)
+
+    def _emit(self, sensor, device_id, key, direction, level, label, unit, value, limit):
+        title = sensor.upper()
+        if device_id != self.default_device_id:
+            title = f"{title} ({device_id})"
+        kondisi = "tinggi" if direction == "max" else "rendah"
+        print(f"[alert] PERINGATAN {title}: {label} {kondisi}: {value:g}{unit} (Batas: {limit:g}{unit})")
+        title, label, unit = escape_markdown(title), escape_markdown(label), escape_markdown(unit)
+        message = f"⚠️ *PERINGATAN {title}*\n{label} {kondisi}: *{value:g}{unit}* (Batas: {limit:g}{unit})"
+        self._enqueue(f"{sensor}:{device_id}:{key}", message)
+
+    def _enqueue(self, alert_key, message):
+        """message None berarti breach selesai (nonaktifkan baris alert_state)"""
+        try:
+            self._outbox.put_nowait((alert_key, message))
+        except queue.Full:
+            self._stats["suppressed"] += 1
+
+    # ---- Pengiriman ----
+
+    def _claim(self, alert_key):
+        """Klaim hak kirim alert secara atomik (antar proses): breach belum aktif dan cooldown lewat"""
+        with get_conn() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO alert_state (alert_key, last_sent, active) VALUES (%s, NOW(), true)
+                        ON CONFLICT (alert_key) DO UPDATE SET last_sent = NOW(), active = true
+                        WHERE NOT alert_state.active
+                          AND alert_state.last_sent < NOW() - make_interval(secs => %s)
+                        RETURNING 1
+                    """, (alert_key, self.cooldown))
+                    return cur.fetchone() is not None
+
+    def _release(self, alert_key):
+        """Tandai breach selesai supaya alert berikutnya bisa diklaim"""
+        with get_conn() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "UPDATE alert_state SET active = false WHERE alert_key = %s AND active",
+                        (alert_key,),
+                    )
+
+    def _send_loop(self):
+        while not self._stop.is_set():
+            try:
+                alert_key, message = self._outbox.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            try:
+                if message is None:
+                    self._release(alert_key)
+                    continue
+                if not self._claim(alert_key):
+                    self._stats["suppressed"] += 1
+                    continue
+            except Exception as e:
+                self._stats["send_errors"] += 1
+                print("[alert] Gagal update alert_state:", e)
+                continue
+
+            token = self.telegram.get("bot_token")
+            chat_id = self.telegram.get("chat_id")
+            if not self.telegram.get("enabled") or not token or not chat_id:
+                continue
+            # Rate limit, penggabungan burst dan retry ditangani dispatcher
+            if self.dispatcher.submit(token, chat_id, message):
+                self._stats["dispatched"] += 1
+            else:
+                self._stats["send_errors"] += 1
+
+    def start(self):
+        """Jalankan thread hot-reload settings, pengirim alert dan dispatcher Telegram"""
+        self.dispatcher.start()
+        for target, name in ((self._reload_loop, "alert-reload"), (self._send_loop, "alert-send")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        self.dispatcher.stop()
+
+    def stats(self):
+        s = dict(self._stats)
+        s["active_breaches"] = len(self._active)
+        s["telegram"] = self.dispatcher.stats()
+        return s
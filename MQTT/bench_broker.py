@@ -0,0 +1,220 @@
+"""
+Broker MQTT 3.1.1 / 5 minimal sebagai pengganti mosquitto lokal untuk benchmark.
+
+Hanya yang dibutuhkan benchmark: CONNECT, SUBSCRIBE/UNSUBSCRIBE dengan
+wildcard +/#, PUBLISH (QoS 1 dibalas PUBACK, diteruskan sebagai QoS 0),
+PINGREQ dan DISCONNECT. Client MQTT 5 dilayani dengan properties kosong
+(properties dari client diabaikan), dan shared subscription
+$share/<group>/<filter> dibagi round-robin antar anggota group seperti
+default mosquitto (mode multi-proses main.py). Tidak ada retained message,
+sesi persisten maupun auth (pakai mosquitto sungguhan untuk itu).
+"""
+import asyncio
+import struct
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    """Cocokkan topic dengan filter subscription (wildcard + dan #)"""
+    filter_levels = topic_filter.split("/")
+    levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(levels) or (level != "+" and level != levels[i]):
+            return False
+    return len(filter_levels) == len(levels)
+
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        digit, n = n % 128, n // 128
+        out.append(digit | 0x80 if n else digit)
+        if not n:
+            return bytes(out)
+
+
+def _packet(packet_type, body, flags=0):
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+def _varint(data, offset):
+    """Variable byte integer (panjang properties MQTT 5) -> (nilai, offset berikutnya)"""
+    value, multiplier = 0, 1
+    while True:
+        digit = data[offset]
+        offset += 1
+        value += (digit & 0x7F) * multiplier
+        multiplier *= 128
+        if not digit & 0x80:
+            return value, offset
+
+
+def _skip_properties(data, offset, version):
+    if version < 5:
+        return offset
+    length, offset = _varint(data, offset)
+    return offset + length
+
+
+def _string(data, offset):
+    (size,) = struct.unpack_from(">H", data, offset)
+    return data[offset + 2:offset + 2 + size].decode(), offset + 2 + size
+
+
+class StandInBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        # writer -> set(filter) ; writer -> protocol level (4 = 3.1.1, 5)
+        self._clients = {}
+        self._versions = {}
+        # (group, filter) -> jumlah pesan yang sudah dibagi (round-robin)
+        self._shared_next = {}
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stats = {"connections": 0, "published": 0, "delivered": 0}
+
+    def start(self):
+        """Jalankan broker di thread sendiri; port 0 = port acak (lihat self.port)"""
+        self._thread = threading.Thread(target=self._run, name="bench-broker", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def subscriptions(self):
+        return sum(len(filters) for filters in list(self._clients.values()))
+
+    def stats(self):
+        s = dict(self._stats)
+        s["clients"] = len(self._clients)
+        return s
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _shutdown(self):
+        self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def _read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            digit = (await reader.readexactly(1))[0]
+            length += (digit & 0x7F) * multiplier
+            multiplier *= 128
+            if not digit & 0x80:
+                break
+        return header >> 4, header & 0x0F, await reader.readexactly(length)
+
+    async def _serve(self, reader, writer):
+        self._clients[writer] = set()
+        self._versions[writer] = 4
+        self._stats["connections"] += 1
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                version = self._versions[writer]
+                # MQTT 5: ack membawa properties (kosong)
+                no_properties = b"\x00" if version >= 5 else b""
+                if packet_type == CONNECT:
+                    _, offset = _string(body, 0)
+                    self._versions[writer] = body[offset]
+                    writer.write(_packet(CONNACK, b"\x00\x00" + (b"\x00" if body[offset] >= 5 else b"")))
+                elif packet_type == SUBSCRIBE:
+                    packet_id, granted = body[:2], bytearray()
+                    offset = _skip_properties(body, 2, version)
+                    while offset < len(body):
+                        topic_filter, offset = _string(body, offset)
+                        offset += 1
+                        self._clients[writer].add(topic_filter)
+                        granted.append(0)
+                    writer.write(_packet(SUBACK, packet_id + no_properties + bytes(granted)))
+                elif packet_type == UNSUBSCRIBE:
+                    offset, count = _skip_properties(body, 2, version), 0
+                    while offset < len(body):
+                        topic_filter, offset = _string(body, offset)
+                        self._clients[writer].discard(topic_filter)
+                        count += 1
+                    writer.write(_packet(UNSUBACK, body[:2] + (no_properties + b"\x00" * count if version >= 5 else b"")))
+                elif packet_type == PUBLISH:
+                    await self._publish(writer, flags, body)
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP, b""))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            self._versions.pop(writer, None)
+            writer.close()
+
+    async def _publish(self, writer, flags, body):
+        topic, offset = _string(body, 0)
+        qos = (flags >> 1) & 0x03
+        if qos:
+            writer.write(_packet(PUBACK, body[offset:offset + 2]))
+            offset += 2
+        offset = _skip_properties(body, offset, self._versions.get(writer, 4))
+        self._stats["published"] += 1
+
+        name = struct.pack(">H", len(topic.encode())) + topic.encode()
+        forward = {
+            4: _packet(PUBLISH, name + body[offset:]),
+            5: _packet(PUBLISH, name + b"\x00" + body[offset:]),
+        }
+        targets = []
+        shared = {}
+        for client, filters in list(self._clients.items()):
+            direct = False
+            for topic_filter in filters:
+                if topic_filter.startswith("$share/"):
+                    _, group, real_filter = topic_filter.split("/", 2)
+                    if topic_matches(real_filter, topic):
+                        shared.setdefault((group, real_filter), []).append(client)
+                elif topic_matches(topic_filter, topic):
+                    direct = True
+            if direct:
+                targets.append(client)
+        # Satu anggota per group menerima pesan, bergiliran
+        for key, members in shared.items():
+            turn = self._shared_next.get(key, 0)
+            self._shared_next[key] = turn + 1
+            targets.append(members[turn % len(members)])
+
+        for client in targets:
+            client.write(forward[5 if self._versions.get(client, 4) >= 5 else 4])
+            self._stats["delivered"] += 1
+            await client.drain()
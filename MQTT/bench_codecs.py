@@ -0,0 +1,68 @@
+"""
+Micro-benchmark biaya decode per pesan untuk tiap codec payload.
+
+    python bench_codecs.py [jumlah_iterasi]
+
+Codec msgpack/cbor dilewati jika paketnya tidak terpasang.
+"""
+import json
+import sys
+import time
+from payload_codecs import build_decoder, encode_struct
+
+SAMPLES = {
+    "dht22": {"temp": 28.4, "hum": 64.2, "timestamp": "2025-01-01T10:00:00+00:00"},
+    "pzem004t": {"voltage": 221.3, "current": 1.52, "power": 310.5, "energy": 12.75, "power_factor": 0.93,
+                 "timestamp": "2025-01-01T10:00:00+00:00"},
+    "mq2": {"LPG": 120.0, "CO": 35.5, "Smoke": 80.2, "timestamp": "2025-01-01T10:00:00+00:00"},
+    "bh1750": {"lux": 532.7, "timestamp": "2025-01-01T10:00:00+00:00"},
+}
+
+# Nama kolom DB, dipakai untuk payload msgpack/cbor/struct
+CANONICAL = {
+    "dht22": {"temperature": 28.4, "humidity": 64.2},
+    "pzem004t": {"voltage": 221.3, "current": 1.52, "power": 310.5, "energy": 12.75, "power_factor": 0.93},
+    "mq2": {"gas_lpg": 120.0, "gas_co": 35.5, "smoke": 80.2},
+    "bh1750": {"lux": 532.7},
+}
+EPOCH = 1735725600
+
+
+def encode(codec, sensor):
+    if codec == "json":
+        return json.dumps(SAMPLES[sensor]).encode()
+    if codec == "struct":
+        return encode_struct(sensor, CANONICAL[sensor], EPOCH)
+    data = dict(CANONICAL[sensor], timestamp=EPOCH)
+    if codec == "msgpack":
+        import msgpack
+        return msgpack.packb(data)
+    import cbor2
+    return cbor2.dumps(data)
+
+
+def bench(decode, raw, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode(raw)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def run(iterations):
+    print(f"{'sensor':<10} {'codec':<8} {'bytes':>6} {'ns/msg':>10} {'vs json':>8}")
+    for sensor in SAMPLES:
+        baseline = None
+        for codec in ("json", "msgpack", "cbor", "struct"):
+            try:
+                raw = encode(codec, sensor)
+                decode = build_decoder(sensor, codec)
+            except ImportError:
+                print(f"{sensor:<10} {codec:<8} {'-':>6} {'(tidak terpasang)':>19}")
+                continue
+            ns = bench(decode, raw, iterations)
+            baseline = baseline or ns
+            print(f"{sensor:<10} {codec:<8} {len(raw):>6} {ns:>10.0f} {baseline / ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,555 @@
+"""
+Benchmark throughput ingest dan harness replay trafik.
+
+Menjalankan jalur ingest yang sesungguhnya (on_message -> work queue ->
+handle_message -> insert_data -> batch writer) dan mengukur:
+- throughput yang ditawarkan vs yang tersimpan (msg/s)
+- latency end-to-end p50/p99: publish -> baris terlihat dari koneksi lain
+- beban DB (delta pg_stat_database: commit, tuple insert, blok) dan
+  statistik writer/antrian
+
+Mode:
+- direct : panggil on_message langsung (tanpa jaringan)
+- broker : lewat broker MQTT lokal; default StandInBroker (bench_broker.py),
+           atau --broker host:port untuk mosquitto sungguhan
+- broker --workers N : listener dijalankan sebagai proses terpisah
+           (main.py dengan INGEST_PROCESSES=N, jadi run_supervisor + N worker
+           dengan shared subscription $share/); throughput dan latency
+           diukur dari baris yang terlihat di database
+
+Contoh:
+
+    python benchmark.py run --mode direct --devices 50 --rate 2000 --duration 10
+    python benchmark.py run --mode broker --mix dht22=4,pzem004t=2,mq2=2,bh1750=1,relay=1 --record traffic.ndjson
+    for n in 1 2 4; do python benchmark.py run --mode broker --workers $n --rate 0 --duration 10; done
+    python benchmark.py capture traffic.ndjson --duration 300     # rekam trafik dari MQTT_BROKER
+    python benchmark.py replay traffic.ndjson --mode direct --speed 0 --json hasil.json --fail-under 1500
+
+File trafik berformat NDJSON: {"t": detik sejak awal, "topic": ..., "payload": objek JSON}
+(payload non-JSON disimpan sebagai "payload_b64"). Saat dikirim, timestamp payload
+JSON diganti waktu kirim supaya latency terukur dan tidak bentrok dengan data lama
+(--keep-timestamps untuk mematikannya).
+
+Butuh database iotdb yang sudah di-init (tabel data + status_relay).
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+import psycopg2
+from paho.mqtt import client as mqtt
+import main
+from bench_broker import StandInBroker
+from config import SENSORS, MQTT_TOPICS
+from database import DB_IOT
+
+RELAY_IDS = (1, 2, 3, 4)
+DEFAULT_MIX = "dht22=1,pzem004t=1,mq2=1,bh1750=1,relay=0.1"
+
+
+class Message:
+    """Pengganti paho MQTTMessage untuk mode direct"""
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+# ---- Sumber trafik ----
+
+def _device_topic(sensor, device):
+    for pattern in MQTT_TOPICS[sensor].split(","):
+        if "+" in pattern:
+            return pattern.strip().replace("+", device, 1)
+    return MQTT_TOPICS[sensor].split(",")[0].strip()
+
+
+def _relay_topic(relay_id):
+    return MQTT_TOPICS["relay"].split(",")[0].strip().replace("#", str(relay_id))
+
+
+def _sample_payload(sensor, rng):
+    # Alias pertama di registry = nama field firmware ESP32, jadi jalur alias ikut teruji
+    return {
+        (spec.get("aliases") or [field])[0]: round(rng.uniform(0, 100), 2)
+        for field, spec in SENSORS[sensor]["fields"].items()
+    }
+
+
+def generate(devices, rate, duration, mix, seed=1):
+    """Trafik sintetis: (offset, topic, payload dict) untuk `devices` device pada `rate` msg/s"""
+    rng = random.Random(seed)
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name != "relay" and name not in SENSORS:
+            raise SystemExit(f"Sensor tidak dikenal di --mix: {name}")
+        weights[name] = float(weight or 1)
+    names = [name for name in weights if weights[name] > 0]
+    probs = [weights[name] for name in names]
+
+    device_ids = [f"bench-{i:04d}" for i in range(devices)]
+    total = int(rate * duration)
+    for i in range(total):
+        sensor = rng.choices(names, weights=probs)[0]
+        if sensor == "relay":
+            yield i / rate, _relay_topic(rng.choice(RELAY_IDS)), {"state": rng.random() < 0.5}
+        else:
+            yield i / rate, _device_topic(sensor, rng.choice(device_ids)), _sample_payload(sensor, rng)
+
+
+def load_traffic(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            payload = record.get("payload")
+            if payload is None:
+                payload = base64.b64decode(record["payload_b64"])
+            yield record["t"], record["topic"], payload
+
+
+def _record_line(offset, topic, payload):
+    record = {"t": round(offset, 6), "topic": topic}
+    if isinstance(payload, (bytes, bytearray)):
+        try:
+            record["payload"] = json.loads(payload)
+        except ValueError:
+            record["payload_b64"] = base64.b64encode(payload).decode()
+    else:
+        record["payload"] = payload
+    return json.dumps(record) + "\n"
+
+
+def _encode(topic, payload, keep_timestamps):
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    if not keep_timestamps and not topic.startswith("command/"):
+        payload = dict(payload, timestamp=datetime.now(timezone.utc).isoformat())
+    return json.dumps(payload).encode()
+
+
+# ---- Pengamat baris (latency publish -> terlihat) ----
+
+class RowWatcher:
+    """
+    Poll tabel data dari koneksi terpisah dan catat kapan baris baru terlihat.
+
+    Dengan beberapa writer (--workers) transaksi ber-id kecil bisa commit
+    setelah id yang lebih besar terlihat, jadi id yang terlewati dicatat
+    sebagai lubang dan ikut di-poll sampai muncul (atau HOLE_TTL habis:
+    id yang terpakai ON CONFLICT / rollback memang tidak pernah muncul).
+    """
+
+    HOLE_TTL = 30
+    # Celah id sebesar ini dianggap lompatan sequence, tidak dilacak
+    MAX_HOLES = 100_000
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.tables = [spec["table"] for spec in SENSORS.values()]
+        self.latencies = []
+        self.rows = 0
+        self.polls = 0
+        self.last_seen = None
+        self._conn = psycopg2.connect(**DB_IOT)
+        self._conn.autocommit = True
+        self._last_ids = {}
+        # tabel -> {id: monotonic saat pertama terlewati}
+        self._holes = {table: {} for table in self.tables}
+        with self._conn.cursor() as cur:
+            for table in self.tables:
+                cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+                self._last_ids[table] = cur.fetchone()[0]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="bench-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._poll()
+        self._conn.close()
+
+    def _poll(self):
+        query = " UNION ALL ".join(
+            f"(SELECT {i}, id, timestamp FROM {table} WHERE id > %s OR id = ANY(%s::int8[]))"
+            for i, table in enumerate(self.tables)
+        )
+        params = []
+        for table in self.tables:
+            params += [self._last_ids[table], list(self._holes[table])]
+        with self._conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+        self.polls += 1
+        now = time.monotonic()
+        for holes in self._holes.values():
+            for row_id in [row_id for row_id, since in holes.items() if now - since > self.HOLE_TTL]:
+                del holes[row_id]
+        if not rows:
+            return
+        seen = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.last_seen = time.perf_counter()
+        found = {table: set() for table in self.tables}
+        for index, row_id, ts in rows:
+            found[self.tables[index]].add(row_id)
+            if ts is not None:
+                self.latencies.append((seen - ts).total_seconds())
+        for table, ids in found.items():
+            holes = self._holes[table]
+            for row_id in ids:
+                holes.pop(row_id, None)
+            last, top = self._last_ids[table], max(ids, default=0)
+            if top > last:
+                if top - last <= self.MAX_HOLES:
+                    for row_id in range(last + 1, top):
+                        if row_id not in ids:
+                            holes[row_id] = now
+                self._last_ids[table] = top
+        self.rows += len(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._poll()
+            except psycopg2.Error as e:
+                print("[bench] Watcher error:", e, file=sys.stderr)
+
+
+def db_counters():
+    with contextlib.closing(psycopg2.connect(**DB_IOT)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT xact_commit, xact_rollback, tup_inserted, tup_updated, blks_read, blks_hit, deadlocks
+                FROM pg_stat_database WHERE datname = current_database()
+            """)
+            names = ("xact_commit", "xact_rollback", "tup_inserted", "tup_updated", "blks_read", "blks_hit",
+                     "deadlocks")
+            return dict(zip(names, cur.fetchone()))
+
+
+# ---- Pengirim ----
+
+def _pace(start, offset, speed):
+    if speed <= 0:
+        return
+    delay = start + offset / speed - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+class DirectSender:
+    def __init__(self, args):
+        self.args = args
+
+    def __enter__(self):
+        return self
+
+    def send(self, topic, payload):
+        main.on_message(None, None, Message(topic, payload))
+
+    def __exit__(self, *exc):
+        return False
+
+
+class BrokerSender:
+    def __init__(self, args):
+        self.args = args
+        self.broker = None
+        self.listener = None
+        self.supervisor = None
+
+    def __enter__(self):
+        if self.args.broker:
+            host, _, port = self.args.broker.partition(":")
+            port = int(port or 1883)
+        else:
+            self.broker = StandInBroker().start()
+            host, port = self.broker.host, self.broker.port
+
+        workers = self.args.workers
+        if workers:
+            # main.py apa adanya: supervisor + N proses worker dengan $share/
+            env = dict(os.environ, INGEST_PROCESSES=str(workers), MQTT_BROKER=host, MQTT_PORT=str(port),
+                       STATS_INTERVAL="0")
+            self.supervisor = subprocess.Popen(
+                [sys.executable, "main.py"], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                stdout=None if self.args.verbose else subprocess.DEVNULL,
+                stderr=None if self.args.verbose else subprocess.DEVNULL,
+            )
+        else:
+            # Listener memakai callback main.py apa adanya
+            self.listener = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+            self.listener.user_data_set({"share_group": None})
+            self.listener.on_connect = main.on_connect
+            self.listener.on_message = main.on_message
+            self.listener.connect(host, port, keepalive=60)
+            self.listener.loop_start()
+
+        self.publisher = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        self.publisher.max_queued_messages_set(0)
+        self.publisher.connect(host, port, keepalive=60)
+        self.publisher.loop_start()
+
+        # Worker spawn butuh waktu start (import, pool DB, load settings)
+        deadline = time.monotonic() + (60 if workers else 10)
+        while time.monotonic() < deadline:
+            if self.broker is None:
+                time.sleep(5 + workers if workers else 1)
+                break
+            if self.broker.subscriptions() >= max(workers, 1) * len(main.SUBSCRIPTIONS):
+                break
+            if self.supervisor is not None and self.supervisor.poll() is not None:
+                raise SystemExit(f"main.py berhenti saat start (exit={self.supervisor.returncode})")
+            time.sleep(0.05)
+        return self
+
+    def stop_listener(self):
+        """Hentikan supervisor seperti Ctrl+C: worker di-terminate dan sempat flush"""
+        if self.supervisor is not None and self.supervisor.poll() is None:
+            self.supervisor.send_signal(signal.SIGINT)
+            try:
+                self.supervisor.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.supervisor.kill()
+                self.supervisor.wait()
+
+    def send(self, topic, payload):
+        self.publisher.publish(topic, payload, qos=self.args.qos)
+
+    def __exit__(self, *exc):
+        self.publisher.loop_stop()
+        self.publisher.disconnect()
+        # Beri waktu pesan yang masih di jalan sampai ke listener
+        time.sleep(0.5)
+        if self.listener is not None:
+            self.listener.loop_stop()
+            self.listener.disconnect()
+        self.stop_listener()
+        if self.broker is not None:
+            self.broker.stop()
+        return False
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_traffic(traffic, args):
+    """Kirim trafik ke pipeline ingest dan kumpulkan hasil pengukuran"""
+    record = open(args.record, "w", encoding="utf-8") if getattr(args, "record", None) else None
+    keep_timestamps = getattr(args, "keep_timestamps", False)
+    speed = getattr(args, "speed", 1.0)
+
+    # Mode --workers: pipeline ingest berjalan di proses worker main.py
+    in_process = not (args.mode == "broker" and args.workers)
+    if in_process:
+        main.alert_engine.load_settings()
+        main.alert_engine.start()
+        main.writer.start()
+        main.work_queue.start()
+
+    watcher = RowWatcher(args.poll_ms / 1000)
+    before = db_counters()
+    sender_cls = BrokerSender if args.mode == "broker" else DirectSender
+    sent = {"sensor": 0, "relay": 0}
+    sink = open(os.devnull, "w") if not args.verbose else sys.stdout
+
+    with contextlib.redirect_stdout(sink):
+        with sender_cls(args) as sender:
+            watcher.start()
+            start = time.perf_counter()
+            for offset, topic, payload in traffic:
+                _pace(start, offset, speed)
+                sender.send(topic, _encode(topic, payload, keep_timestamps))
+                sent["relay" if topic.startswith("command/") else "sensor"] += 1
+                if record:
+                    record.write(_record_line(offset, topic, payload))
+            send_elapsed = time.perf_counter() - start
+
+            if not in_process:
+                # Antrian worker tidak terlihat dari sini: tunggu semua baris terlihat, atau berhenti
+                # jika tidak ada baris baru selama 10 detik (lebih lama dari retry spool writer)
+                deadline = time.monotonic() + args.drain_timeout
+                idle_since, seen = time.monotonic(), watcher.rows
+                while time.monotonic() < deadline and watcher.rows < sent["sensor"]:
+                    if watcher.rows != seen:
+                        idle_since, seen = time.monotonic(), watcher.rows
+                    elif time.monotonic() - idle_since > 10:
+                        break
+                    time.sleep(0.05)
+
+        if in_process:
+            # Tunggu antrian dan buffer writer kosong, lalu semua baris terlihat
+            deadline = time.monotonic() + args.drain_timeout
+            while time.monotonic() < deadline:
+                queue_stats = main.work_queue.stats()
+                if queue_stats.get("depth", 0) == 0 and main.writer.stats()["pending_rows"] == 0:
+                    if watcher.rows >= sent["sensor"] - main.writer.stats()["rows_duplicate"]:
+                        break
+                time.sleep(0.05)
+
+            main.work_queue.stop()
+            main.writer.stop()
+            main.alert_engine.stop()
+        watcher.stop()
+
+    if record:
+        record.close()
+    if sink is not sys.stdout:
+        sink.close()
+
+    # Statistik pg_stat_database dikirim backend secara berkala
+    time.sleep(1)
+    after = db_counters()
+    end = watcher.last_seen or time.perf_counter()
+    latencies = sorted(watcher.latencies)
+    writer_stats = main.writer.stats() if in_process else None
+    total_elapsed = max(end - start, 1e-9)
+
+    return {
+        "mode": args.mode,
+        "workers": None if in_process else args.workers,
+        "messages_sent": sent["sensor"] + sent["relay"],
+        "relay_sent": sent["relay"],
+        "rows_visible": watcher.rows,
+        "offered_msgs_per_s": round((sent["sensor"] + sent["relay"]) / max(send_elapsed, 1e-9), 1),
+        "stored_rows_per_s": round(watcher.rows / total_elapsed, 1),
+        "latency_p50_ms": None if keep_timestamps or not latencies else round(_percentile(latencies, 50) * 1000, 1),
+        "latency_p99_ms": None if keep_timestamps or not latencies else round(_percentile(latencies, 99) * 1000, 1),
+        "latency_max_ms": None if keep_timestamps or not latencies else round(latencies[-1] * 1000, 1),
+        "db": {key: after[key] - before[key] for key in after},
+        "db_watcher_polls": watcher.polls,
+        "writer": writer_stats,
+        "queue": main.work_queue.stats() if in_process else None,
+    }
+
+
+def report(result, args):
+    workers = f", {result['workers']} worker $share" if result["workers"] else ""
+    print(f"\n=== Benchmark ingest ({result['mode']}{workers}) ===")
+    print(f"Pesan dikirim       : {result['messages_sent']} (relay {result['relay_sent']})")
+    print(f"Baris tersimpan     : {result['rows_visible']}")
+    print(f"Throughput ditawar  : {result['offered_msgs_per_s']} msg/s")
+    print(f"Throughput tersimpan: {result['stored_rows_per_s']} baris/s")
+    if result["latency_p50_ms"] is not None:
+        print(f"Latency publish->DB : p50={result['latency_p50_ms']}ms p99={result['latency_p99_ms']}ms "
+              f"max={result['latency_max_ms']}ms (resolusi poll {args.poll_ms}ms)")
+    db = result["db"]
+    print(f"Beban DB            : commit={db['xact_commit']} (termasuk {result['db_watcher_polls']} poll watcher) "
+          f"rollback={db['xact_rollback']} insert={db['tup_inserted']} update={db['tup_updated']} "
+          f"blks_read={db['blks_read']} blks_hit={db['blks_hit']} deadlocks={db['deadlocks']}")
+    w = result["writer"]
+    if w is not None:
+        print(f"Writer              : flushes={w['flushes']} written={w['rows_written']} duplicate={w['rows_duplicate']} "
+              f"rejected={w['rows_rejected']} spooled={w['rows_spooled']} max_flush_ms={w['max_flush_ms']:.1f}")
+        print(f"Queue               : {result['queue']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"Hasil disimpan ke {args.json}")
+
+    if args.fail_under and result["stored_rows_per_s"] < args.fail_under:
+        print(f"FAIL: throughput {result['stored_rows_per_s']} < {args.fail_under} baris/s")
+        sys.exit(1)
+
+
+def capture(args):
+    """Rekam trafik sungguhan dari MQTT_BROKER ke file NDJSON"""
+    out = open(args.file, "w", encoding="utf-8")
+    start = time.perf_counter()
+    count = [0]
+
+    def on_message(client, userdata, message):
+        out.write(_record_line(time.perf_counter() - start, message.topic, message.payload))
+        count[0] += 1
+
+    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+    client.user_data_set({"share_group": None})
+    client.on_connect = main.on_connect
+    client.on_message = on_message
+    client.connect(main.MQTT_BROKER, main.MQTT_PORT, keepalive=60)
+    client.loop_start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    client.loop_stop()
+    client.disconnect()
+    out.close()
+    print(f"{count[0]} pesan direkam ke {args.file}")
+
+
+def _common(parser):
+    parser.add_argument("--mode", choices=("direct", "broker"), default="direct")
+    parser.add_argument("--broker", help="host:port broker sungguhan (default: StandInBroker lokal)")
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=0)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="mode broker: jalankan main.py dengan INGEST_PROCESSES=N (0 = listener di proses ini)")
+    parser.add_argument("--poll-ms", type=float, default=10, help="interval poll watcher latency")
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    parser.add_argument("--fail-under", type=float, help="exit 1 jika baris/s di bawah angka ini")
+    parser.add_argument("--verbose", action="store_true", help="tampilkan log listener")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest MQTT -> Postgres")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="trafik sintetis")
+    _common(run)
+    run.add_argument("--devices", type=int, default=20)
+    run.add_argument("--rate", type=float, default=1000, help="total msg/s (0 = secepatnya)")
+    run.add_argument("--duration", type=float, default=10)
+    run.add_argument("--mix", default=DEFAULT_MIX, help="bobot per sensor, mis. dht22=4,mq2=1,relay=0.5")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--record", help="simpan trafik yang dikirim untuk replay")
+
+    replay = sub.add_parser("replay", help="replay file trafik")
+    replay.add_argument("file")
+    _common(replay)
+    replay.add_argument("--speed", type=float, default=1.0, help="pengali kecepatan (0 = secepatnya)")
+    replay.add_argument("--keep-timestamps", action="store_true")
+
+    cap = sub.add_parser("capture", help="rekam trafik dari MQTT_BROKER")
+    cap.add_argument("file")
+    cap.add_argument("--duration", type=float, default=60)
+
+    args = parser.parse_args(argv)
+    if args.command == "capture":
+        capture(args)
+        return
+
+    if args.command == "run":
+        # rate 0: jadwal tetap dibuat per 1000 msg/s tapi dikirim tanpa jeda
+        rate = args.rate or 1000
+        args.speed = 1.0 if args.rate else 0
+        traffic = generate(args.devices, rate, args.duration, args.mix, args.seed)
+    else:
+        traffic = load_traffic(args.file)
+
+    report(run_traffic(traffic, args), args)
+
+
+if __name__ == "__main__":
+    main_cli()
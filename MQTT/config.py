@@ -1,6 +1,12 @@
 import os
+import sys
 from dotenv import load_dotenv
 
+# Root repo di sys.path supaya modul bersama (shared/) bisa diimport,
+# sama seperti sensors.json yang dibaca dari root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared.registry import load_registry, table_ddl, rollup_ddl
+
 # Load .env file
 load_dotenv()
 
@@ -13,58 +19,106 @@ DB_DEFAULT = {
     "password": os.getenv("DB_PASSWORD", "postgres")
 }
 
+# Connection pool listener
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+# Koneksi yang menganggur lebih lama dari ini (detik) dicek dulu sebelum dipakai
+DB_HEALTHCHECK_IDLE = int(os.getenv("DB_HEALTHCHECK_IDLE", 30))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+
 # MQTT Configuration
 MQTT_BROKER = os.getenv("MQTT_BROKER", "broker.hivemq.com")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+# Registry sensor (tabel, topic, kolom, alias, unit, threshold): satu file untuk MQTT dan API
+SENSOR_REGISTRY = os.getenv(
+    "SENSOR_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sensors.json")
+)
+SENSORS = load_registry(SENSOR_REGISTRY)
+
+# Topic sensor boleh lebih dari satu (pisahkan dengan koma). Level "+" berisi
+# device_id, mis. sensor/esp32-dapur/dht22. Topic tanpa "+" (format lama satu
+# device) disimpan dengan device_id DEFAULT_DEVICE_ID.
+# Default dari registry, bisa ditimpa lewat TOPIC_<env> (mis. TOPIC_DHT22).
 MQTT_TOPICS = {
-    "dht22": os.getenv("TOPIC_DHT22", "sensor/dht22"),
-    "pzem004t": os.getenv("TOPIC_PZEM", "sensor/pzem004t"),
-    "mq2": os.getenv("TOPIC_MQ2", "sensor/mq2"),
-    "bh1750": os.getenv("TOPIC_BH1750", "sensor/bh1750"),
-    "relay": os.getenv("TOPIC_RELAY_CMD", "command/relay/#")
+    sensor: os.getenv(f"TOPIC_{spec['env']}", spec["topic"])
+    for sensor, spec in SENSORS.items()
 }
+MQTT_TOPICS["relay"] = os.getenv("TOPIC_RELAY_CMD", "command/relay/#")
+DEFAULT_DEVICE_ID = os.getenv("DEFAULT_DEVICE_ID", "default")
+
+# Codec payload per sensor: json | msgpack | cbor | struct (JSON tetap jadi fallback)
+PAYLOAD_CODECS = {
+    sensor: os.getenv(f"CODEC_{spec['env']}", spec.get("codec", "json"))
+    for sensor, spec in SENSORS.items()
+}
+
+# Multi-process ingest
+# INGEST_PROCESSES > 1: supervisor menjalankan N worker dengan shared subscription
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", 1))
+MQTT_SHARE_GROUP = os.getenv("MQTT_SHARE_GROUP", "iot-ingest")
+# Diisi supervisor untuk tiap proses worker
+INGEST_WORKER_ID = os.getenv("INGEST_WORKER_ID")
+
+# Batch Writer Configuration
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", 500))
+BATCH_FLUSH_MS = int(os.getenv("BATCH_FLUSH_MS", 250))
+# Tabel data sensor -> field nilai
+SENSOR_FIELDS = {spec["table"]: list(spec["fields"]) for spec in SENSORS.values()}
+# Perbarui tabel rollup (1m/1h/1d) di statement insert yang sama
+ROLLUP_ON_INGEST = os.getenv("ROLLUP_ON_INGEST", "1") == "1"
+# Channel NOTIFY berisi baris terbaru per device setelah insert (cache /latest di API).
+# Harus sama dengan LATEST_NOTIFY_CHANNEL API; kosong = nonaktif
+LATEST_NOTIFY_CHANNEL = os.getenv("LATEST_NOTIFY_CHANNEL", "sensor_latest")
+
+# Spool lokal saat Postgres tidak tersedia
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spill/spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", 4 * 1024 * 1024))
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", 512 * 1024 * 1024))
+SPOOL_FSYNC_MS = int(os.getenv("SPOOL_FSYNC_MS", 200))
+SPOOL_REPLAY_ROWS_PER_SEC = int(os.getenv("SPOOL_REPLAY_ROWS_PER_SEC", 5000))
+# Jeda sebelum mencoba DB lagi setelah gagal (detik)
+DB_RETRY_INTERVAL = int(os.getenv("DB_RETRY_INTERVAL", 5))
+
+# Work Queue Configuration
+# QUEUE_OVERFLOW: spill (default) | drop_oldest | block
+# block menahan thread network paho saat antrian penuh: keepalive/ack ke
+# broker ikut tertahan (backpressure ke loop MQTT), jadi hanya untuk debug
+QUEUE_MAXSIZE = int(os.getenv("QUEUE_MAXSIZE", 10000))
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", 4))
+QUEUE_OVERFLOW = os.getenv("QUEUE_OVERFLOW", "spill")
+QUEUE_SPILL_PATH = os.getenv("QUEUE_SPILL_PATH", "spill/queue.bin")
+
+# Tiap worker punya spool dan file spill sendiri
+if INGEST_WORKER_ID is not None:
+    SPOOL_DIR = os.path.join(SPOOL_DIR, f"worker-{INGEST_WORKER_ID}")
+    QUEUE_SPILL_PATH = f"{QUEUE_SPILL_PATH}.worker-{INGEST_WORKER_ID}"
+
+# Cetak setiap pesan sensor yang masuk (debug; mahal di jalur ingest)
+LOG_MESSAGES = os.getenv("LOG_MESSAGES", "0") == "1"
+
+# Interval cetak statistik ingest (detik, 0 = nonaktif)
+STATS_INTERVAL = int(os.getenv("STATS_INTERVAL", 60))
 
 # Alert & Settings Configuration
 SETTINGS_RELOAD_INTERVAL = int(os.getenv("SETTINGS_RELOAD_INTERVAL", 5))
 ALERT_COOLDOWN = int(os.getenv("ALERT_COOLDOWN", 60))
+# Pita hysteresis (% dari batas) sebelum breach dianggap selesai
+ALERT_HYSTERESIS_PCT = float(os.getenv("ALERT_HYSTERESIS_PCT", 2))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Dispatcher Telegram alert (sama dengan API): rate per chat, burst, retry
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 1000))
+NOTIFY_RATE_PER_SEC = float(os.getenv("NOTIFY_RATE_PER_SEC", 1))
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", 3))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 4))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", 1))
 
-# Daftar query untuk membuat tabel di database IoT
+# Daftar query untuk membuat tabel di database IoT.
+# DDL tabel data sensor dibuat dari registry. (device_id, timestamp) adalah
+# natural key: pesan yang dikirim ulang device tidak tersimpan dua kali
+# (insert memakai ON CONFLICT DO NOTHING).
 TABLES = {
-    "data_dht22": """
-        CREATE TABLE IF NOT EXISTS data_dht22 (
-            id SERIAL PRIMARY KEY,
-            temperature FLOAT,
-            humidity FLOAT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """,
-    "data_pzem004t": """
-        CREATE TABLE IF NOT EXISTS data_pzem004t (
-            id SERIAL PRIMARY KEY,
-            voltage FLOAT,
-            current FLOAT,
-            power FLOAT,
-            energy FLOAT,
-            power_factor FLOAT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """,
-    "data_mq2": """
-        CREATE TABLE IF NOT EXISTS data_mq2 (
-            id SERIAL PRIMARY KEY,
-            gas_lpg FLOAT,
-            gas_co FLOAT,
-            smoke FLOAT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """,
-    "data_bh1750": """
-        CREATE TABLE IF NOT EXISTS data_bh1750 (
-            id SERIAL PRIMARY KEY,
-            lux FLOAT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """,
+    **{spec["table"]: table_ddl(spec["table"], spec["fields"]) for spec in SENSORS.values()},
+    **{f"{spec['table']}_rollup": rollup_ddl(spec["table"], spec["fields"]) for spec in SENSORS.values()},
     "status_relay": """
         CREATE TABLE IF NOT EXISTS status_relay (
             id SERIAL PRIMARY KEY,
@@ -73,6 +127,14 @@ TABLES = {
             is_active BOOLEAN DEFAULT false
         );
     """,
+    "alert_state": """
+        CREATE TABLE IF NOT EXISTS alert_state (
+            alert_key TEXT PRIMARY KEY,
+            last_sent TIMESTAMP NOT NULL,
+            active BOOLEAN NOT NULL DEFAULT false
+        );
+        ALTER TABLE alert_state ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT false;
+    """,
     "users": """
         CREATE TABLE IF NOT EXISTS users (
             id SERIAL PRIMARY KEY,
@@ -0,0 +1,175 @@
+import time
+import zlib
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extensions import connection as _pg_connection
+from contextlib import contextmanager
+from config import (
+    DB_DEFAULT, IOT_DB, DB_POOL_MIN, DB_POOL_MAX, DB_HEALTHCHECK_IDLE, DB_CONNECT_TIMEOUT,
+    SENSOR_FIELDS, ROLLUP_ON_INGEST, LATEST_NOTIFY_CHANNEL
+)
+from shared.registry import rollup_upsert
+
+DB_IOT = DB_DEFAULT.copy()
+DB_IOT["dbname"] = IOT_DB
+# Jangan biarkan writer menggantung lama saat server DB mati
+DB_IOT["connect_timeout"] = DB_CONNECT_TIMEOUT
+
+# Tipe parameter prepared statement per kolom (default float8)
+COLUMN_TYPES = {
+    "device_id": "text",
+    "timestamp": "timestamp",
+}
+
+
+class PooledConnection(_pg_connection):
+    """Koneksi yang mengingat prepared statement miliknya dan waktu terakhir dipakai"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+
+# Connection pool - koneksi long-lived untuk listener
+_connection_pool = None
+
+
+def init_pool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+    """Inisialisasi connection pool"""
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = pool.ThreadedConnectionPool(
+            minconn=minconn,
+            maxconn=maxconn,
+            connection_factory=PooledConnection,
+            **DB_IOT
+        )
+    return _connection_pool
+
+
+def get_pool():
+    """Dapatkan pool, inisialisasi jika belum ada"""
+    if _connection_pool is None:
+        init_pool()
+    return _connection_pool
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    # Koneksi yang lama menganggur dicek dulu (bisa saja diputus server)
+    if time.monotonic() - conn.last_used < DB_HEALTHCHECK_IDLE:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def get_conn():
+    """Context manager koneksi pool yang sudah dicek kesehatannya"""
+    pool = get_pool()
+    conn = pool.getconn()
+    while not _is_healthy(conn):
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        conn.last_used = time.monotonic()
+        pool.putconn(conn, close=broken or conn.closed)
+
+
+def close_pool():
+    """Tutup semua koneksi di pool"""
+    global _connection_pool
+    if _connection_pool:
+        _connection_pool.closeall()
+        _connection_pool = None
+
+
+def check_database_exists():
+    """Cek database IoT dengan langsung membuka pool ke database tersebut"""
+    try:
+        init_pool()
+        return True
+    except Exception as e:
+        print("Gagal mengecek database:", e)
+        return False
+
+
+def _prepare(conn, cur, name, params, statement):
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} ({', '.join(params)}) AS {statement}")
+        conn.prepared.add(name)
+
+
+def execute_insert(conn, cur, table, columns, rows):
+    """
+    Insert banyak baris lewat prepared statement per tabel.
+
+    Baris dikirim sebagai satu array per kolom lalu di-unnest di server,
+    jadi satu batch = satu EXECUTE berapapun jumlah barisnya. Baris yang
+    kuncinya sudah ada (pesan dikirim ulang) dilewati; return jumlah
+    baris yang benar-benar masuk.
+
+    Untuk tabel sensor, baris yang masuk (RETURNING) di statement yang sama:
+    - ditambahkan ke tabel rollup 1m/1h/1d (ROLLUP_ON_INGEST), jadi duplikat
+      tidak terhitung dua kali dan rollup selalu konsisten dengan tabel mentah
+    - baris terbaru per device dikirim lewat pg_notify(LATEST_NOTIFY_CHANNEL)
+      untuk cache /latest di API; NOTIFY baru terkirim saat transaksi commit
+    """
+    fields = SENSOR_FIELDS.get(table) if {"device_id", "timestamp"} <= set(columns) else None
+    rollup = [c for c in columns if c in fields] if fields and ROLLUP_ON_INGEST else []
+    notify = bool(fields and LATEST_NOTIFY_CHANNEL)
+    # Nama statement ikut susunan kolom (batch lama di spool bisa beda kolom)
+    flags = ("r" if rollup else "") + ("n" if notify else "")
+    name = f"ins{flags}_{table}_{zlib.crc32(','.join(columns).encode()):08x}"
+    types = [COLUMN_TYPES.get(c, "float8") for c in columns]
+    placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    insert = (
+        f"INSERT INTO {table} ({', '.join(columns)}) SELECT * FROM unnest({placeholders}) "
+        f"ON CONFLICT DO NOTHING"
+    )
+    if flags:
+        ctes = "".join(f", r{i} AS ({sql})" for i, sql in enumerate(rollup_upsert(table, rollup, "ins")))
+        result = "SELECT COUNT(*) FROM ins"
+        if notify:
+            channel = LATEST_NOTIFY_CHANNEL.replace("'", "''")
+            # CTE SELECT hanya dieksekusi jika dirujuk, karena itu ikut dihitung di hasil
+            ctes += (
+                ", latest AS (SELECT DISTINCT ON (device_id) * FROM ins WHERE timestamp IS NOT NULL "
+                "ORDER BY device_id, timestamp DESC), "
+                f"notified AS (SELECT pg_notify('{channel}', json_build_object('table', '{table}', "
+                "'row', row_to_json(l))::text) FROM latest l)"
+            )
+            result = "SELECT (SELECT COUNT(*) FROM ins), (SELECT COUNT(*) FROM notified)"
+        insert = f"WITH ins AS ({insert} RETURNING *){ctes} {result}"
+    _prepare(conn, cur, name, [f"{t}[]" for t in types], insert)
+
+    args = ", ".join(f"%s::{t}[]" for t in types)
+    cur.execute(f"EXECUTE {name} ({args})", [list(col) for col in zip(*rows)])
+    return cur.fetchone()[0] if flags else cur.rowcount
+
+
+def update_relay(relay_id, state):
+    """Simpan status relay lewat prepared UPDATE"""
+    with get_conn() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                _prepare(
+                    conn, cur, "upd_status_relay", ["boolean", "int"],
+                    "UPDATE status_relay SET is_active = $1 WHERE id = $2"
+                )
+                cur.execute("EXECUTE upd_status_relay (%s, %s)", (state, relay_id))
+                return cur.rowcount
@@ -1,12 +1,27 @@
 
 import json
-import psycopg2
 from paho.mqtt import client as mqtt
-from config import DB_DEFAULT, MQTT_BROKER, MQTT_PORT, MQTT_TOPICS
+from config import (
+    MQTT_BROKER, MQTT_PORT, MQTT_TOPICS, DEFAULT_DEVICE_ID, BATCH_MAX_ROWS, BATCH_FLUSH_MS,
+    QUEUE_MAXSIZE, QUEUE_WORKERS, QUEUE_OVERFLOW, QUEUE_SPILL_PATH, STATS_INTERVAL,
+    SPOOL_DIR, SPOOL_SEGMENT_BYTES, SPOOL_MAX_BYTES, SPOOL_FSYNC_MS, SPOOL_REPLAY_ROWS_PER_SEC,
+    DB_RETRY_INTERVAL, INGEST_PROCESSES, MQTT_SHARE_GROUP,
+    SETTINGS_RELOAD_INTERVAL, ALERT_COOLDOWN, ALERT_HYSTERESIS_PCT, TELEGRAM_API_URL,
+    PAYLOAD_CODECS, SENSORS, LOG_MESSAGES
+)
+from database import check_database_exists, update_relay, close_pool
+from writer import BatchWriter
+from spool import Spool
+from supervisor import run_supervisor
+from alerts import AlertEngine
+from payload_codecs import build_decoder
+from shared.registry import SensorPlan, TopicRouter
+from work_queue import WorkQueue
 from datetime import datetime, timezone
+import signal
 import sys
+import threading
 import time
-import requests
 import os
 from dotenv import load_dotenv
 
@@ -15,140 +30,110 @@ load_dotenv()
 
 # Config centralized in config.py
 
-TABLES = {
-    "dht22": "data_dht22",
-    "pzem004t": "data_pzem004t",
-    "mq2": "data_mq2",
-    "bh1750": "data_bh1750"
+# Semua topic yang di-subscribe (satu sensor bisa punya beberapa pola)
+SUBSCRIPTIONS = [
+    topic.strip()
+    for topics in MQTT_TOPICS.values()
+    for topic in topics.split(",")
+    if topic.strip()
+]
+
+# Dikompilasi sekali dari registry sensor saat startup: rencana ingest per
+# sensor (decoder, extractor field, tabel + kolom insert) dan router topic
+PLANS = {
+    sensor: SensorPlan(sensor, spec, build_decoder(sensor, PAYLOAD_CODECS[sensor]))
+    for sensor, spec in SENSORS.items()
 }
+ROUTER = TopicRouter({sensor: MQTT_TOPICS[sensor] for sensor in SENSORS}, DEFAULT_DEVICE_ID)
+match_topic = ROUTER.match
+
+
+# Data sensor ditulis per batch lewat koneksi pool yang long-lived.
+# Saat Postgres mati, batch ditampung di spool lokal lalu di-replay.
+writer = BatchWriter(
+    max_rows=BATCH_MAX_ROWS,
+    flush_interval=BATCH_FLUSH_MS / 1000,
+    spool=Spool(
+        SPOOL_DIR,
+        segment_bytes=SPOOL_SEGMENT_BYTES,
+        max_bytes=SPOOL_MAX_BYTES,
+        fsync_interval=SPOOL_FSYNC_MS / 1000,
+        replay_rows_per_sec=SPOOL_REPLAY_ROWS_PER_SEC,
+        retry_interval=DB_RETRY_INTERVAL
+    ),
+    retry_interval=DB_RETRY_INTERVAL
+)
+
+# Threshold dievaluasi sekali di server, bukan di tiap tab dashboard
+alert_engine = AlertEngine(
+    reload_interval=SETTINGS_RELOAD_INTERVAL,
+    cooldown=ALERT_COOLDOWN,
+    hysteresis_pct=ALERT_HYSTERESIS_PCT,
+    telegram_api_url=TELEGRAM_API_URL,
+    default_device_id=DEFAULT_DEVICE_ID
+)
+
+
+def insert_data(plan, data, device_id=DEFAULT_DEVICE_ID):
+    timestamp = data.get("timestamp", datetime.now(timezone.utc).isoformat())
+    values = plan.extract(data)
 
-DB_IOT = DB_DEFAULT.copy()
-DB_IOT["dbname"] = "iotdb"
+    writer.add(plan.table, plan.columns, (device_id, *values, timestamp))
+    alert_engine.evaluate(plan.sensor, device_id, dict(zip(plan.fields, values)))
 
+    if LOG_MESSAGES:
+        print(f"[{plan.sensor}/{device_id}] Data masuk → {data}")
 
-def check_database_exists():
-    try:
-        # connect ke postgres (default DB)
-        tmp = DB_DEFAULT.copy()
-        tmp["dbname"] = "postgres"
 
-        with psycopg2.connect(**tmp) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", ("iotdb",))
-                return cur.fetchone() is not None
+def handle_message(topic, raw):
+    """Decode dan simpan satu pesan (dijalankan di worker thread)"""
+    try:
+        # Check match manually since it uses wildcard #
+        if topic.startswith("command/relay/"):
+            try:
+                payload = json.loads(raw)
+                # Parse relay ID from topic or payload
+                relay_id = int(topic.split("/")[-1])
+                state = payload.get("state", False)
+                
+                print(f"[RELAY] ID={relay_id} State={state}")
+                
+                # Sync to DB
+                update_relay(relay_id, state)
+                print(f"[RELAY] Saved to DB (status_relay).")
+            except Exception as e:
+                print(f"[RELAY] Sync Error: {e}")
+            return
+
+        sensor, device_id = match_topic(topic)
+        if sensor:
+            plan = PLANS[sensor]
+            insert_data(plan, plan.decode(raw), device_id)
 
     except Exception as e:
-        print("Gagal mengecek database:", e)
-        return False
-
-
-def insert_data(sensor, data):
-    table = TABLES.get(sensor)
-    if not table:
-        print(f"[{sensor}] Tidak ada tabel")
-        time.sleep(2)
-        return
-
-    timestamp = data.get("timestamp", datetime.now(timezone.utc).isoformat())
+        print("Parse Error:", e)
 
-    try:
-        with psycopg2.connect(**DB_IOT) as conn:
-            with conn.cursor() as cur:
-
-                if sensor == "dht22":
-                    temp = data.get("temp")
-                    if temp is None:
-                        temp = data.get("temperature")
-                        
-                    hum = data.get("hum")
-                    if hum is None:
-                        hum = data.get("humidity")
-
-                    cur.execute(
-                        f"INSERT INTO {table} (temperature, humidity, timestamp) VALUES (%s, %s, %s)",
-                        (temp, hum, timestamp)
-                    )
-
-                elif sensor == "pzem004t":
-                    cur.execute(
-                        f"""INSERT INTO {table} 
-                        (voltage, current, power, energy, power_factor, timestamp) 
-                        VALUES (%s, %s, %s, %s, %s, %s)""",
-                        (
-                            data.get("voltage"),
-                            data.get("current"),
-                            data.get("power"),
-                            data.get("energy"),
-                            data.get("power_factor"),
-                            timestamp
-                        )
-                    )
-
-                elif sensor == "mq2":
-                    lpg = data.get("lpg")
-                    if lpg is None:
-                        lpg = data.get("gas_lpg")
-                    if lpg is None:
-                        lpg = data.get("LPG")
-                        
-                    co = data.get("co")
-                    if co is None:
-                        co = data.get("gas_co")
-                    if co is None:
-                        co = data.get("CO")
-                        
-                    smoke = data.get("smoke")
-                    if smoke is None:
-                        smoke = data.get("Smoke")
-                        
-                    cur.execute(
-                        f"INSERT INTO {table} (gas_lpg, gas_co, smoke, timestamp) VALUES (%s, %s, %s, %s)",
-                        (lpg, co, smoke, timestamp)
-                    )
-
-                elif sensor == "bh1750":
-                    cur.execute(
-                        f"INSERT INTO {table} (lux, timestamp) VALUES (%s, %s)",
-                        (data.get("lux"), timestamp)
-                    )
-
-        print(f"[{sensor}] Data masuk → {data}")
 
-    except Exception as e:
-        print(f"[{sensor}] DB Error:", e)
+# Pemrosesan pesan dipisah dari thread network paho
+work_queue = WorkQueue(
+    handle_message,
+    maxsize=QUEUE_MAXSIZE,
+    workers=QUEUE_WORKERS,
+    overflow=QUEUE_OVERFLOW,
+    spill_path=QUEUE_SPILL_PATH
+)
 
 
 def on_message(client, userdata, message):
-    try:
-        payload = json.loads(message.payload.decode())
-
-        for sensor, topic in MQTT_TOPICS.items():
-            if sensor == "relay":
-                # Check match manually since it uses wildcard #
-                if message.topic.startswith("command/relay/"):
-                    try:
-                        # Parse relay ID from topic or payload
-                        relay_id = int(message.topic.split("/")[-1])
-                        state = payload.get("state", False)
-                        
-                        print(f"[RELAY] ID={relay_id} State={state}")
-                        
-                        # Sync to DB
-                        with psycopg2.connect(**DB_IOT) as conn:
-                            with conn.cursor() as cur:
-                                cur.execute("UPDATE status_relay SET is_active = %s WHERE id = %s", (state, relay_id))
-                                conn.commit()
-                                print(f"[RELAY] Saved to DB (status_relay).")
-                    except Exception as e:
-                        print(f"[RELAY] Sync Error: {e}")
-                continue
-
-            if message.topic == topic:
-                insert_data(sensor, payload)
-                break
+    """Callback paho: cukup antrikan pesan mentah supaya loop network tidak tertahan"""
+    work_queue.put(message.topic, message.payload)
 
-    except Exception as e:
-        print("Parse Error:", e)
+
+def report_stats():
+    """Cetak counter antrian dan writer secara berkala"""
+    while True:
+        time.sleep(STATS_INTERVAL)
+        print(f"[stats] queue={work_queue.stats()} writer={writer.stats()} alert={alert_engine.stats()}")
 
 
 
@@ -157,8 +142,12 @@ def on_connect(client, userdata, flags, rc, properties=None):
     """Callback saat berhasil konek ke broker"""
     if rc == 0:
         print("✔ Terhubung ke MQTT broker")
+        # Mode multi-proses: broker membagi pesan antar worker lewat shared subscription
+        share_group = (userdata or {}).get("share_group")
         # Subscribe ke semua topic saat connect/reconnect
-        for topic in MQTT_TOPICS.values():
+        for topic in SUBSCRIPTIONS:
+            if share_group:
+                topic = f"$share/{share_group}/{topic}"
             client.subscribe(topic)
             print(f"  → Subscribed: {topic}")
     else:
@@ -180,21 +169,18 @@ def on_disconnect(client, userdata, disconnect_flags, rc, properties=None):
         print(f"⚠ Disconnected dari broker (rc={rc}). Auto-reconnect aktif...")
 
 
-def main():
-    print("Cek database dulu...")
-
-    if not check_database_exists():
-        print("❌ Database 'iotdb' belum ada.")
-        print("   Jalankan 'python init_db.py' terlebih dahulu.")
-        sys.exit(1)
-
-    print("✔ Database ditemukan. Lanjut…")
-
-    # Load initial settings
-    load_settings()
-
+def run_listener(share_group=None):
+    """Jalankan satu client MQTT beserta work queue dan writer-nya"""
     # Setup MQTT client dengan reconnect otomatis
-    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+    if share_group:
+        # Shared subscription butuh MQTT 5
+        client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            protocol=mqtt.MQTTv5
+        )
+    else:
+        client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+    client.user_data_set({"share_group": share_group})
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
     client.on_message = on_message
@@ -202,6 +188,14 @@ def main():
     # Set reconnect delay (min 1 detik, max 120 detik dengan exponential backoff)
     client.reconnect_delay_set(min_delay=1, max_delay=120)
 
+    # Load initial settings (tiap proses worker memuat sendiri)
+    alert_engine.load_settings()
+    alert_engine.start()
+    writer.start()
+    work_queue.start()
+    if STATS_INTERVAL > 0:
+        threading.Thread(target=report_stats, name="stats", daemon=True).start()
+
     try:
         print(f"Menghubungkan ke {MQTT_BROKER}:{MQTT_PORT}...")
         client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
@@ -213,6 +207,43 @@ def main():
     except Exception as e:
         print(f"❌ Error koneksi MQTT: {e}")
         sys.exit(1)
+    finally:
+        work_queue.stop()
+        writer.stop()
+        alert_engine.stop()
+        close_pool()
+        print(f"[queue] Statistik: {work_queue.stats()}")
+        print(f"[writer] Statistik: {writer.stats()}")
+
+
+def _stop_worker(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_worker():
+    """Entry point proses worker (mode INGEST_PROCESSES > 1)"""
+    # SIGTERM dari supervisor diperlakukan seperti Ctrl+C supaya buffer sempat di-flush
+    signal.signal(signal.SIGTERM, _stop_worker)
+    run_listener(share_group=MQTT_SHARE_GROUP)
+
+
+def main():
+    print("Cek database dulu...")
+
+    if not check_database_exists():
+        print("❌ Database 'iotdb' belum ada.")
+        print("   Jalankan 'python init_db.py' terlebih dahulu.")
+        sys.exit(1)
+
+    print("✔ Database ditemukan. Lanjut…")
+
+    if INGEST_PROCESSES > 1:
+        # Koneksi parent tidak dibawa ke worker, masing-masing punya pool sendiri
+        close_pool()
+        print(f"Mode multi-proses: {INGEST_PROCESSES} worker, share group '{MQTT_SHARE_GROUP}'")
+        run_supervisor(INGEST_PROCESSES, run_worker)
+    else:
+        run_listener()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""
+Codec payload per sensor.
+
+- "json"    : default, format lama dari ESP32
+- "msgpack" : butuh paket msgpack
+- "cbor"    : butuh paket cbor2
+- "struct"  : layout biner tetap, di-decode dengan struct.Struct yang
+              sudah dikompilasi saat startup
+
+Semua codec menghasilkan dict dengan nama kolom DB. Jika payload gagal
+di-decode dengan codec yang dipilih, JSON dipakai sebagai fallback
+(device lama yang belum di-update firmware tetap terbaca).
+"""
+import json
+import struct
+from datetime import datetime, timedelta
+from config import SENSORS
+
+# Timestamp disimpan sebagai TIMESTAMP (UTC, tanpa zona waktu)
+_EPOCH = datetime(1970, 1, 1)
+
+# Layout biner little-endian: uint32 epoch detik (0 = pakai waktu server) + float32 per
+# nilai, urutan kolom mengikuti registry sensor
+STRUCT_LAYOUTS = {
+    sensor: ("<I" + "f" * len(spec["fields"]), tuple(spec["fields"]))
+    for sensor, spec in SENSORS.items()
+}
+
+
+def _json_decode(raw):
+    return json.loads(raw)
+
+
+def _struct_decoder(sensor):
+    fmt, fields = STRUCT_LAYOUTS[sensor]
+    unpack = struct.Struct(fmt).unpack
+    size = struct.calcsize(fmt)
+
+    def decode(raw):
+        if len(raw) != size:
+            raise ValueError(f"Panjang payload {len(raw)} != {size} byte untuk {sensor}")
+        epoch, *values = unpack(raw)
+        data = dict(zip(fields, values))
+        if epoch:
+            data["timestamp"] = _EPOCH + timedelta(seconds=epoch)
+        return data
+
+    return decode
+
+
+def _epoch_timestamp(decode):
+    """msgpack/cbor boleh mengirim timestamp sebagai epoch detik"""
+    def wrapped(raw):
+        data = decode(raw)
+        ts = data.get("timestamp") if isinstance(data, dict) else None
+        if isinstance(ts, (int, float)):
+            data["timestamp"] = _EPOCH + timedelta(seconds=ts)
+        return data
+    return wrapped
+
+
+def _msgpack_decoder():
+    import msgpack
+    return _epoch_timestamp(lambda raw: msgpack.unpackb(raw, raw=False))
+
+
+def _cbor_decoder():
+    import cbor2
+    return _epoch_timestamp(cbor2.loads)
+
+
+def _with_json_fallback(decode):
+    def wrapped(raw):
+        try:
+            data = decode(raw)
+            if isinstance(data, dict):
+                return data
+        except Exception:
+            pass
+        return json.loads(raw)
+    return wrapped
+
+
+def build_decoder(sensor, codec):
+    """Buat fungsi decode(raw: bytes) -> dict untuk sensor dengan codec tertentu"""
+    if codec == "json":
+        return _json_decode
+    if codec == "struct":
+        if sensor not in STRUCT_LAYOUTS:
+            raise ValueError(f"Tidak ada layout struct untuk sensor '{sensor}'")
+        return _with_json_fallback(_struct_decoder(sensor))
+    if codec == "msgpack":
+        return _with_json_fallback(_msgpack_decoder())
+    if codec == "cbor":
+        return _with_json_fallback(_cbor_decoder())
+    raise ValueError(f"Codec tidak dikenal: {codec}. Pilihan: json, msgpack, cbor, struct")
+
+
+def encode_struct(sensor, data, epoch=0):
+    """Encoder pasangan layout struct (dipakai benchmark dan simulator device)"""
+    fmt, fields = STRUCT_LAYOUTS[sensor]
+    return struct.pack(fmt, epoch, *(float(data.get(f) or 0) for f in fields))
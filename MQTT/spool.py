@@ -0,0 +1,222 @@
+"""
+Spool lokal append-only untuk batch yang gagal ditulis ke Postgres.
+
+Setiap batch disimpan sebagai satu record berformat:
+
+    [panjang payload: uint32][crc32 payload: uint32][payload JSON]
+
+di file segmen bernomor urut ({seq}.seg) dalam satu direktori. Segmen
+di-rotate saat melewati SPOOL_SEGMENT_BYTES. fsync dilakukan per
+jendela waktu (bukan per record). Thread replay mengirim ulang segmen
+tertutup ke database secara bulk dengan batas baris per detik, lalu
+menghapus segmen yang sudah selesai. Posisi replay dicatat di file
+{seq}.ack supaya record tidak dikirim dua kali setelah restart.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+_RECORD_HEADER = struct.Struct(">II")
+
+
+class Spool:
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, max_bytes=512 * 1024 * 1024,
+                 fsync_interval=0.2, replay_rows_per_sec=5000, retry_interval=5):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.replay_rows_per_sec = replay_rows_per_sec
+        self.retry_interval = retry_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_seq = None
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._stats = {
+            "records_spooled": 0,
+            "rows_spooled": 0,
+            "rows_replayed": 0,
+            "replay_errors": 0,
+            "segments_dropped": 0,
+            "bytes_dropped": 0,
+            "corrupt_records": 0,
+        }
+
+    # ---- Segmen ----
+
+    def _segments(self):
+        return sorted(int(f[:-4]) for f in os.listdir(self.directory) if f.endswith(".seg"))
+
+    def _path(self, seq, ext=".seg"):
+        return os.path.join(self.directory, f"{seq:010d}{ext}")
+
+    def _disk_usage(self):
+        return sum(os.path.getsize(self._path(seq)) for seq in self._segments())
+
+    def _close_active(self):
+        if self._active is not None:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._active.close()
+            self._active = None
+            self._active_seq = None
+            self._dirty = False
+
+    def _open_active(self):
+        segments = self._segments()
+        self._active_seq = (segments[-1] + 1) if segments else 1
+        self._active = open(self._path(self._active_seq), "ab")
+
+    def _enforce_limit(self, incoming):
+        """Buang segmen tertua bila pemakaian disk melewati batas"""
+        usage = self._disk_usage()
+        for seq in self._segments():
+            if usage + incoming <= self.max_bytes or seq == self._active_seq:
+                break
+            size = os.path.getsize(self._path(seq))
+            os.remove(self._path(seq))
+            if os.path.exists(self._path(seq, ".ack")):
+                os.remove(self._path(seq, ".ack"))
+            usage -= size
+            self._stats["segments_dropped"] += 1
+            self._stats["bytes_dropped"] += size
+            print(f"[spool] Batas disk tercapai, segmen {seq} dibuang ({size} bytes)")
+
+    # ---- Tulis ----
+
+    def append(self, table, columns, rows):
+        """Simpan satu batch yang gagal ditulis ke database"""
+        payload = json.dumps({"t": table, "c": list(columns), "r": rows}, default=str).encode()
+        record = _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            self._enforce_limit(len(record))
+            if self._active is None:
+                self._open_active()
+            self._active.write(record)
+            self._active.flush()
+            self._dirty = True
+            if self._active.tell() >= self.segment_bytes:
+                self._close_active()
+            elif time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+
+            self._stats["records_spooled"] += 1
+            self._stats["rows_spooled"] += len(rows)
+
+    def _fsync(self):
+        if self._active is not None and self._dirty:
+            os.fsync(self._active.fileno())
+            self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def pending(self):
+        """True jika masih ada data yang belum di-replay"""
+        return bool(self._segments())
+
+    # ---- Replay ----
+
+    def start(self, write_batch):
+        """Jalankan thread fsync + replay; write_batch(table, columns, rows) menulis ke DB"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, args=(write_batch,), name="spool-replay", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._close_active()
+
+    def _run(self, write_batch):
+        while not self._stop.is_set():
+            with self._lock:
+                self._fsync()
+            try:
+                replayed = self._replay_once(write_batch)
+            except Exception as e:
+                self._stats["replay_errors"] += 1
+                print(f"[spool] Replay gagal, coba lagi dalam {self.retry_interval}s:", e)
+                self._stop.wait(self.retry_interval)
+                continue
+            if not replayed:
+                self._stop.wait(self.fsync_interval)
+
+    def _read_records(self, seq, offset):
+        """Iterasi (offset_akhir, record) mulai dari offset; berhenti di record terpotong/rusak"""
+        with open(self._path(seq), "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return
+                length, crc = _RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    # Ekor segmen yang tertulis setengah saat proses mati
+                    self._stats["corrupt_records"] += 1
+                    return
+                yield f.tell(), json.loads(payload)
+
+    def _replay_once(self, write_batch):
+        with self._lock:
+            segments = [seq for seq in self._segments() if seq != self._active_seq]
+            if not segments and self._active is not None and self._active.tell() > 0:
+                # Tidak ada segmen tertutup: tutup segmen aktif supaya bisa di-replay
+                self._close_active()
+                segments = self._segments()
+        if not segments:
+            return False
+
+        seq = segments[0]
+        ack_path = self._path(seq, ".ack")
+        offset = 0
+        if os.path.exists(ack_path):
+            with open(ack_path) as f:
+                offset = int(f.read() or 0)
+
+        for end, record in self._read_records(seq, offset):
+            started = time.monotonic()
+            rows = [tuple(r) for r in record["r"]]
+            write_batch(record["t"], tuple(record["c"]), rows)
+            self._stats["rows_replayed"] += len(rows)
+            self._ack(ack_path, end)
+
+            # Batasi laju replay supaya DB yang baru pulih tidak langsung dibanjiri
+            if self.replay_rows_per_sec > 0:
+                budget = len(rows) / self.replay_rows_per_sec
+                remaining = budget - (time.monotonic() - started)
+                if remaining > 0 and self._stop.wait(remaining):
+                    return True
+
+        for path in (self._path(seq), ack_path):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"[spool] Segmen {seq} selesai di-replay")
+        return True
+
+    def _ack(self, ack_path, offset):
+        tmp = ack_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, ack_path)
+
+    def stats(self):
+        s = dict(self._stats)
+        s["segments"] = len(self._segments())
+        s["disk_bytes"] = self._disk_usage()
+        return s
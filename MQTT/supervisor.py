@@ -0,0 +1,78 @@
+"""
+Supervisor untuk mode ingest multi-proses.
+
+Menjalankan N proses worker (masing-masing punya client paho, work
+queue, writer dan pool DB sendiri) dan menyalakan ulang worker yang
+mati dengan backoff eksponensial. Pembagian pesan antar worker
+dilakukan broker lewat MQTT 5 shared subscription ($share/<group>/...).
+
+Ukur sebelum menaikkan INGEST_PROCESSES: benchmark.py run --mode broker
+--workers N. Worker tambahan hanya membantu jika ada core CPU bebas; pada
+mesin 1 core throughput justru turun (lebih banyak flush paralel ke DB).
+"""
+import multiprocessing
+import os
+import time
+
+# Backoff restart worker (detik)
+RESTART_MIN_DELAY = 1
+RESTART_MAX_DELAY = 60
+# Worker yang hidup selama ini dianggap stabil, backoff di-reset
+STABLE_AFTER = 60
+
+
+class _Slot:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started_at = 0
+        self.restarts = 0
+        self.next_start = 0
+
+
+def _start(ctx, slot, target):
+    # Proses spawn mewarisi environment saat start, config.py membaca ID ini
+    os.environ["INGEST_WORKER_ID"] = str(slot.index)
+    slot.process = ctx.Process(target=target, name=f"ingest-{slot.index}", daemon=False)
+    slot.process.start()
+    slot.started_at = time.monotonic()
+    print(f"[supervisor] Worker {slot.index} jalan (pid={slot.process.pid})")
+
+
+def run_supervisor(processes, target):
+    """Jalankan dan awasi `processes` worker yang mengeksekusi target()"""
+    # spawn: worker mulai bersih tanpa mewarisi socket/thread dari parent
+    ctx = multiprocessing.get_context("spawn")
+    slots = [_Slot(i) for i in range(processes)]
+    for slot in slots:
+        _start(ctx, slot, target)
+
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for slot in slots:
+                if slot.process is not None and slot.process.is_alive():
+                    continue
+
+                if slot.process is not None:
+                    code = slot.process.exitcode
+                    slot.process = None
+                    if now - slot.started_at >= STABLE_AFTER:
+                        slot.restarts = 0
+                    delay = min(RESTART_MIN_DELAY * 2 ** slot.restarts, RESTART_MAX_DELAY)
+                    slot.restarts += 1
+                    slot.next_start = now + delay
+                    print(f"[supervisor] Worker {slot.index} mati (exit={code}), restart dalam {delay}s")
+
+                if now >= slot.next_start:
+                    _start(ctx, slot, target)
+    except KeyboardInterrupt:
+        print("\n⏹ Menghentikan semua worker...")
+    finally:
+        for slot in slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.process.terminate()
+        for slot in slots:
+            if slot.process is not None:
+                slot.process.join(timeout=10)
@@ -0,0 +1,97 @@
+"""
+Uji zero-loss spool: matikan Postgres lokal di tengah stream lalu hidupkan lagi.
+
+Butuh Postgres lokal yang bisa dikontrol lewat pg_ctl:
+
+    PGDATA=/var/lib/postgresql/data python verify_spool.py
+
+Script menulis N baris bh1750 bertanda unik, menghentikan server
+(pg_ctl stop -m immediate) di tengah jalan, menyalakannya kembali,
+menunggu spool selesai di-replay, lalu memastikan semua baris ada.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from database import get_conn, close_pool
+from spool import Spool
+from writer import BatchWriter
+
+TOTAL_ROWS = int(os.getenv("VERIFY_ROWS", 5000))
+RATE = int(os.getenv("VERIFY_RATE", 1000))  # baris per detik
+PG_CTL = os.getenv("PG_CTL", "pg_ctl")
+PGDATA = os.getenv("PGDATA")
+
+
+def pg_ctl(action):
+    args = [PG_CTL, "-D", PGDATA, "-w", action]
+    if action == "stop":
+        args += ["-m", "immediate"]
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+    print(f"pg_ctl {action} OK")
+
+
+def count_rows(marker_start, marker_end):
+    with get_conn() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT COUNT(DISTINCT lux) FROM data_bh1750 WHERE lux >= %s AND lux < %s",
+                    (marker_start, marker_end)
+                )
+                return cur.fetchone()[0]
+
+
+def run_test():
+    if not PGDATA:
+        print("Set PGDATA ke data directory Postgres lokal terlebih dahulu.")
+        sys.exit(2)
+
+    spool_dir = tempfile.mkdtemp(prefix="spool_verify_")
+    writer = BatchWriter(
+        max_rows=200,
+        flush_interval=0.1,
+        spool=Spool(spool_dir, segment_bytes=64 * 1024, replay_rows_per_sec=2000, retry_interval=1),
+        retry_interval=1
+    ).start()
+
+    # Nilai lux dipakai sebagai penanda unik per baris
+    marker = -int(time.time()) * TOTAL_ROWS
+    base = datetime.now(timezone.utc) - timedelta(hours=1)
+
+    print(f"Menulis {TOTAL_ROWS} baris (~{RATE}/s), Postgres dimatikan di tengah jalan...")
+    for i in range(TOTAL_ROWS):
+        ts = (base + timedelta(milliseconds=i)).isoformat()
+        writer.add("data_bh1750", ("lux", "timestamp"), (marker + i, ts))
+        if i == TOTAL_ROWS // 3:
+            pg_ctl("stop")
+        if i == 2 * TOTAL_ROWS // 3:
+            pg_ctl("start")
+        time.sleep(1 / RATE)
+
+    writer.flush()
+    print("Menunggu spool kosong...")
+    deadline = time.monotonic() + 120
+    while writer.spool.pending() and time.monotonic() < deadline:
+        time.sleep(0.5)
+
+    writer.stop()
+    stats = writer.stats()
+    found = count_rows(marker, marker + TOTAL_ROWS)
+    close_pool()
+    shutil.rmtree(spool_dir, ignore_errors=True)
+
+    print(f"Statistik writer: {stats}")
+    print(f"Baris ditemukan: {found}/{TOTAL_ROWS}")
+    if found == TOTAL_ROWS:
+        print("SUCCESS: tidak ada data yang hilang.")
+    else:
+        print(f"FAIL: {TOTAL_ROWS - found} baris hilang.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,182 @@
+"""
+Antrian kerja terbatas antara thread network paho dan pemrosesan pesan.
+
+on_message hanya memasukkan pesan mentah ke antrian; decoding JSON dan
+penulisan database dikerjakan oleh pool worker thread. Saat antrian
+penuh, perilakunya ditentukan overflow policy:
+
+- "block"       : tunggu sampai ada slot; menahan loop network MQTT
+                  (keepalive/ack ikut tertahan), bukan untuk produksi
+- "drop_oldest" : buang pesan tertua supaya pesan baru tetap masuk
+- "spill"       : tulis pesan ke file spill, diproses lagi saat antrian lega
+"""
+import os
+import queue
+import struct
+import threading
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+# Header record spill: panjang topic (uint16) + panjang payload (uint32)
+_SPILL_HEADER = struct.Struct(">HI")
+
+
+class WorkQueue:
+    def __init__(self, handler, maxsize=10000, workers=4, overflow="spill", spill_path="spill/queue.bin"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Overflow policy tidak dikenal: {overflow}. Pilihan: {OVERFLOW_POLICIES}")
+
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.workers = workers
+        self.overflow = overflow
+        self.spill_path = spill_path
+
+        self._threads = []
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "errors": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "unspilled": 0,
+            "max_depth": 0,
+        }
+
+    def start(self):
+        """Jalankan worker thread"""
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        """Proses sisa antrian lalu hentikan semua worker"""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def put(self, topic, payload):
+        """Masukkan pesan mentah ke antrian (dipanggil dari thread paho)"""
+        item = (topic, payload)
+
+        if self.overflow == "block":
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                if self.overflow == "drop_oldest":
+                    self._drop_oldest_and_put(item)
+                else:
+                    self._spill(item)
+                    return
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+            if depth > self._stats["max_depth"]:
+                self._stats["max_depth"] = depth
+
+    def _drop_oldest_and_put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._count("dropped")
+                except queue.Empty:
+                    pass
+
+    def _spill(self, item):
+        self._write_spill(item)
+        self._count("spilled")
+
+    def _write_spill(self, item):
+        topic, payload = item
+        topic_b = topic.encode()
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "ab") as f:
+                f.write(_SPILL_HEADER.pack(len(topic_b), len(payload)))
+                f.write(topic_b)
+                f.write(payload)
+
+    def _unspill(self):
+        """Pindahkan isi file spill kembali ke antrian"""
+        # Cukup satu worker yang mengosongkan spill dalam satu waktu
+        if not self._drain_lock.acquire(blocking=False):
+            return
+        try:
+            self._drain_spill()
+        finally:
+            self._drain_lock.release()
+
+    def _drain_spill(self):
+        draining = self.spill_path + ".draining"
+        with self._spill_lock:
+            # Sisa drain yang terputus (mis. proses mati) diproses lebih dulu
+            if not os.path.exists(draining):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, draining)
+
+        with open(draining, "rb") as f:
+            while True:
+                header = f.read(_SPILL_HEADER.size)
+                if len(header) < _SPILL_HEADER.size:
+                    break
+                topic_len, payload_len = _SPILL_HEADER.unpack(header)
+                topic = f.read(topic_len).decode()
+                payload = f.read(payload_len)
+                try:
+                    self._queue.put_nowait((topic, payload))
+                    self._count("unspilled")
+                except queue.Full:
+                    # Antrian penuh lagi: kembalikan ke file spill
+                    self._write_spill((topic, payload))
+        os.remove(draining)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                if self.overflow == "spill":
+                    self._unspill()
+                continue
+
+            try:
+                self._handler(*item)
+                self._count("processed")
+            except Exception as e:
+                self._count("errors")
+                print("Worker Error:", e)
+            finally:
+                self._queue.task_done()
+
+            if self.overflow == "spill" and self._queue.empty():
+                self._unspill()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        """Counter antrian: kedalaman saat ini, pesan dibuang/di-spill"""
+        s = dict(self._stats)
+        s["depth"] = self._queue.qsize()
+        s["maxsize"] = self._queue.maxsize
+        s["overflow"] = self.overflow
+        return s
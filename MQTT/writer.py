@@ -0,0 +1,228 @@
+"""
+Batch writer untuk data sensor.
+
+Menampung baris per tabel lalu menulisnya sekaligus lewat prepared
+INSERT per tabel. Flush terjadi saat jumlah baris mencapai batas atau
+saat jendela waktu habis, mana yang duluan.
+
+Jika database tidak bisa dihubungi, batch dialihkan ke spool lokal
+(lihat spool.py) dan writer berhenti mencoba DB selama retry_interval
+supaya ingest tidak tertahan timeout koneksi.
+
+Insert bersifat idempotent (ON CONFLICT DO NOTHING pada kunci
+(device_id, timestamp)), jadi pesan yang dikirim ulang device tidak
+tercatat dua kali. Writer menghitung duplikat dan pembacaan yang datang
+terlambat/tidak berurutan untuk mengukur jendela retransmit.
+"""
+import threading
+import time
+from datetime import datetime
+import psycopg2
+from database import get_conn, execute_insert
+
+# Error yang disebabkan isi baris, bukan koneksi: baris diisolasi satu per satu
+_ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+
+class BatchWriter:
+    def __init__(self, max_rows=500, flush_interval=0.25, spool=None, retry_interval=5):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self._db_down_until = 0
+
+        # table -> {"columns": tuple, "rows": list}
+        self._buffers = {}
+        # (table, device_id) -> timestamp terbaru yang pernah diterima
+        self._high_water = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._stats = {
+            "flushes": 0,
+            "rows_written": 0,
+            "rows_rejected": 0,
+            "rows_spooled": 0,
+            "rows_duplicate": 0,
+            "rows_late": 0,
+            "max_late_s": 0.0,
+            "last_flush_rows": 0,
+            "max_flush_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def start(self):
+        """Jalankan thread flush di background"""
+        if self.spool is not None:
+            self.spool.start(self.write_batch)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Hentikan thread dan flush sisa buffer"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.spool is not None:
+            self.spool.stop()
+
+    def add(self, table, columns, row):
+        """Tambahkan satu baris ke buffer tabel"""
+        with self._lock:
+            buf = self._buffers.get(table)
+            if buf is None:
+                # Urutan kolom per tabel tetap, jadi cukup dicatat sekali
+                columns = tuple(columns)
+                buf = self._buffers[table] = {
+                    "columns": columns,
+                    "rows": [],
+                    "device_idx": columns.index("device_id") if "device_id" in columns else None,
+                    "ts_idx": columns.index("timestamp") if "timestamp" in columns else None,
+                }
+            buf["rows"].append(row)
+            if buf["ts_idx"] is not None:
+                self._track_order(table, row, buf["device_idx"], buf["ts_idx"])
+            self._pending += 1
+            if self._pending >= self.max_rows:
+                self._wakeup.set()
+
+    def _track_order(self, table, row, device_idx, ts_idx):
+        """Catat pembacaan yang lebih tua dari pembacaan terbaru device yang sama"""
+        ts = row[ts_idx]
+        if not isinstance(ts, datetime):
+            try:
+                ts = datetime.fromisoformat(str(ts))
+            except ValueError:
+                return
+        ts = ts.replace(tzinfo=None)
+        key = (table, row[device_idx] if device_idx is not None else None)
+        newest = self._high_water.get(key)
+        if newest is None or ts > newest:
+            self._high_water[key] = ts
+            return
+        late = (newest - ts).total_seconds()
+        if late > 0:
+            self._stats["rows_late"] += 1
+            self._stats["max_late_s"] = max(self._stats["max_late_s"], late)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _drain(self):
+        with self._lock:
+            # Urutan tabel tetap: worker paralel (mode multi-proses) mengunci baris
+            # rollup tabel-tabel ini dengan urutan yang sama, tanpa deadlock
+            batches = [
+                (table, buf["columns"], buf["rows"])
+                for table, buf in sorted(self._buffers.items())
+                if buf["rows"]
+            ]
+            for buf in self._buffers.values():
+                buf["rows"] = []
+            self._pending = 0
+        return batches
+
+    def flush(self):
+        """Tulis semua buffer ke database dalam satu transaksi"""
+        batches = self._drain()
+        if not batches:
+            return 0
+
+        total = sum(len(rows) for _, _, rows in batches)
+        if time.monotonic() < self._db_down_until:
+            self._to_spool(batches, total)
+            return 0
+
+        start = time.perf_counter()
+        try:
+            written = self._write(batches)
+        except Exception as e:
+            print(f"[writer] DB Error ({total} baris):", e)
+            self._db_down_until = time.monotonic() + self.retry_interval
+            self._to_spool(batches, total)
+            return 0
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self._record(written, elapsed)
+        print(f"[writer] Flush {written} baris → {', '.join(t for t, _, _ in batches)} ({elapsed:.1f} ms)")
+        return written
+
+    def write_batch(self, table, columns, rows):
+        """Tulis satu batch langsung ke DB (dipakai replay spool); raise jika gagal"""
+        self._write([(table, columns, rows)])
+
+    def _write(self, batches):
+        written = 0
+        with get_conn() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    for table, columns, rows in batches:
+                        cur.execute("SAVEPOINT batch")
+                        try:
+                            inserted = execute_insert(conn, cur, table, columns, rows)
+                            self._stats["rows_duplicate"] += len(rows) - inserted
+                            written += inserted
+                        except _ROW_ERRORS:
+                            # Satu baris rusak tidak boleh menggagalkan seluruh batch
+                            cur.execute("ROLLBACK TO SAVEPOINT batch")
+                            written += self._write_each(conn, cur, table, columns, rows)
+                        cur.execute("RELEASE SAVEPOINT batch")
+        return written
+
+    def _write_each(self, conn, cur, table, columns, rows):
+        written = 0
+        for row in rows:
+            cur.execute("SAVEPOINT row")
+            try:
+                inserted = execute_insert(conn, cur, table, columns, [row])
+                self._stats["rows_duplicate"] += 1 - inserted
+                written += inserted
+            except _ROW_ERRORS as e:
+                cur.execute("ROLLBACK TO SAVEPOINT row")
+                self._stats["rows_rejected"] += 1
+                print(f"[writer] Baris ditolak {table} {row}:", e)
+            cur.execute("RELEASE SAVEPOINT row")
+        return written
+
+    def _to_spool(self, batches, total):
+        if self.spool is None:
+            self._stats["rows_rejected"] += total
+            return
+        for table, columns, rows in batches:
+            self.spool.append(table, columns, rows)
+        self._stats["rows_spooled"] += total
+
+    def _record(self, rows, elapsed):
+        s = self._stats
+        s["flushes"] += 1
+        s["rows_written"] += rows
+        s["last_flush_rows"] = rows
+        s["max_flush_rows"] = max(s["max_flush_rows"], rows)
+        s["last_flush_ms"] = elapsed
+        s["max_flush_ms"] = max(s["max_flush_ms"], elapsed)
+        s["total_flush_ms"] += elapsed
+
+    def stats(self):
+        """Counter flush: baris per flush dan latensi flush"""
+        s = dict(self._stats)
+        flushes = s["flushes"] or 1
+        s["avg_flush_rows"] = s["rows_written"] / flushes
+        s["avg_flush_ms"] = s["total_flush_ms"] / flushes
+        s["pending_rows"] = self._pending
+        if self.spool is not None:
+            s["spool"] = self.spool.stats()
+        return s
@@ -0,0 +1 @@
+"""Modul bersama listener MQTT (MQTT/) dan API (API/)."""
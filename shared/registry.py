@@ -0,0 +1,234 @@
+"""
+Registry sensor.
+
+Semua pengetahuan tentang sensor (tabel, topic, kolom, alias field
+payload, unit, threshold default dan rule alert) dideklarasikan sekali
+di sensors.json di root repo; listener MQTT dan API membaca file yang
+sama. Menambah sensor cukup dengan menambah entri di file tersebut.
+
+Saat startup registry dikompilasi menjadi:
+- TopicRouter : lookup topic -> (sensor, device_id) lewat dict, biaya
+                tetap berapa pun jumlah sensornya
+- SensorPlan  : extractor field yang sudah dikompilasi + tabel dan
+                urutan kolom insert yang tetap per sensor
+- DDL tabel, tabel rollup dan rule alert
+"""
+import json
+import re
+from datetime import timedelta
+
+_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+# Level rollup: (suffix tabel, unit date_trunc, lebar bucket). Dipakai listener
+# (DDL, upsert) dan API (DDL di migrasi, backfill, pemilihan level query)
+ROLLUP_LEVELS = (
+    ("1m", "minute", timedelta(minutes=1)),
+    ("1h", "hour", timedelta(hours=1)),
+    ("1d", "day", timedelta(days=1)),
+)
+
+
+def load_registry(path):
+    """Baca dan validasi sensors.json"""
+    with open(path, encoding="utf-8") as f:
+        sensors = json.load(f)
+
+    for sensor, spec in sensors.items():
+        # Nama tabel/kolom masuk langsung ke SQL, jadi hanya identifier polos yang boleh
+        names = [spec.get("table", ""), *spec.get("fields", {})]
+        bad = [name for name in names if not _IDENTIFIER.match(name)]
+        if bad or not spec.get("fields"):
+            raise ValueError(f"Registry sensor '{sensor}' tidak valid (identifier: {bad or 'fields kosong'})")
+        for rule in spec.get("rules", []):
+            if rule[0] not in spec["fields"] or rule[2] not in ("max", "min"):
+                raise ValueError(f"Rule sensor '{sensor}' tidak valid: {rule}")
+    return sensors
+
+
+def table_ddl(table, fields):
+    """
+    DDL tabel data sensor. (device_id, timestamp) adalah natural key; BRIN
+    timestamp untuk query rentang waktu, btree timestamp untuk data terbaru.
+
+    Tabel dibuat sebagai tabel partisi RANGE (timestamp) dengan partisi
+    default; partisi per periode dan retensi dikelola API (API/partitions.py).
+    Tabel lama yang belum dipartisi dikonversi oleh migrasi API.
+    """
+    value_columns = ", ".join(fields)
+    columns = "".join(f"\n            {field} FLOAT," for field in fields)
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id SERIAL,
+            device_id TEXT NOT NULL DEFAULT 'default',{columns}
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (timestamp);
+        DO $$ BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = '{table}'::regclass) = 'p' THEN
+                CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT;
+            END IF;
+        END $$;
+        ALTER TABLE {table} ADD COLUMN IF NOT EXISTS device_id TEXT NOT NULL DEFAULT 'default';
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_device_ts
+            ON {table} (device_id, timestamp) INCLUDE ({value_columns});
+        CREATE INDEX IF NOT EXISTS brin_{table}_ts ON {table} USING brin (timestamp) WITH (pages_per_range = 32);
+        CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (timestamp);
+    """
+
+
+def rollup_ddl(table, fields):
+    """
+    DDL tabel rollup <tabel>_1m/_1h/_1d: per (device_id, bucket) jumlah
+    sampel, timestamp pertama/terakhir, dan per field count/sum/sumsq/min/max
+    (count per field karena field bisa NULL). Dipakai /history dan /stats.
+    """
+    columns = "".join(
+        f"\n            {f}_count BIGINT NOT NULL DEFAULT 0, {f}_sum FLOAT, {f}_sumsq FLOAT, {f}_min FLOAT, {f}_max FLOAT,"
+        for f in fields
+    )
+    return "".join(f"""
+        CREATE TABLE IF NOT EXISTS {table}_{suffix} (
+            device_id TEXT NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            samples BIGINT NOT NULL,
+            first_ts TIMESTAMP NOT NULL,
+            last_ts TIMESTAMP NOT NULL,{columns}
+            PRIMARY KEY (device_id, bucket)
+        );
+        CREATE INDEX IF NOT EXISTS idx_{table}_{suffix}_bucket ON {table}_{suffix} (bucket);
+    """ for suffix, _, _ in ROLLUP_LEVELS)
+
+
+def rollup_upsert(table, fields, source):
+    """
+    Statement per level yang menambahkan baris `source` (mis. CTE hasil
+    INSERT ... RETURNING) ke tabel rollup. Bucket diurutkan supaya writer
+    paralel mengunci baris rollup dengan urutan yang sama (tanpa deadlock).
+    """
+    select = ", ".join(f"COUNT({f}), SUM({f}), SUM({f} * {f}), MIN({f}), MAX({f})" for f in fields)
+    columns = ", ".join(f"{f}_count, {f}_sum, {f}_sumsq, {f}_min, {f}_max" for f in fields)
+    merge = "".join(
+        f""",
+                {f}_count = r.{f}_count + EXCLUDED.{f}_count,
+                {f}_sum = COALESCE(r.{f}_sum + EXCLUDED.{f}_sum, r.{f}_sum, EXCLUDED.{f}_sum),
+                {f}_sumsq = COALESCE(r.{f}_sumsq + EXCLUDED.{f}_sumsq, r.{f}_sumsq, EXCLUDED.{f}_sumsq),
+                {f}_min = LEAST(r.{f}_min, EXCLUDED.{f}_min),
+                {f}_max = GREATEST(r.{f}_max, EXCLUDED.{f}_max)"""
+        for f in fields
+    )
+    return [f"""
+            INSERT INTO {table}_{suffix} AS r (device_id, bucket, samples, first_ts, last_ts, {columns})
+            SELECT device_id, date_trunc('{unit}', timestamp), COUNT(*), MIN(timestamp), MAX(timestamp), {select}
+            FROM {source}
+            WHERE timestamp IS NOT NULL
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+            ON CONFLICT (device_id, bucket) DO UPDATE SET
+                samples = r.samples + EXCLUDED.samples,
+                first_ts = LEAST(r.first_ts, EXCLUDED.first_ts),
+                last_ts = GREATEST(r.last_ts, EXCLUDED.last_ts){merge}
+        """ for suffix, unit, _ in ROLLUP_LEVELS]
+
+
+def alert_rules(sensors):
+    """sensor -> [(metric, threshold key, arah, level, label, unit)]"""
+    rules = {}
+    for sensor, spec in sensors.items():
+        for metric, key, direction, level, *label in spec.get("rules", []):
+            field = spec["fields"][metric]
+            label = label[0] if label else field.get("label", metric)
+            rules.setdefault(sensor, []).append((metric, key, direction, level, label, field.get("unit", "")))
+    return rules
+
+
+def build_extractor(fields):
+    """
+    Extractor nilai kolom dari payload: alias dicoba berurutan, nilai
+    pertama yang tidak None dipakai. Nama kolom DB selalu ikut jadi alias
+    terakhir (codec biner sudah menghasilkan nama kolom).
+    """
+    probes = []
+    for name, spec in fields.items():
+        aliases = tuple(spec.get("aliases") or ())
+        if name not in aliases:
+            aliases += (name,)
+        probes.append(aliases)
+    probes = tuple(probes)
+
+    def extract(data):
+        get = data.get
+        values = []
+        for aliases in probes:
+            value = None
+            for alias in aliases:
+                value = get(alias)
+                if value is not None:
+                    break
+            values.append(value)
+        return values
+
+    return extract
+
+
+class SensorPlan:
+    """Rencana ingest satu sensor: decode -> extract -> insert dengan kolom tetap"""
+
+    __slots__ = ("sensor", "table", "fields", "columns", "extract", "decode")
+
+    def __init__(self, sensor, spec, decode):
+        self.sensor = sensor
+        self.table = spec["table"]
+        self.fields = tuple(spec["fields"])
+        self.columns = ("device_id", *self.fields, "timestamp")
+        self.extract = build_extractor(spec["fields"])
+        self.decode = decode
+
+
+class TopicRouter:
+    """
+    Pemetaan topic -> (sensor, device_id).
+
+    Topic tanpa wildcard dicari langsung di dict. Pola dengan satu level
+    "+" (berisi device_id) dikelompokkan per bentuk (jumlah level, posisi
+    "+"); kunci dict-nya adalah level lain selain device_id. Jumlah bentuk
+    ditentukan format topic, bukan jumlah sensor.
+    """
+
+    def __init__(self, topics, default_device_id):
+        self.default_device_id = default_device_id
+        self._exact = {}
+        # jumlah level -> [(posisi "+", {level tanpa device_id: sensor})]
+        self._shapes = {}
+
+        for sensor, patterns in topics.items():
+            for pattern in patterns.split(","):
+                pattern = pattern.strip()
+                if not pattern:
+                    continue
+                levels = pattern.split("/")
+                wildcards = [i for i, level in enumerate(levels) if level in ("+", "#")]
+                if not wildcards:
+                    self._exact[pattern] = (sensor, default_device_id)
+                    continue
+                if len(wildcards) > 1 or levels[wildcards[0]] != "+":
+                    raise ValueError(f"Topic sensor '{pattern}': hanya satu level '+' (device_id) yang didukung")
+                device_level = wildcards[0]
+                shapes = self._shapes.setdefault(len(levels), [])
+                for index, table in shapes:
+                    if index == device_level:
+                        break
+                else:
+                    table = {}
+                    shapes.append((device_level, table))
+                table[tuple(levels[:device_level] + levels[device_level + 1:])] = sensor
+
+    def match(self, topic):
+        """(sensor, device_id) dari topic, (None, None) jika tidak cocok"""
+        hit = self._exact.get(topic)
+        if hit is not None:
+            return hit
+        levels = topic.split("/")
+        for device_level, table in self._shapes.get(len(levels), ()):
+            sensor = table.get(tuple(levels[:device_level] + levels[device_level + 1:]))
+            if sensor is not None:
+                return sensor, levels[device_level]
+        return None, None
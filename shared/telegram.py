@@ -0,0 +1,195 @@
+"""
+Dispatcher notifikasi Telegram, dipakai API (notifier.py) dan alert
+listener MQTT (alerts.py). Parameter diberikan oleh pemanggil dari
+config masing-masing; pada mode multi-proses listener tiap worker punya
+dispatcher sendiri, jadi limit per chat berlaku per worker.
+
+Satu thread pengirim dengan requests.Session keep-alive dan antrian
+terbatas. Tiap chat punya token bucket sesuai limit Telegram; pesan
+yang menumpuk selama menunggu token digabung jadi satu pesan digest.
+Error jaringan, 5xx dan 429 dicoba ulang dengan backoff (429 memakai
+retry_after dari Telegram).
+"""
+import collections
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Batas panjang pesan Telegram
+MAX_MESSAGE_CHARS = 4096
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self):
+        """Detik sampai satu token tersedia (0 jika sudah ada)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class TelegramDispatcher:
+    def __init__(self, api_url="https://api.telegram.org", queue_size=1000, rate_per_sec=1,
+                 burst=3, max_retries=4, backoff_base=1):
+        self.api_url = api_url.rstrip("/")
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        # (token, chat_id) -> deque[(text, enqueued_at)]
+        self._pending = collections.OrderedDict()
+        self._buckets = {}
+        self._session = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._latencies = collections.deque(maxlen=1000)
+        self._stats = {
+            "queued": 0,
+            "dropped": 0,
+            "delivered": 0,
+            "requests": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failed": 0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._session = requests.Session()
+            self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+            self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="telegram-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def submit(self, token, chat_id, text):
+        """Masukkan pesan ke antrian; False jika antrian penuh"""
+        try:
+            self._queue.put_nowait((token, str(chat_id), text, time.monotonic()))
+        except queue.Full:
+            self._stats["dropped"] += 1
+            return False
+        self._stats["queued"] += 1
+        return True
+
+    # ---- Loop pengirim ----
+
+    def _collect(self, timeout):
+        """Pindahkan isi antrian ke pending per chat"""
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while item is not None:
+            token, chat_id, text, enqueued = item
+            self._pending.setdefault((token, chat_id), collections.deque()).append((text, enqueued))
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                item = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = 1.0
+            for chat in list(self._pending):
+                bucket = self._buckets.setdefault(chat, TokenBucket(self.rate_per_sec, self.burst))
+                delay = bucket.wait_time()
+                if delay > 0:
+                    wait = min(wait, delay)
+                    continue
+                bucket.take()
+                self._deliver(chat)
+                wait = 0
+            self._collect(wait if self._pending else 1.0)
+
+    def _digest(self, chat):
+        """Ambil pesan pending sebanyak muat dalam satu pesan Telegram"""
+        items = self._pending[chat]
+        batch = [items.popleft()]
+        size = len(batch[0][0])
+        while items and size + len(items[0][0]) + 2 <= MAX_MESSAGE_CHARS - 40:
+            text, enqueued = items.popleft()
+            batch.append((text, enqueued))
+            size += len(text) + 2
+        if not items:
+            del self._pending[chat]
+
+        if len(batch) == 1:
+            return batch[0][0][:MAX_MESSAGE_CHARS], batch
+        self._stats["coalesced"] += len(batch) - 1
+        body = "\n\n".join(text for text, _ in batch)
+        return f"🔔 *{len(batch)} notifikasi*\n\n{body}"[:MAX_MESSAGE_CHARS], batch
+
+    def _deliver(self, chat):
+        token, chat_id = chat
+        text, batch = self._digest(chat)
+        url = f"{self.api_url}/bot{token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._stats["retries"] += 1
+            retry_after = None
+            try:
+                self._stats["requests"] += 1
+                resp = self._session.post(url, json=payload, timeout=5)
+                if resp.status_code == 200:
+                    now = time.monotonic()
+                    self._latencies.extend(now - enqueued for _, enqueued in batch)
+                    self._stats["delivered"] += len(batch)
+                    return True
+                if resp.status_code == 429:
+                    retry_after = (resp.json().get("parameters") or {}).get("retry_after")
+                elif resp.status_code < 500:
+                    # 4xx selain 429 (token/chat salah) tidak akan berhasil diulang
+                    print(f"Telegram Error {resp.status_code}: {resp.text[:200]}")
+                    break
+            except requests.RequestException as e:
+                print(f"Telegram Error: {e}")
+
+            if attempt == self.max_retries:
+                break
+            delay = retry_after or self.backoff_base * 2 ** attempt
+            if self._stop.wait(delay):
+                break
+
+        self._stats["failed"] += len(batch)
+        return False
+
+    def stats(self):
+        """Metrik dispatcher: kedalaman antrian, latensi pengiriman, counter"""
+        s = dict(self._stats)
+        s["queue_depth"] = self._queue.qsize() + sum(len(items) for items in list(self._pending.values()))
+        latencies = sorted(self._latencies)
+        if latencies:
+            s["latency_avg_ms"] = round(sum(latencies) / len(latencies) * 1000, 1)
+            s["latency_p95_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1)
+            s["latency_max_ms"] = round(latencies[-1] * 1000, 1)
+        return s
+